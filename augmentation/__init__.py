@@ -3,4 +3,12 @@ from augmentation.nose import resize_nose, create_nose_mask, multiply_nose_mask
 from augmentation.eyes import resize_eyes, create_eye_mask, multiply_eye_mask
 from augmentation.make_image import make_img, check_inputs, prepare_masks, calculate_reductions, make_eye_img, make_face_img
 from augmentation.resize_overlay import resize_and_overlay_feature
-from augmentation.augment import augment_image, augment_nose, augment_eyes
\ No newline at end of file
+from augmentation.mask import TileMask
+from augmentation.blend import blend, mask_weights
+from augmentation.warp import build_warp_maps, warp_image
+from augmentation.cache import MapCache
+from augmentation.stages import StageCache
+from augmentation.memory import MemoryReport, PeakMemory
+from augmentation.augment import augment_image, augment_nose, augment_eyes, augment_features, augment_image_file, augment_array, AugmentParams
+from augmentation.batch import augment_batch
+from augmentation.pipeline import stream_augment
@@ -14,39 +14,46 @@ sys.path.append(parent_directory)
 from augmentation.nose import resize_nose, create_nose_mask
 from augmentation.mouth import resize_mouth, create_mouth_mask
 from augmentation.eyes import create_eye_mask
-from landmarking.load import load_feature_landmarks
-from landmarking.landmark_math import std_dev_features, avg_feature_sizes, global_avg_sizes
+from landmarking.load import load_feature_landmarks, get_landmark_index
+from landmarking.store import load_landmark_store
+from landmarking.feature_stats import load_feature_statistics, image_stats_key
+from landmarking.landmark_math import REGION_NAMES, REGION_BOUNDS, feature_size_table
 from utils.file_utils import get_dir
 from utils.img_utils import multi_res_blend, poisson_blend
-from augmentation.make_image import make_img
-
-def get_std_dev_feature(image_id):
-    features = np.load(get_dir("data/facial_features.npy"))
-    global_avgs = global_avg_sizes(features)
-    std_devs = std_dev_features(features, global_avgs)
-
-    for img_id in np.unique(features[:, 0]):
-        nose_std, mouth_std, eye_std, nose_avg, mouth_avg, eye_avg = 0, 0, 0, 0, 0, 0
-        if img_id == image_id:
-            img_feature_sizes = avg_feature_sizes(features, img_id)
-            print(f"Image ID {img_id}:")
-            for region, size in img_feature_sizes.items():
-                if region == 'nose':
-                    nose_avg = size
-                    nose_std = std_devs[region]
-                if region == 'lips':
-                    mouth_avg = size
-                    mouth_std = std_devs[region]
-                if region == 'eyes':
-                    eye_avg = size
-                    eye_std = std_devs[region]
-            return nose_std, mouth_std, eye_std, nose_avg, mouth_avg, eye_avg
+from augmentation.make_image import make_img, calculate_reductions, stage_affines
+from augmentation.roi import face_roi, normalize_in_place, MASK_BLUR_MARGIN, PASTE_ROWS
+from augmentation.blend import blend
+from augmentation.warp import build_warp_maps, warp_image
+from augmentation.cache import MapCache, cached, CACHE_DIRECTORY
+from augmentation.stages import update_eye_result, eye_sources, eye_part
+from augmentation.mask import TileMask
+from augmentation.memory import MemoryReport, PeakMemory, MIN_BAND_ROWS, full_frame_bytes, face_roi_bytes, tiled_bytes
+
+# Map facial features to integers
+FEATURE_TO_INT = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
+# Long side of the proxy image augment_preview renders on
+PREVIEW_MAX_SIDE = 1024
+# Mask levels the blurred masks may be off from cv2.GaussianBlur, lets the large blurs run at reduced size (see smooth)
+MASK_BLUR_TOLERANCE = 3
+
+def get_std_dev_feature(image_id, stats=None, image_key=None):
+    # Returns the dataset wide standard deviation and this image's average size of the nose, mouth and eyes.
+    # The statistics are precomputed (see landmarking/feature_stats.py), pass them in to avoid reloading per image.
+    if stats is None:
+        stats = load_feature_statistics()
+    if image_key is None:
+        image_key = image_stats_key(load_landmark_store(), image_id)
+    img_feature_sizes = stats.image_sizes(image_key)
+    std_devs = stats.std_devs
+    nose, mouth, eyes = REGION_NAMES.index('nose'), REGION_NAMES.index('lips'), REGION_NAMES.index('eyes')
+    return std_devs[nose], std_devs[mouth], std_devs[eyes], img_feature_sizes[nose], img_feature_sizes[mouth], img_feature_sizes[eyes]
 
 
 # Function to augment the nose of the image
-def augment_nose(img_path, facial_features, image_id, feature_to_int, nose_scale_factor):
-    # Read the image
-    img = cv2.imread(img_path)
+def augment_nose(img_path, facial_features, image_id, feature_to_int, nose_scale_factor, img=None):
+    # Read the image, unless it is passed in (e.g. a face crop)
+    if img is None:
+        img = cv2.imread(img_path)
     # Make a copy of the original image
     original_img = img.copy()
     # Resize the nose in the image
@@ -55,11 +62,11 @@ def augment_nose(img_path, facial_features, image_id, feature_to_int, nose_scale
     nose_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'nose')
     # Create a mask for the nose
     nose_mask = create_nose_mask(original_img, nose_landmarks, width_margin_factor=0.4, height_margin_factor=0.1)
-    # Blur the nose mask
-    nose_mask_blurred = cv2.GaussianBlur(nose_mask, (0, 0), 21)
-    # Blend the original image and the image with the resized nose
-    original_img = img * (nose_mask_blurred / 255) + original_img * (1 - (nose_mask_blurred / 255))
-    img = img * (nose_mask_blurred / 255) + original_img * (1 - (nose_mask_blurred / 255))
+    # Blur the nose mask, on its tile only and within MASK_BLUR_TOLERANCE
+    nose_mask_blurred = nose_mask.blur(0, 21, MASK_BLUR_TOLERANCE)
+    # Blend the original image and the image with the resized nose, in place
+    original_img = blend(img, original_img, nose_mask_blurred, out=original_img)
+    img = blend(img, original_img, nose_mask_blurred, out=img)
     return img, original_img
 
 # Function to augment the mouth of the image
@@ -71,14 +78,22 @@ def augment_mouth(img, original_img, facial_features, image_id, feature_to_int,
     mouth_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'lips')
     # Create a mask for the mouth
     mouth_mask = create_mouth_mask(original_img, mouth_landmarks, width_margin_factor=0.1, height_margin_factor=0.1)
-    # Blur the mouth mask
-    mouth_mask_blurred = cv2.GaussianBlur(mouth_mask, (0, 0), 21)
+    # Blur the mouth mask, on its tile only and within MASK_BLUR_TOLERANCE
+    mouth_mask_blurred = mouth_mask.blur(0, 21, MASK_BLUR_TOLERANCE)
     # Blend the original image and the image with the resized mouth
-    img = mouth_img * (mouth_mask_blurred / 255) + original_img * (1 - (mouth_mask_blurred / 255))
+    img = blend(mouth_img, original_img, mouth_mask_blurred, out=mouth_img)
     return img
 
-# Function to augment the eyes of the image
-def augment_eyes(img, facial_features, image_id, feature_to_int):
+# Function to exaggerate the nose and mouth of the image in one remap pass
+def augment_features(img, facial_features, image_id, feature_to_int, nose_scale_factor, mouth_scale_factor, cache=None):
+    # Build one displacement field for both features (or take it from cache), then resample the image once
+    scale_factors = {'nose': nose_scale_factor, 'lips': mouth_scale_factor}
+    maps = cached(cache, 'warp', (get_landmark_index(facial_features).image_rows(image_id), img.shape[:2], scale_factors, feature_to_int),
+                  lambda: build_warp_maps(img.shape, facial_features, image_id, feature_to_int, scale_factors))
+    return warp_image(img, maps)
+
+# Function to build the blurred eye masks of the image
+def eye_masks(img, facial_features, image_id, feature_to_int):
     # Load the eye, eyebrow, face, and nose landmarks
     eye_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'eyes')
     eyebrow_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'eyebrows')
@@ -144,64 +159,379 @@ def augment_eyes(img, facial_features, image_id, feature_to_int):
     blur = (3*int(left_eye_expansion[0, 0]))
     if not(blur % 2):
         blur = blur + 1
-    reduced_eyes_mask = cv2.GaussianBlur(reduced_eyes_mask, (blur, blur), 99)
-    blurred_eyes_mask = cv2.GaussianBlur(blurred_eyes_mask, (99, 99), 32)
+    reduced_eyes_mask = reduced_eyes_mask.blur(blur, 99, MASK_BLUR_TOLERANCE)
+    blurred_eyes_mask = blurred_eyes_mask.blur(99, 32, MASK_BLUR_TOLERANCE)
+
+    return reduced_eyes_mask, blurred_eyes_mask
+
+# Function to get the eye masks of the image, from cache when possible
+def cached_eye_masks(img, facial_features, image_id, feature_to_int, cache=None):
+    # The masks only depend on the landmarks and the image size, so they can come from cache, stored as tile and header arrays
+    arrays = cached(cache, 'eye_masks', (get_landmark_index(facial_features).image_rows(image_id), img.shape, feature_to_int),
+                    lambda: sum((mask.to_arrays() for mask in eye_masks(img, facial_features, image_id, feature_to_int)), ()))
+    return TileMask.from_arrays(*arrays[:2]), TileMask.from_arrays(*arrays[2:])
+
+# Function to put the eye masks into the image, the result is not normalised yet
+def eye_result(img, facial_features, image_id, feature_to_int, roi=None, cache=None):
+    eyebrow_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'eyebrows')
+    face_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'jawline')
+    reduced_eyes_mask, blurred_eyes_mask = cached_eye_masks(img, facial_features, image_id, feature_to_int, cache)
 
     # Put masks into image
-    result = make_img(img, blurred_eyes_mask, face_landmarks, eyebrow_landmarks, img, "blurred_eyes_mask")
-    result = make_img(img, reduced_eyes_mask, face_landmarks, eyebrow_landmarks, result, "reduced_eyes_mask")
-    result = cv2.normalize(result, dst=None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    result = make_img(img, blurred_eyes_mask, face_landmarks, eyebrow_landmarks, img, "blurred_eyes_mask", roi)
+    return make_img(img, reduced_eyes_mask, face_landmarks, eyebrow_landmarks, result, "reduced_eyes_mask", roi)
 
+# Function to min-max normalise the result of the eye stage, with roi the full photo is returned
+def normalize_result(result, roi=None):
+    if roi is not None:
+        return roi.paste_normalized(result)
+    return cv2.normalize(result, dst=None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+# Function to augment the eyes of the image
+def augment_eyes(img, facial_features, image_id, feature_to_int, roi=None, cache=None):
+    # With roi, img is the face crop of roi.frame and the full augmented photo is returned
+    return normalize_result(eye_result(img, facial_features, image_id, feature_to_int, roi, cache), roi)
+
+# Function to keep a scale factor in the range that still looks natural
+def clamp_scale_factor(scale_factor):
+    if scale_factor < 1:  # not prominent feature
+        return 1.2
+    elif scale_factor > 1.25:  # prominent feature
+        return 1.25
+    return scale_factor
+
+# Function to work out how much to exaggerate the nose and mouth of an image
+def feature_scale_factors(image_id, landmark_store, feature_stats):
+    nose_scale, mouth_scale, eyes_scale, nose_avg, mouth_avg, eye_avg = get_std_dev_feature(image_id, feature_stats, image_stats_key(landmark_store, image_id))
+    nose_scale_factor = 1 + nose_avg/nose_scale
+    mouth_scale_factor = 1 + mouth_avg/mouth_scale
+    return clamp_scale_factor(nose_scale_factor), clamp_scale_factor(mouth_scale_factor)
+
+
+class AugmentParams:
+    '''
+    Settings of augment_array: how much to exaggerate the nose and mouth, and which stage implementations
+    to use (use_face_roi runs the stages on a crop around the face, use_warp exaggerates the nose and
+    mouth with one remap instead of resizing and blending each feature).
+    memory_budget (bytes, None for no limit) caps the memory the render allocates on top of the input
+    image, the result included; see plan_render for how a render is fitted into it.
+    '''
+
+    def __init__(self, nose_scale_factor=1.2, mouth_scale_factor=1.2, use_face_roi=True, use_warp=True, memory_budget=None):
+        self.nose_scale_factor = nose_scale_factor
+        self.mouth_scale_factor = mouth_scale_factor
+        self.use_face_roi = use_face_roi
+        self.use_warp = use_warp
+        self.memory_budget = memory_budget
+
+    @classmethod
+    def from_statistics(cls, landmarks, feature_stats, **kwargs):
+        '''
+        Scale factors for a face that need not be in the dataset: its feature sizes are measured from
+        landmarks and compared with the dataset wide standard deviations of feature_stats, as
+        augment_image_file does for the images of the landmark store.
+        '''
+        sizes = feature_size_table(landmark_rows(landmarks))[1][0]
+        std_devs = feature_stats.std_devs
+        nose, mouth = REGION_NAMES.index('nose'), REGION_NAMES.index('lips')
+        return cls(clamp_scale_factor(1 + sizes[nose]/std_devs[nose]), clamp_scale_factor(1 + sizes[mouth]/std_devs[mouth]), **kwargs)
+
+
+# Function to turn landmarks into the 5 column rows (image id, feature, index, x, y) the stages take
+def landmark_rows(landmarks, image_id=0):
+    landmarks = np.asarray(landmarks)
+    if landmarks.ndim == 2 and landmarks.shape == (REGION_BOUNDS[-1], 2):
+        # 68 (x, y) points in dlib order, as predictor() returns them
+        index = np.arange(REGION_BOUNDS[-1])
+        feature = np.searchsorted(REGION_BOUNDS[1:], index, side='right')
+        return np.column_stack([np.full(len(index), image_id), feature, index, np.rint(landmarks)]).astype(np.int64)
+    if landmarks.ndim == 2 and landmarks.shape[1] == 5 and len(landmarks):
+        if np.any(landmarks[:, 0] != landmarks[0, 0]):
+            raise ValueError("Landmark rows must all belong to one image.")
+        return landmarks.astype(np.int64)
+    raise ValueError("Landmarks must be 68 (x, y) points or 5 column landmark rows of one image.")
+
+# Function to augment a decoded image in memory
+def augment_array(img, landmarks, params=None, cache=None, stage_cache=None, memory_report=None):
+    '''
+    Augments img, a decoded BGR uint8 image, and returns the augmented image; nothing is read from or written
+    to disk and img itself is left unchanged.
+    landmarks are the 68 (x, y) points of the face or its 5 column landmark rows, params an AugmentParams
+    (default: AugmentParams()) and cache an optional MapCache for the warp grids and masks.
+    Pass a StageCache as stage_cache when the same image is rendered again with other parameters, e.g. while
+    tuning: every stage output is then memoized and only the stages whose inputs changed are rerun.
+    With params.memory_budget the render is planned to fit it (see plan_render), with a stage_cache too: a
+    render that only fits in bands is then not memoized. Pass a MemoryReport as memory_report to get the plan,
+    and with its measure_peak the measured peak memory of the render; a MemoryError is raised when that peak
+    still goes over params.memory_budget.
+    '''
+    if not isinstance(img, np.ndarray) or img.dtype != np.uint8 or img.ndim != 3 or img.shape[2] != 3:
+        raise ValueError("img must be a BGR uint8 image of shape (height, width, 3).")
+    params = params or AugmentParams()
+    facial_features = landmark_rows(landmarks)
+    image_id = int(facial_features[0, 0])
+    if stage_cache is not None:
+        run = lambda: augment_stages(img, facial_features, image_id, params, stage_cache, cache, memory_report)
+    else:
+        run = lambda: render(img, facial_features, image_id, params, cache, memory_report)
+    if memory_report is None or not memory_report.measure_peak:
+        return run()
+    with PeakMemory() as peak:
+        result = run()
+    memory_report.peak_bytes = peak.peak
+    if params.memory_budget is not None and peak.peak > params.memory_budget:
+        # The plan's estimate fell short, fail the image rather than report a render over budget as fitting
+        raise MemoryError(f"Rendering took {peak.peak / 2**20:.0f} MB, over the memory budget of {params.memory_budget / 2**20:.0f} MB "
+                          f"(estimated {memory_report.estimated_bytes / 2**20:.0f} MB).")
     return result
 
+# Function to run the stages of augment_array the way plan_render chooses
+def render(img, facial_features, image_id, params, cache=None, memory_report=None):
+    roi = face_roi(img, facial_features, image_id, FEATURE_TO_INT) if params.use_face_roi or params.memory_budget is not None else None
+    plan = plan_render(img, facial_features, image_id, params, roi)
+    if memory_report is not None:
+        memory_report.record_plan(plan)
+    if plan.mode == 'tiled':
+        return augment_tiles(img, facial_features, image_id, params, roi, plan.band_rows)
+    # Every stage only changes the face, so run them on a padded crop around it unless the full frame fits
+    if plan.mode == 'face roi':
+        img, facial_features = roi.crop(), roi.crop_features(facial_features)
+    else:
+        roi = None
+    if params.use_warp:
+        # Exaggerate the nose and mouth with one warp
+        img = augment_features(img, facial_features, image_id, FEATURE_TO_INT, params.nose_scale_factor, params.mouth_scale_factor, cache)
+    else:
+        # Augment the nose of the image, then the mouth, by resizing and blending each feature
+        img, original_img = augment_nose(None, facial_features, image_id, FEATURE_TO_INT, params.nose_scale_factor, img if roi is not None else img.copy())
+        img = augment_mouth(img, original_img, facial_features, image_id, FEATURE_TO_INT, params.mouth_scale_factor)
+    # Augment the eyes of the image, with a face crop this pastes the result back into the photo
+    return augment_eyes(img, facial_features, image_id, FEATURE_TO_INT, roi, cache)
+
+# Function to choose how to render an image within params.memory_budget
+def plan_render(img, facial_features, image_id, params, roi=None):
+    '''
+    Returns the MemoryReport (without the measured peak) of the cheapest way of rendering img that is no less
+    faithful than params asks for and whose estimated memory fits params.memory_budget: the full frame when
+    use_face_roi is False, else (or when the full frame does not fit) the face crop roi, else the face crop in
+    bands of rows as large as fit (augment_tiles). Raises ValueError when not even bands of MIN_BAND_ROWS rows
+    fit. The estimates are upper bounds of the measured peak (see memory.py), so a plan that fits keeps the
+    render within the budget.
+    '''
+    budget = params.memory_budget
+    face_pixels = padded_face_pixels(facial_features, image_id)
+    if roi is None or not params.use_face_roi:
+        estimate = full_frame_bytes(img.shape, face_pixels, params.use_warp)
+        if budget is None or estimate <= budget or roi is None:
+            if budget is not None and estimate > budget:
+                raise ValueError(f"A memory budget of {budget / 2**20:.0f} MB is too small for a {img.shape[1]}x{img.shape[0]} image whose face cannot be cropped.")
+            return MemoryReport('full frame', estimate, budget=budget)
+    estimate = face_roi_bytes(img.shape, roi.shape, face_pixels, params.use_warp, PASTE_ROWS)
+    if budget is None or estimate <= budget:
+        return MemoryReport('face roi', estimate, budget=budget)
+    # Halve the bands until the largest of them fits
+    features = roi.crop_features(facial_features)
+    face_landmarks = load_feature_landmarks(features, image_id, FEATURE_TO_INT, 'jawline')
+    eyebrow_landmarks = load_feature_landmarks(features, image_id, FEATURE_TO_INT, 'eyebrows')
+    band_rows = roi.shape[0]
+    while band_rows >= MIN_BAND_ROWS:
+        source_rows = max(source[3] - source[1] for _, source in eye_bands(roi, face_landmarks, eyebrow_landmarks, band_rows))
+        estimate = tiled_bytes(img.shape, face_pixels, source_rows * roi.shape[1], PASTE_ROWS)
+        if estimate <= budget:
+            return MemoryReport('tiled', estimate, band_rows, budget)
+        band_rows //= 2
+    raise ValueError(f"A memory budget of {budget / 2**20:.0f} MB is too small for a {img.shape[1]}x{img.shape[0]} image, "
+                     f"rendering it in bands needs about {estimate / 2**20:.0f} MB.")
+
+# Function to get the area of the face box grown by the mask blur margin, the stages keep arrays of about that size
+def padded_face_pixels(facial_features, image_id):
+    points = np.vstack([load_feature_landmarks(facial_features, image_id, FEATURE_TO_INT, 'jawline'),
+                        load_feature_landmarks(facial_features, image_id, FEATURE_TO_INT, 'eyebrows')])
+    width, height = points.max(axis=0) - points.min(axis=0) + 1 + 2*MASK_BLUR_MARGIN
+    return int(width) * int(height)
+
+# Function to cut the eye stage of a face crop into bands of rows, each with the box of the input it reads
+def eye_bands(roi, face_landmarks, eyebrow_landmarks, band_rows):
+    shape = roi.shape
+    height_reduced, width_reduced, h, w, c = calculate_reductions(face_landmarks, eyebrow_landmarks, np.empty((0, 0, shape[2])), roi)
+    eye_affine, face_affine = stage_affines(height_reduced, width_reduced, w, h)
+    for y0 in range(0, shape[0], band_rows):
+        band = (0, y0, shape[1], min(y0 + band_rows, shape[0]))
+        yield band, eye_sources(band, eye_affine, face_affine, roi, shape)
+
+# Function to augment the face crop of roi in bands of rows, for photos whose crop does not fit the memory budget
+def augment_tiles(img, facial_features, image_id, params, roi, band_rows):
+    '''
+    The result of augment_array with the face crop roi, with only the returned photo and the working memory of
+    one band of band_rows rows alive. Each band of the eye stage is computed from the part of the warped crop
+    it reads, which is warped for it with maps built for those rows only, and written straight into the photo,
+    which is then normalised in place. The nose and mouth are always exaggerated with the warp: the resize and
+    blend stages (use_warp False) keep copies of the whole crop.
+    '''
+    crop = img[roi.y0:roi.y1, roi.x0:roi.x1]
+    facial_features = roi.crop_features(facial_features)
+    scale_factors = {'nose': params.nose_scale_factor, 'lips': params.mouth_scale_factor}
+    face_landmarks = load_feature_landmarks(facial_features, image_id, FEATURE_TO_INT, 'jawline')
+    eyebrow_landmarks = load_feature_landmarks(facial_features, image_id, FEATURE_TO_INT, 'eyebrows')
+    masks = cached_eye_masks(crop, facial_features, image_id, FEATURE_TO_INT)
+    output = img.copy()
+    result = output[roi.y0:roi.y1, roi.x0:roi.x1]
+    for band, sources in eye_bands(roi, face_landmarks, eyebrow_landmarks, band_rows):
+        x0, y0, x1, y1 = sources
+        map_x, map_y = build_warp_maps(crop.shape, facial_features, image_id, FEATURE_TO_INT, scale_factors, rows=(y0, y1))
+        part = warp_image(crop, (map_x[:, x0:x1], map_y[:, x0:x1]))
+        del map_x, map_y
+        result[band[1]:band[3]] = eye_part(part, masks, face_landmarks, eyebrow_landmarks, roi, band, sources)
+    return normalize_in_place(output)
+
+# Function to run the stages of augment_array through a StageCache
+def augment_stages(img, facial_features, image_id, params, stage_cache, cache=None, memory_report=None):
+    # Under a memory budget the stages run the way plan_render chooses, bands are rendered without the stage cache
+    roi = face_roi(img, facial_features, image_id, FEATURE_TO_INT) if params.use_face_roi or params.memory_budget is not None else None
+    if params.memory_budget is not None:
+        plan = plan_render(img, facial_features, image_id, params, roi)
+        if memory_report is not None:
+            memory_report.record_plan(plan)
+        if plan.mode == 'tiled':
+            return augment_tiles(img, facial_features, image_id, params, roi, plan.band_rows)
+        if plan.mode == 'full frame':
+            roi = None
+    # Each stage is keyed by the key of the stage before it plus its own parameters
+    cache = cache if cache is not None else stage_cache.results
+    image_key = MapCache.key('input', img, facial_features, roi is not None)
+    if roi is not None:
+        img, facial_features = roi.crop(), roi.crop_features(facial_features)
+    # Stage outputs are shared read only arrays, the stages that write into their input get a copy
+    if params.use_warp:
+        key, (img,) = stage_cache.run('features', (image_key, params.nose_scale_factor, params.mouth_scale_factor), lambda: (
+            augment_features(img, facial_features, image_id, FEATURE_TO_INT, params.nose_scale_factor, params.mouth_scale_factor, cache),))
+    else:
+        key, (img, original_img) = stage_cache.run('nose', (image_key, params.nose_scale_factor), lambda: augment_nose(
+            None, facial_features, image_id, FEATURE_TO_INT, params.nose_scale_factor, img.copy()))
+        key, (img,) = stage_cache.run('mouth', (key, params.mouth_scale_factor), lambda: (
+            augment_mouth(img.copy(), original_img, facial_features, image_id, FEATURE_TO_INT, params.mouth_scale_factor),))
+
+    def compute_eyes():
+        # The eye stage has no parameters, after a change upstream only the part of it the change reaches is redone
+        latest = stage_cache.latest(image_key)
+        if latest is not None and roi is not None:
+            face_landmarks = load_feature_landmarks(facial_features, image_id, FEATURE_TO_INT, 'jawline')
+            eyebrow_landmarks = load_feature_landmarks(facial_features, image_id, FEATURE_TO_INT, 'eyebrows')
+            masks = cached_eye_masks(img, facial_features, image_id, FEATURE_TO_INT, cache)
+            result = update_eye_result(latest[0], latest[1], img, masks, face_landmarks, eyebrow_landmarks, roi)
+            if result is not None:
+                return (result,)
+        return (eye_result(img, facial_features, image_id, FEATURE_TO_INT, roi, cache),)
+    key, (result,) = stage_cache.run('eyes', (key,), compute_eyes)
+    stage_cache.remember_latest(image_key, img, result)
+    return normalize_result(result, roi)
+
+# Function to build the AugmentParams of an image of the landmark store
+def augment_params(image_id, landmark_store, feature_stats, use_face_roi=True, use_warp=True, memory_budget=None):
+    return AugmentParams(*feature_scale_factors(image_id, landmark_store, feature_stats), use_face_roi, use_warp, memory_budget)
+
+# Function to name the augmented copy of an image in augmented_directory
+def augmented_path(augmented_directory, img_path):
+    return os.path.join(augmented_directory, f"augmented_{os.path.basename(img_path)}")
+
+# Function to augment a decoded image of the landmark store, printing its memory report under a budget
+def augment_decoded(img, img_path, image_id, landmark_store, params, cache=None, measure_peak=False):
+    # Only measure the peak where the process wide peak is the image's (see MemoryReport)
+    memory_report = MemoryReport(measure_peak=measure_peak) if params.memory_budget is not None else None
+    img = augment_array(img, landmark_store.image_features(image_id), params, cache, memory_report=memory_report)
+    if memory_report is not None:
+        print(f"{os.path.basename(img_path)}: {memory_report}")
+    return img
+
+# Function to augment one image file and save the result
+def augment_image_file(img_path, img_num, landmark_store, feature_stats, augmented_directory, use_face_roi=True, use_warp=True, cache=None,
+                       memory_budget=None):
+    # Get the id the image was landmarked under, stores without image keys use the directory order
+    image_id = landmark_store.image_id(os.path.basename(img_path), img_num)
+    params = augment_params(image_id, landmark_store, feature_stats, use_face_roi, use_warp, memory_budget)
+    img = cv2.imread(img_path)
+    if img is None:
+        raise ValueError(f"Could not read image '{img_path}'.")
+    # A batch worker runs one image at a time on one thread, so the process wide peak is the image's
+    img = augment_decoded(img, img_path, image_id, landmark_store, params, cache, measure_peak=True)
+    # Save the augmented image
+    augmented_img_path = augmented_path(augmented_directory, img_path)
+    cv2.imwrite(augmented_img_path, img)
+    return augmented_img_path
+
+# Function to decode an image at a reduced size, long side at least max_side where the image allows it
+def read_preview_image(img_path, max_side=PREVIEW_MAX_SIDE):
+    # JPEG decodes 1/8, 1/4 and 1/2 scale directly, so try the smallest first; each probe costs a fraction of the next
+    for reduction, flag in [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]:
+        img = cv2.imread(img_path, flag)
+        if img is None:
+            return None, 1
+        if max(img.shape[:2]) >= max_side:
+            break
+    else:
+        img, reduction = cv2.imread(img_path), 1
+    scale = min(max_side / max(img.shape[:2]), 1)
+    if scale < 1:
+        img = cv2.resize(img, (round(img.shape[1]*scale), round(img.shape[0]*scale)), interpolation=cv2.INTER_AREA)
+    return img, scale / reduction
+
+# Function to scale landmark rows to an image resized by scale
+def scale_features(facial_features, scale):
+    features = np.array(facial_features, dtype=np.int64)
+    features[:, 3:5] = np.rint(features[:, 3:5]*scale)
+    return features
+
+# Function to render a quick low resolution preview of the augmentation of one image file
+def augment_preview(img_path, img_num, landmark_store, feature_stats, max_side=PREVIEW_MAX_SIDE, cache=None):
+    '''
+    Runs the same stages as augment_image_file on a proxy of the photo with its long side at max_side and
+    the landmarks scaled to match, and returns the preview image instead of writing it.
+    The scale factors come from the full resolution statistics, so the features are exaggerated by the
+    same amount; the mask blurs are in pixels, so their edges are relatively softer than in the full render.
+    '''
+    image_id = landmark_store.image_id(os.path.basename(img_path), img_num)
+    params = augment_params(image_id, landmark_store, feature_stats)
+    img, scale = read_preview_image(img_path, max_side)
+    if img is None:
+        raise ValueError(f"Could not read image '{img_path}'.")
+    return augment_array(img, scale_features(landmark_store.image_features(image_id), scale), params, cache)
+
+# Function to list the images to augment
+def get_image_paths(image_directory):
+    return [os.path.join(image_directory, filename) for filename in os.listdir(image_directory) if
+            filename.lower().endswith(('.png', '.jpg', '.jpeg'))]
+
 # Function to augment the image
-def augment_image():
-    # Load facial features from numpy file
-    facial_features = np.load(get_dir('data/facial_features.npy'))
-    # Map facial features to integers
-    feature_to_int = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
-    # Define directories for original and augmented images
+def augment_image(decode_workers=None, encode_workers=None, cache_directory=None, augmented_directory=None):
+    # Imported here as the pipeline module is built on this one
+    from augmentation.pipeline import stream_augment, DEFAULT_DECODE_WORKERS, DEFAULT_ENCODE_WORKERS
+    # Open the landmark store, only the rows of the image being augmented are read from it
+    landmark_store = load_landmark_store()
+    # Load the feature size statistics once, they are only rebuilt when the landmarks changed
+    feature_stats = load_feature_statistics(store=landmark_store)
+    # Define directories for original and augmented images, the augmented ones go to data/augmented_images by default
     image_directory = get_dir('data/original_images')
-    augmented_directory = get_dir('data/augmented_images')
-    # Define scale factor for nose augmentation
-
-    mouth_scale_factor = 1.25
+    augmented_directory = augmented_directory or get_dir('data/augmented_images')
 
     # Create directory for augmented images if it doesn't exist
     if not os.path.exists(augmented_directory):
         os.makedirs(augmented_directory)
+    # Warp grids and masks are kept in data/map_cache (or cache_directory), so re-rendering an image does not rebuild them
+    cache = MapCache(directory=cache_directory or os.path.join(get_dir('data'), CACHE_DIRECTORY))
     # Get list of image paths from the image directory
-    image_paths = [os.path.join(image_directory, filename) for filename in os.listdir(image_directory) if
-                   filename.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    # Loop through each image path
-    for img_num, img_path in enumerate(image_paths):
-        print(img_num)
-        nose_scale, mouth_scale, eyes_scale, nose_avg, mouth_avg, eye_avg = get_std_dev_feature(img_num)
-        nose_scale_factor = 1 + nose_avg/nose_scale
-        mouth_scale_factor = 1 + mouth_avg/mouth_scale
-        print('nose:', nose_scale_factor, '\nmouth:', mouth_scale_factor)
-        if nose_scale_factor < 1:  # not prominent feature
-            nose_scale_factor = 1.2
-        elif nose_scale_factor > 1.25:  # prominent feature
-            nose_scale_factor = 1.25
-        if mouth_scale_factor < 1:  # not prominent feature
-            mouth_scale_factor = 1.2
-        elif mouth_scale_factor > 1.25:  # prominent feature
-            mouth_scale_factor = 1.25
-
-        # Get the index of the current image path
-        image_id = image_paths.index(img_path)
-        # Augment the nose of the image
-        img, original_img = augment_nose(img_path, facial_features, image_id, feature_to_int, nose_scale_factor)
-        img = augment_mouth(img, original_img, facial_features, image_id, feature_to_int, mouth_scale_factor)
-        # Augment the eyes of the image
-        img = augment_eyes(img, facial_features, image_id, feature_to_int)
-        # Define the name and path for the augmented image
-        augmented_img_name = f"augmented_{os.path.basename(img_path)}"
-        augmented_img_path = os.path.join(augmented_directory, augmented_img_name)
-        # Save the augmented image
-        cv2.imwrite(augmented_img_path, img)
+    image_paths = get_image_paths(image_directory)
+    # Stream the images through the augmentation, decoding ahead of it and encoding behind it on worker threads
+    results = stream_augment(image_paths, landmark_store, feature_stats, augmented_directory, decode_workers or DEFAULT_DECODE_WORKERS,
+                             encode_workers or DEFAULT_ENCODE_WORKERS, cache=cache)
+    for img_num, (img_path, augmented_img_path, error) in enumerate(results):
+        if error is not None:
+            print(f"{img_num}: failed to augment {img_path}:\n{error}")
+            continue
+        # The scale factors the image was exaggerated by, kept out of the render so previews stay quiet
+        image_id = landmark_store.image_id(os.path.basename(img_path), img_num)
+        nose_scale_factor, mouth_scale_factor = feature_scale_factors(image_id, landmark_store, feature_stats)
+        print(f"{img_num}: image ID {image_id}, nose: {nose_scale_factor}, mouth: {mouth_scale_factor}")
+    print(cache.report())
 
 if __name__ == "__main__":
     augment_image()
-
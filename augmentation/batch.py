@@ -0,0 +1,141 @@
+# batch.py
+
+import argparse
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import sys
+import os
+
+# Get the current and parent directory
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from augmentation.augment import augment_image_file, get_image_paths
+from landmarking.store import load_landmark_store
+from landmarking.feature_stats import load_feature_statistics
+from augmentation.cache import MapCache, CACHE_DIRECTORY
+from utils.file_utils import get_dir
+
+# Per worker state, set once by init_worker
+_worker_store = None
+_worker_stats = None
+_worker_cache = None
+
+
+def init_worker(data_directory):
+    '''
+    Pool initializer: each worker opens the landmark store (a memory map, so the pages are shared with the
+    other workers through the page cache) and loads the feature statistics once, not once per image.
+    The map cache of each worker keeps its own memory tier and shares the disk tier in data/map_cache.
+    '''
+    global _worker_store, _worker_stats, _worker_cache
+    _worker_store = load_landmark_store(data_directory)
+    _worker_stats = load_feature_statistics(data_directory, _worker_store)
+    _worker_cache = MapCache(directory=os.path.join(data_directory, CACHE_DIRECTORY))
+
+
+def augment_task(img_path, img_num, augmented_directory, memory_budget=None):
+    # Worker entry point; errors are returned instead of raised so one bad image never stops the batch
+    try:
+        return img_path, augment_image_file(img_path, img_num, _worker_store, _worker_stats, augmented_directory, cache=_worker_cache,
+                                            memory_budget=memory_budget), None
+    except Exception:
+        return img_path, None, traceback.format_exc()
+
+
+def augment_batch(image_paths=None, augmented_directory=None, workers=None, max_in_flight=None, data_directory=None, memory_budget=None):
+    '''
+    Augments image_paths (default: every image in data/original_images) on a pool of worker processes.
+    At most max_in_flight images (default: twice the worker count) are submitted at once, so the number
+    of decoded full resolution images alive at any time stays bounded however long the list is.
+    Workers write their results themselves; only paths and error messages travel back.
+    Returns one (img_path, augmented_img_path, error) tuple per image, in input order; error is None
+    on success and the formatted traceback when the image failed.
+    When a worker dies, the images in flight on the broken pool are rerun one at a time on a new pool, so
+    only the image that crashed its worker again is reported as failed.
+    memory_budget (bytes) caps the memory each worker's augmentation allocates (see AugmentParams), so workers
+    times the budget bounds the batch; each worker measures and prints the peak of every image, and an image
+    that still goes over the budget fails.
+    '''
+    data_directory = data_directory or get_dir('data')
+    if image_paths is None:
+        image_paths = get_image_paths(os.path.join(data_directory, 'original_images'))
+    augmented_directory = augmented_directory or os.path.join(data_directory, 'augmented_images')
+    os.makedirs(augmented_directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1.")
+
+    # Build the statistics once up front so the workers do not all rebuild a stale file at the same time
+    load_feature_statistics(data_directory)
+
+    results = [None] * len(image_paths)
+    pending = {}
+    next_index = 0
+    # Images whose worker died with another image's, rerun one at a time so a crash is pinned on its own image
+    retries = deque()
+    retrying = None
+    executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(data_directory,))
+    try:
+        while next_index < len(image_paths) or pending or retries:
+            if retries:
+                if not pending:
+                    retrying = retries.popleft()
+                    pending[executor.submit(augment_task, image_paths[retrying], retrying, augmented_directory, memory_budget)] = retrying
+            else:
+                # Keep the pool fed without letting the queue grow past max_in_flight
+                while next_index < len(image_paths) and len(pending) < max_in_flight:
+                    future = executor.submit(augment_task, image_paths[next_index], next_index, augmented_directory, memory_budget)
+                    pending[future] = next_index
+                    next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    results[index] = future.result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for using too much memory); alone in the pool the image is the cause
+                    broken = True
+                    if index != retrying:
+                        retries.append(index)
+                        continue
+                    results[index] = (image_paths[index], None, "Worker process terminated abruptly.")
+                if results[index][2] is not None:
+                    print(f"Failed to augment {image_paths[index]}:\n{results[index][2]}")
+            if not pending:
+                retrying = None
+            if broken:
+                # Every image still in the broken pool is rerun on a new one
+                for future, index in pending.items():
+                    if future.done() and future.exception() is None:
+                        results[index] = future.result()
+                        if results[index][2] is not None:
+                            print(f"Failed to augment {image_paths[index]}:\n{results[index][2]}")
+                    else:
+                        retries.append(index)
+                pending = {}
+                retrying = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(data_directory,))
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    failures = sum(1 for result in results if result[2] is not None)
+    print(f"Augmented {len(results) - failures} image(s), {failures} failed.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Augment every image in data/original_images on a process pool.")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes, default every core")
+    parser.add_argument('--max-in-flight', type=int, default=None, help="images submitted at once, default twice the workers")
+    parser.add_argument('--memory-budget', type=float, default=None, help="MB each worker's augmentation may allocate, default no limit")
+    args = parser.parse_args()
+    memory_budget = int(args.memory_budget * 2**20) if args.memory_budget is not None else None
+    augment_batch(workers=args.workers, max_in_flight=args.max_in_flight, memory_budget=memory_budget)
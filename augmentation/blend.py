@@ -0,0 +1,110 @@
+# blend.py
+
+import numpy as np
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from augmentation.mask import TileMask
+
+# Rows blended per step, bounds the 16 bit scratch buffers to a few MB whatever the photo size
+BAND_ROWS = 128
+
+
+def mask_weights(mask):
+    '''
+    Returns mask as single channel uint8 weights, 255 takes the foreground and 0 the background.
+    The masks the stages build have three identical channels, so the first one is used.
+    uint8 masks are taken as they are, float masks are expected in [0, 1], a TileMask is built in full.
+    '''
+    if isinstance(mask, TileMask):
+        return mask.to_array(single_channel=True)
+    if mask.ndim == 3:
+        mask = mask[:, :, 0]
+    if mask.dtype == np.uint8:
+        return mask
+    return np.clip(np.rint(mask*255), 0, 255).astype(np.uint8)
+
+
+def blend(foreground, background, mask, out=None):
+    '''
+    Returns foreground * mask/255 + background * (1 - mask/255) with a single channel uint8 mask broadcast
+    across the colour channels.
+    uint8 images are blended in 16 bit fixed point and rounded to uint8; anything else is blended in float32.
+    The work is done in bands of BAND_ROWS rows straight into out, which may be foreground or background
+    for an in place blend, so no full size temporaries are created.
+    A TileMask is only blended over its tile, the rest of out is copied from the image its constant value picks.
+    '''
+    if foreground.shape != background.shape or foreground.shape[:2] != mask.shape[:2]:
+        raise ValueError("Images and mask must have the same width and height.")
+    if isinstance(mask, TileMask) and mask.outside in (0, 255):
+        return blend_tile(foreground, background, mask, out)
+    mask = mask_weights(mask)
+    fixed_point = foreground.dtype == np.uint8 and background.dtype == np.uint8
+    if out is None:
+        out = np.empty(foreground.shape, dtype=np.uint8 if fixed_point else np.float32)
+    elif out.shape != foreground.shape:
+        raise ValueError("Output buffer must have the shape of the images.")
+    channels = foreground.shape[2:]
+    band_shape = (min(BAND_ROWS, foreground.shape[0]),) + foreground.shape[1:]
+    weight_shape = band_shape[:2] + (1,) * len(channels)
+
+    if fixed_point:
+        accumulator = np.empty(band_shape, dtype=np.uint16)
+        scratch = np.empty(band_shape, dtype=np.uint16)
+        inverse = np.empty(weight_shape, dtype=np.uint8)
+        for start in range(0, foreground.shape[0], BAND_ROWS):
+            rows = slice(start, min(start + BAND_ROWS, foreground.shape[0]))
+            n = rows.stop - rows.start
+            acc, tmp, inv = accumulator[:n], scratch[:n], inverse[:n]
+            weight = mask[rows].reshape(inv.shape)
+            np.subtract(255, weight, out=inv)
+            # fg * w + bg * (255 - w) is at most 255 * 255, so it fits 16 bits with room for the rounding term
+            np.multiply(foreground[rows], weight, out=acc, dtype=np.uint16)
+            np.multiply(background[rows], inv, out=tmp, dtype=np.uint16)
+            acc += tmp
+            # Exact round(acc / 255) for acc <= 255 * 255: t = acc + 128, (t + (t >> 8)) >> 8
+            acc += 128
+            np.right_shift(acc, 8, out=tmp)
+            acc += tmp
+            acc >>= 8
+            np.copyto(out[rows], acc, casting='unsafe')
+    else:
+        difference = np.empty(band_shape, dtype=np.float32)
+        for start in range(0, foreground.shape[0], BAND_ROWS):
+            rows = slice(start, min(start + BAND_ROWS, foreground.shape[0]))
+            n = rows.stop - rows.start
+            diff = difference[:n]
+            weight = mask[rows].reshape((n,) + weight_shape[1:]).astype(np.float32)
+            weight *= np.float32(1/255)
+            # bg + (fg - bg) * w, one multiply instead of two
+            np.subtract(foreground[rows], background[rows], out=diff, dtype=np.float32)
+            diff *= weight
+            diff += background[rows]
+            np.copyto(out[rows], diff, casting='unsafe')
+    return out
+
+
+def blend_tile(foreground, background, mask, out=None):
+    # blend() with a TileMask: the tile is blended, outside it the weight is 0 (background) or 255 (foreground)
+    fixed_point = foreground.dtype == np.uint8 and background.dtype == np.uint8
+    if out is None:
+        out = np.empty(foreground.shape, dtype=np.uint8 if fixed_point else np.float32)
+    elif out.shape != foreground.shape:
+        raise ValueError("Output buffer must have the shape of the images.")
+    x0, y0, x1, y1 = mask.x0, mask.y0, mask.x1, mask.y1
+    tile = (slice(y0, y1), slice(x0, x1))
+    if mask.tile.size:
+        blend(foreground[tile], background[tile], mask.tile, out=out[tile])
+    # Copy the outside after the tile, out may be either image
+    source = background if mask.outside == 0 else foreground
+    if source is not out:
+        for rows, columns in [(slice(0, y0), slice(None)), (slice(y1, None), slice(None)),
+                              (slice(y0, y1), slice(0, x0)), (slice(y0, y1), slice(x1, None))]:
+            np.copyto(out[rows, columns], source[rows, columns], casting='unsafe')
+    return out
@@ -0,0 +1,204 @@
+# cache.py
+
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Bump when the way maps are computed changes, so stale files on disk are never returned
+CACHE_VERSION = 3
+# Memory budget of the LRU tier
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+# Size cap of the disk tier, past it the least recently used files are removed
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+# Eviction brings the disk tier down to this share of its cap, so it does not run on every put once full
+DISK_LOW_WATER = 0.9
+CACHE_DIRECTORY = 'map_cache'
+
+
+class MapCache:
+    '''
+    Cache for the per image maps the augmentation stages compute (remap grids, blurred masks).
+    Entries are tuples of numpy arrays looked up by key(); a memory tier keeps the most recently used
+    entries up to max_bytes, and when directory is given every entry is also written there as a
+    compressed .npz so later runs (GUI refreshes, re-exports) start warm. The files are kept under
+    max_disk_bytes by removing the least recently used ones (by modification time, which a disk hit renews),
+    so processes sharing the directory evict each other's files too.
+    Safe to share between threads, and between processes through the directory.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, directory=None, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_files())
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kind, *parts):
+        '''
+        Returns the key of an entry: a SHA-256 over the kind, the array parts (dtype, shape and bytes,
+        e.g. the landmark rows) and the repr of every other part (shapes, scale factors).
+        '''
+        digest = hashlib.sha256(f"{CACHE_VERSION}:{kind}".encode('utf-8'))
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                part = np.ascontiguousarray(part)
+                digest.update(f"{part.dtype.str}{part.shape}".encode('utf-8'))
+                digest.update(part.tobytes())
+            elif isinstance(part, dict):
+                digest.update(repr(sorted(part.items())).encode('utf-8'))
+            else:
+                digest.update(repr(part).encode('utf-8'))
+        return f"{kind}-{digest.hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _disk_files(self):
+        # (modification time, path, size) of every entry file in the directory
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Removed by another process meanwhile
+                    continue
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
+
+    def _write(self, key, arrays):
+        # Writes through a temporary file of its own, so processes storing the same key never share one
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=key, suffix='.tmp', delete=False) as file:
+            try:
+                np.savez_compressed(file, *arrays)
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
+        os.replace(file.name, self._path(key))
+        with self._lock:
+            self._disk_bytes += os.path.getsize(self._path(key))
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # Over the cap by this process's count, recount with the files of other processes and evict the oldest
+            files = sorted(self._disk_files())
+            self._disk_bytes = sum(size for _, _, size in files)
+            for _, path, size in files:
+                if self._disk_bytes <= self.max_disk_bytes * DISK_LOW_WATER:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._disk_bytes -= size
+
+    def _remember(self, key, arrays):
+        # Adds an entry to the memory tier and evicts the least recently used ones over budget
+        size = sum(array.nbytes for array in arrays)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = arrays
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= sum(array.nbytes for array in evicted)
+
+    def get(self, key):
+        # Returns the cached arrays or None, a disk hit is promoted to the memory tier
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        if self.directory is not None and os.path.exists(self._path(key)):
+            try:
+                with np.load(self._path(key)) as data:
+                    arrays = tuple(data[f"arr_{n}"] for n in range(len(data.files)))
+            except (OSError, ValueError, KeyError):
+                # A damaged file is a miss, it is rewritten by the next put
+                arrays = None
+            if arrays is not None:
+                try:
+                    # Renew the file for the least recently used eviction of the disk tier
+                    os.utime(self._path(key))
+                except OSError:
+                    pass
+                for array in arrays:
+                    array.flags.writeable = False
+                self._remember(key, arrays)
+                with self._lock:
+                    self.disk_hits += 1
+                return arrays
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, arrays):
+        # Stores a tuple of arrays; cached arrays are read only because every caller shares them
+        arrays = tuple(np.asarray(array) for array in arrays)
+        for array in arrays:
+            array.flags.writeable = False
+        self._remember(key, arrays)
+        if self.directory is not None:
+            self._write(key, arrays)
+        return arrays
+
+    def get_or_compute(self, key, compute):
+        # Returns the cached arrays for key, computing (a tuple of arrays) and storing them on a miss
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = self.put(key, compute())
+        return arrays
+
+    def clear(self, disk=False):
+        # Empties the memory tier, and the directory too when disk is True
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if disk and self.directory is not None:
+            for _, path, _ in self._disk_files():
+                os.remove(path)
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        # Hit and miss counts; hits are memory hits, disk_hits were loaded from the directory
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                    'entries': len(self._entries), 'memory_bytes': self._bytes}
+
+    def report(self):
+        stats = self.stats()
+        return (f"Map cache: {stats['hits']} memory hits, {stats['disk_hits']} disk hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries using {stats['memory_bytes'] / 2**20:.1f} MB")
+
+
+def cached(cache, kind, key_parts, compute):
+    # Runs compute() (returning a tuple of arrays) through cache, or directly when there is no cache
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(MapCache.key(kind, *key_parts), compute)
@@ -1,6 +1,5 @@
 # eyes.py 
 
-import cv2
 import numpy as np
 import sys
 import os
@@ -13,6 +12,8 @@ sys.path.append(parent_directory)
 # Import necessary modules
 from landmarking.load import load_feature_landmarks
 from augmentation.resize_overlay import resize_and_overlay_feature
+from augmentation.blend import blend
+from augmentation.mask import TileMask
 from utils.img_utils import multi_res_blend, poisson_blend
 
 def resize_eyes(img, facial_features, image_id, feature_to_int, scale_factor):
@@ -34,23 +35,16 @@ def create_eye_mask(eye_landmarks1, eye_landmarks2, img):
     The mask is created by filling polygons defined by the eye landmarks with white color.
     A close operation is then applied to the mask to improve its quality.
     '''
-    # Create an empty mask
-    mask = np.zeros(img.shape, dtype=np.float32)
     # Ensure the eye landmarks are 2D
     if len(eye_landmarks1.shape) < 2:
         eye_landmarks1 = eye_landmarks1.reshape(-1, 2)
     if len(eye_landmarks2.shape) < 2:
         eye_landmarks2 = eye_landmarks2.reshape(-1, 2)
-    # Fill polygons defined by the eye landmarks with white color
-    cv2.fillConvexPoly(mask, np.int32(eye_landmarks1), (1.0, 1.0, 1.0))
-    cv2.fillConvexPoly(mask, np.int32(eye_landmarks2), (1.0, 1.0, 1.0))
-    # Convert the mask to uint8
-    mask = 255*np.uint8(mask)
+    # Fill polygons defined by the eye landmarks with white color, only the tile around them is stored
+    mask = TileMask.polygons(img.shape, [eye_landmarks1, eye_landmarks2])
 
     # Apply close operation to improve mask
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 40))
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    return mask
+    return mask.close(40)
 
 def multiply_eye_mask(mask, inverse_mask, eye, face):
     '''
@@ -58,15 +52,11 @@ def multiply_eye_mask(mask, inverse_mask, eye, face):
     The mask is applied to the eye image to isolate the eyes, and the inverse mask is applied to the face image to isolate the rest of the face.
     The two images are then added together to create the final result.
     This allows the eyes to be highlighted in the final image, while the rest of the face is still visible.
+    The blend (augmentation/blend.py) derives the inverse weights from the mask, so inverse_mask must be its complement, as prepare_masks returns.
     '''
-    # Ensure mask and inverse_mask have the same type as eye and face
-    mask = mask.astype(eye.dtype)
-    inverse_mask = inverse_mask.astype(face.dtype)
-    # Multiply the eye and face images by the mask and inverse mask respectively
-    just_eye = cv2.multiply(mask, eye)
-    just_face = cv2.multiply(inverse_mask, face)
-    # Ensure just_eye and just_face have the same type
-    just_eye = just_eye.astype(just_face.dtype)
-    # Add the eye and face images together
-    result = cv2.add(just_face, just_eye)
-    return result
\ No newline at end of file
+    # Make the face image the same type as the eye image
+    if face.dtype != eye.dtype:
+        face = face.astype(np.float32)
+        eye = eye.astype(np.float32)
+    # Blend the eye and face images in one pass
+    return blend(eye, face, mask)
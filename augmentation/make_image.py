@@ -12,8 +12,14 @@ sys.path.append(parent_directory)
 
 # Import necessary modules
 from augmentation.eyes import multiply_eye_mask
+from augmentation.blend import mask_weights
+from augmentation.mask import TileMask
+from augmentation.smooth import gaussian_radius
 from utils.img_utils import poisson_blend
 
+# Sigma of the blur make_face_img applies to the face image after its transform
+FACE_BLUR_SIGMA = 8
+
 def check_inputs(img, mask, face_landmarks, eyebrow_landmarks, face_img, type_mask):
     # Function to check if any of the inputs are None, if so, raise a ValueError
     # This is to ensure that all necessary inputs are provided for the image processing
@@ -32,78 +38,121 @@ def prepare_masks(mask):
     # The mask is used to isolate the area of interest in the image
     # The inverse mask is used to isolate the rest of the image
 
-    # If the mask is grayscale, convert it to BGR for compatibility with the image
-    if len(mask.shape) == 2:
-        mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+    # Tile masks are inverted on their tile
+    if isinstance(mask, TileMask):
+        return mask, mask.invert()
+    # Both stay single channel uint8 weights, the blend broadcasts them across the colour channels
+    mask = mask_weights(mask)
     # Calculate the inverse mask
     inverse_mask = cv2.bitwise_not(mask)
-    # If the inverse mask is grayscale, convert it to BGR for compatibility with the image
-    if len(inverse_mask.shape) == 2:
-        inverse_mask = cv2.cvtColor(inverse_mask, cv2.COLOR_GRAY2BGR)
-    # Convert the masks to float for blending operations
-    mask = mask.astype(float)/255
-    inverse_mask = inverse_mask.astype(float)/255
     return mask, inverse_mask
 
-def calculate_reductions(face_landmarks, eyebrow_landmarks, img):
+def calculate_reductions(face_landmarks, eyebrow_landmarks, img, roi=None):
     # Function to calculate the amount to reduce the image size by
     # This is based on the face and eyebrow landmarks to ensure the face is properly centered in the image
+    # When img is a face crop (roi given) the reductions are still those of the full photo
 
     # Get the width of the face and the height of the eyebrows from the landmarks
     face_width = face_landmarks[0, 1]
     eyebrow_height = eyebrow_landmarks[3, 1]
     # Get the dimensions of the image
     h, w, c = img.shape
+    if roi is not None:
+        # Landmarks of a crop are relative to its corner, the reductions are measured on the full photo
+        face_width, eyebrow_height = face_width + roi.y0, eyebrow_height + roi.y0
+        h, w = roi.frame_shape[:2]
     # Calculate the amount to reduce the height and width by
     height_reduced = int((h-eyebrow_height)/32)
     width_reduced = int((w-face_width)/8)
     return height_reduced, width_reduced, h, w, c
 
-def make_eye_img(img, height_reduced, width_reduced, w, h, mask, inverse_mask, face_img):
+def stage_affines(height_reduced, width_reduced, w, h):
+    '''
+    Returns the eye and face transforms of make_eye_img and make_face_img as 2x3 matrices that map a pixel
+    of the result to the position it is sampled from in the input, in full photo coordinates.
+    The eye transform is the border plus resize; the face transform folds the 2x upscale, the side
+    borders and the resize back into one map (vertically the upscale and resize cancel out).
+    '''
+    border = int(width_reduced*0.3)
+    eye_x, eye_y = (w + 2*width_reduced)/w, (h + 4*height_reduced)/h
+    eye = np.array([[eye_x, 0, 0.5*eye_x - 0.5 - width_reduced], [0, eye_y, 0.5*eye_y - 0.5 - height_reduced]])
+    face_x = (w + border)/w
+    face = np.array([[face_x, 0, 0.5*face_x - 0.5 - border/2], [0, 1, 0]])
+    return eye, face
+
+def warp_crop(img, affine, roi, box=None):
+    # Applies a full photo transform from stage_affines to img, a crop of roi or the full photo when roi is None
+    # With box (x0, y0, x1, y1, in crop coordinates) only the result pixels in that box are computed
+    x0, y0, x1, y1 = box if box is not None else (0, 0, img.shape[1], img.shape[0])
+    offset_x, offset_y = (roi.x0, roi.y0) if roi is not None else (0, 0)
+    crop_affine = affine.copy()
+    crop_affine[0, 2] += affine[0, 0]*(offset_x + x0) - offset_x
+    crop_affine[1, 2] += affine[1, 1]*(offset_y + y0) - offset_y
+    return cv2.warpAffine(img, crop_affine, (x1 - x0, y1 - y0), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_CONSTANT)
+
+def face_box(mask, shape):
+    # Box of the pixels the face image is computed for: the tile of a mask that is 0 outside it grown by the
+    # blur reach, so the blur of the box is the blur of the full image on the tile, else the whole image
+    if not isinstance(mask, TileMask) or mask.outside != 0:
+        return 0, 0, shape[1], shape[0]
+    reach = gaussian_radius(0, FACE_BLUR_SIGMA)
+    return max(mask.x0 - reach, 0), max(mask.y0 - reach, 0), min(mask.x1 + reach, shape[1]), min(mask.y1 + reach, shape[0])
+
+def make_eye_img(img, height_reduced, width_reduced, w, h, mask, inverse_mask, face_img, roi=None):
     # Function to create the eye image
     # The image is resized and the mask is applied to isolate the eyes
 
-    # Add a border to the image and resize it
-    eye = cv2.copyMakeBorder(img, height_reduced, height_reduced*3, width_reduced, width_reduced, cv2.BORDER_CONSTANT)
-    eye = cv2.resize(eye, (w, h))
-    # Convert the image to float for blending operations
-    eye = eye.astype(float)/255
+    if roi is None:
+        # Add a border to the image and resize it
+        eye = cv2.copyMakeBorder(img, height_reduced, height_reduced*3, width_reduced, width_reduced, cv2.BORDER_CONSTANT)
+        eye = cv2.resize(eye, (w, h))
+    else:
+        # Same transform, computed for the crop only
+        eye = warp_crop(img, stage_affines(height_reduced, width_reduced, w, h)[0], roi)
+    # A float background is taken to be in [0, 1]
+    if face_img.dtype != np.uint8:
+        eye = eye.astype(np.float32)/255
     # Apply the mask to the image to isolate the eyes
     return multiply_eye_mask(mask, inverse_mask, eye, face_img)
 
-def make_face_img(img, width_reduced, w, h, mask, inverse_mask):
+def make_face_img(img, width_reduced, w, h, mask, inverse_mask, roi=None):
     # Function to create the face image
     # The image is resized, blurred, and the mask is applied to isolate the face
 
-    # Copy the image and convert it to float for blending operations
-    face = img.copy()
-    head = img.astype(float)/255
-    # Resize the image and add a border
-    face = cv2.resize(face, (w*2, h*2))
-    face = cv2.copyMakeBorder(face, 0, 0, int(width_reduced*0.3), int(width_reduced*0.3), cv2.BORDER_CONSTANT)
-    face = cv2.resize(face, (w, h))
+    # The original is the background of the blend
+    head = img
+    # The 2x upscale, side borders and resize back of the face transform in one warp (see stage_affines),
+    # computed only where the mask lets the face image through
+    x0, y0, x1, y1 = face_box(mask, img.shape)
+    face = warp_crop(img, stage_affines(0, width_reduced, w, h)[1], roi, (x0, y0, x1, y1))
     # Apply a Gaussian blur to the image
-    face = cv2.GaussianBlur(face, (0, 0), 8)
-    # Convert the image to float for blending operations
-    face = face.astype(float)/255
-    # Apply the mask to the image to isolate the face
-    return  multiply_eye_mask(mask, inverse_mask, face, head)
-
-def make_img(img, mask, face_landmarks, eyebrow_landmarks, face_img, type_mask):
+    face = cv2.GaussianBlur(face, (0, 0), FACE_BLUR_SIGMA)
+    if (x0, y0, x1, y1) == (0, 0, img.shape[1], img.shape[0]):
+        # Apply the mask to the image to isolate the face
+        return multiply_eye_mask(mask, inverse_mask, face, head)
+    # Outside the box the mask keeps the original
+    result = head.copy()
+    result[y0:y1, x0:x1] = multiply_eye_mask(mask.crop(x0, y0, x1, y1), inverse_mask.crop(x0, y0, x1, y1), face, head[y0:y1, x0:x1])
+    return result
+
+def make_img(img, mask, face_landmarks, eyebrow_landmarks, face_img, type_mask, roi=None):
     # Main function to create the final image
     # The function checks the inputs, prepares the masks, calculates the reductions, and creates the eye or face image based on the type mask
+    # Pass roi (augmentation.roi.FaceROI) when img is a face crop, the result is then the crop of the full photo result
 
     # Check the inputs
     check_inputs(img, mask, face_landmarks, eyebrow_landmarks, face_img, type_mask)
     # Prepare the masks
     mask, inverse_mask = prepare_masks(mask)
     # Convert the image to uint8 for color mapping
-    img = img.astype(np.uint8)
+    if img.dtype != np.uint8:
+        img = img.astype(np.uint8)
     # Calculate the reductions
-    height_reduced, width_reduced, h, w, c = calculate_reductions(face_landmarks, eyebrow_landmarks, img)
+    height_reduced, width_reduced, h, w, c = calculate_reductions(face_landmarks, eyebrow_landmarks, img, roi)
     # Create the eye or face image based on the type mask
     if type_mask == 'reduced_eyes_mask':
-        result = make_eye_img(img, height_reduced, width_reduced, w, h, mask, inverse_mask, face_img)
+        result = make_eye_img(img, height_reduced, width_reduced, w, h, mask, inverse_mask, face_img, roi)
     else:
-        result = make_face_img(img, width_reduced, w, h, mask, inverse_mask)
+        result = make_face_img(img, width_reduced, w, h, mask, inverse_mask, roi)
     return result
\ No newline at end of file
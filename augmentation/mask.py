@@ -0,0 +1,140 @@
+# mask.py
+
+import numpy as np
+import cv2
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from augmentation.smooth import smooth, gaussian_radius
+
+
+class TileMask:
+    '''
+    A single channel uint8 mask over a frame of frame_shape that only stores the tile [x0, x0 + width) x
+    [y0, y0 + height) where it varies; every pixel outside the tile has the value outside (0, or 255 once inverted).
+    blur(), close() and invert() work on the tile, growing it by the reach of the operation so the result
+    is the one the operation gives on the full frame, and blend() only blends the tile.
+    The full frame mask is only built when asked for: to_array(), np.asarray(mask) or indexing.
+    '''
+
+    def __init__(self, tile, x0, y0, frame_shape, outside=0):
+        self.tile = tile
+        self.x0, self.y0 = x0, y0
+        self.frame_shape = tuple(frame_shape)
+        self.outside = outside
+
+    @staticmethod
+    def clip(frame_shape, x0, y0, x1, y1):
+        # The box [x0, x1) x [y0, y1) clipped to the frame; a box off the frame becomes an empty box on its edge
+        height, width = frame_shape[:2]
+        x0, y0 = min(max(x0, 0), width), min(max(y0, 0), height)
+        x1, y1 = max(min(x1, width), x0), max(min(y1, height), y0)
+        if x0 == x1 or y0 == y1:
+            return x0, y0, x0, y0
+        return x0, y0, x1, y1
+
+    @classmethod
+    def box(cls, frame_shape, x0, y0, x1, y1):
+        # Mask that is 255 in the box [x0, x1) x [y0, y1), clipped to the frame
+        x0, y0, x1, y1 = cls.clip(frame_shape, x0, y0, x1, y1)
+        return cls(np.full((y1 - y0, x1 - x0), 255, np.uint8), x0, y0, frame_shape)
+
+    @classmethod
+    def polygons(cls, frame_shape, polygons):
+        # Mask that is 255 inside the convex polygons, as cv2.fillConvexPoly draws them on the full frame
+        polygons = [np.int32(polygon).reshape(-1, 2) for polygon in polygons]
+        points = np.vstack(polygons)
+        x0, y0, x1, y1 = cls.clip(frame_shape, int(points[:, 0].min()), int(points[:, 1].min()),
+                                  int(points[:, 0].max()) + 1, int(points[:, 1].max()) + 1)
+        tile = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        if tile.size:
+            for polygon in polygons:
+                cv2.fillConvexPoly(tile, polygon - [x0, y0], 255)
+        return cls(tile, x0, y0, frame_shape)
+
+    @property
+    def shape(self):
+        return self.frame_shape
+
+    @property
+    def x1(self):
+        return self.x0 + self.tile.shape[1]
+
+    @property
+    def y1(self):
+        return self.y0 + self.tile.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.tile.nbytes
+
+    def pad(self, margin):
+        # Same mask with the tile grown by margin on every side (clipped to the frame); an empty mask stays empty
+        if not self.tile.size:
+            return TileMask(self.tile, self.x0, self.y0, self.frame_shape, self.outside)
+        x0, y0 = max(self.x0 - margin, 0), max(self.y0 - margin, 0)
+        x1, y1 = min(self.x1 + margin, self.frame_shape[1]), min(self.y1 + margin, self.frame_shape[0])
+        tile = np.full((y1 - y0, x1 - x0), self.outside, np.uint8)
+        tile[self.y0 - y0:self.y1 - y0, self.x0 - x0:self.x1 - x0] = self.tile
+        return TileMask(tile, x0, y0, self.frame_shape, self.outside)
+
+    def blur(self, ksize, sigma, tolerance=0):
+        # cv2.GaussianBlur(mask, (ksize, ksize), sigma) within tolerance levels (see smooth); the tile grows by the kernel
+        # reach, past which the mask stays constant, plus one pixel so the border the blur reflects at the tile edge is constant too
+        padded = self.pad(gaussian_radius(ksize, sigma) + 1)
+        if not padded.tile.size:
+            return padded
+        frame_edges = (padded.y0 == 0, padded.y1 == self.frame_shape[0], padded.x0 == 0, padded.x1 == self.frame_shape[1])
+        padded.tile = smooth(padded.tile, ksize, sigma, tolerance, frame_edges)
+        return padded
+
+    def close(self, size):
+        # cv2.morphologyEx(mask, cv2.MORPH_CLOSE, size x size rectangle); dilation spreads the mask by at most size
+        padded = self.pad(size)
+        if not padded.tile.size:
+            return padded
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+        padded.tile = cv2.morphologyEx(padded.tile, cv2.MORPH_CLOSE, kernel)
+        return padded
+
+    def invert(self):
+        # np.bitwise_not, cv2.bitwise_not returns None for an empty tile
+        return TileMask(np.bitwise_not(self.tile), self.x0, self.y0, self.frame_shape, 255 - self.outside)
+
+    def crop(self, x0, y0, x1, y1):
+        # Mask of the part [x0, x1) x [y0, y1) of the frame, in the coordinates of that part
+        frame_shape = (y1 - y0, x1 - x0) + self.frame_shape[2:]
+        # The tile within the part, in the coordinates of the part; a tile outside it becomes an empty one on its edge
+        tx0, ty0, tx1, ty1 = self.clip(frame_shape, self.x0 - x0, self.y0 - y0, self.x1 - x0, self.y1 - y0)
+        tile = self.tile[ty0 + y0 - self.y0:ty1 + y0 - self.y0, tx0 + x0 - self.x0:tx1 + x0 - self.x0]
+        return TileMask(tile, tx0, ty0, frame_shape, self.outside)
+
+    def to_array(self, single_channel=False):
+        # The full frame mask, with the channels of frame_shape unless single_channel
+        mask = np.full(self.frame_shape[:2], self.outside, np.uint8)
+        mask[self.y0:self.y1, self.x0:self.x1] = self.tile
+        if single_channel or len(self.frame_shape) == 2:
+            return mask
+        return np.repeat(mask[:, :, None], self.frame_shape[2], axis=2)
+
+    def __array__(self, dtype=None, copy=None):
+        mask = self.to_array()
+        return mask if dtype is None else mask.astype(dtype)
+
+    def __getitem__(self, key):
+        return self.to_array()[key]
+
+    def to_arrays(self):
+        # (tile, header) arrays to store the mask in a MapCache
+        return self.tile, np.array([self.x0, self.y0, self.outside, len(self.frame_shape)] + list(self.frame_shape), dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, tile, header):
+        x0, y0, outside, dims = (int(value) for value in header[:4])
+        return cls(tile, x0, y0, tuple(int(value) for value in header[4:4 + dims]), outside)
@@ -0,0 +1,110 @@
+# memory.py
+
+import tracemalloc
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Every estimate below is an upper bound of the peak PeakMemory measures: the per pixel costs are the
+# largest measured on 0.3 to 51 MP photos rounded up, the paste counts the images alive during it.
+# Peak bytes per pixel of the stages.
+# Keyed by use_warp: the resize and blend stages keep more copies of the image than the warp.
+FULL_FRAME_BYTES_PER_PIXEL = {True: 27, False: 30}
+FACE_ROI_BYTES_PER_PIXEL = {True: 11, False: 14}
+# The feature windows of the warp and the eye mask tiles, per pixel of the face box grown by the mask blur margin
+FACE_BYTES_PER_PIXEL = 12
+# The returned photo
+OUTPUT_BYTES_PER_PIXEL = 3
+CROP_BYTES_PER_PIXEL = 3
+# Crop sized images alive while the result is pasted into the photo: the eye stage result and its input,
+# plus the original crop the resize and blend stages (use_warp False) keep for the mouth
+PASTE_CROPS = {True: 2, False: 3}
+# Tiled rendering, per pixel of the rows of the crop one band reads: its warp maps and remap (8 + 3 bytes)
+# and the eye stage on them (see stages.eye_part); plus the eye masks and feature windows, per face pixel
+PART_BYTES_PER_PIXEL = 23
+TILED_FACE_BYTES_PER_PIXEL = 4
+# Landmarks, lookup tables and other small arrays every render keeps, on top of the per pixel costs
+RENDER_OVERHEAD_BYTES = 1024 * 1024
+# Fewest rows a band is cut to before the budget is declared too small
+MIN_BAND_ROWS = 16
+
+
+class MemoryReport:
+    '''
+    How augment_array rendered an image under a memory budget and how much memory it took.
+    mode is 'full frame', 'face roi' or 'tiled' (the face crop in bands of band_rows rows) and estimated_bytes
+    the memory the plan was made for, on top of the input: the upper bound the costs above give.
+    With measure_peak, augment_array also measures the render with PeakMemory into peak_bytes and raises
+    when it exceeds the budget; tracemalloc traces the whole process, so only ask for it where no other
+    thread allocates meanwhile (a batch worker, not the decode and encode threads of stream_augment).
+    '''
+
+    def __init__(self, mode=None, estimated_bytes=0, band_rows=None, budget=None, measure_peak=False):
+        self.mode = mode
+        self.estimated_bytes = estimated_bytes
+        self.band_rows = band_rows
+        self.budget = budget
+        self.measure_peak = measure_peak
+        self.peak_bytes = None
+
+    def record_plan(self, plan):
+        # Copies the plan plan_render made into this report
+        self.mode, self.estimated_bytes, self.band_rows, self.budget = plan.mode, plan.estimated_bytes, plan.band_rows, plan.budget
+
+    def __str__(self):
+        mode = f"{self.mode} ({self.band_rows} row bands)" if self.mode == 'tiled' else self.mode
+        budget = f" of a {self.budget / 2**20:.0f} MB budget" if self.budget is not None else ""
+        peak = f", peak memory {self.peak_bytes / 2**20:.0f} MB" if self.peak_bytes is not None else ""
+        return f"{mode}, estimated memory {self.estimated_bytes / 2**20:.0f} MB{budget}{peak}"
+
+
+class PeakMemory:
+    '''
+    Context manager that measures the peak memory traced by tracemalloc above its level on entry, in peak.
+    numpy arrays, the ones OpenCV returns included, are traced; the scratch buffers OpenCV keeps inside a
+    call are not, they are a few rows. When tracemalloc is already tracing its peak is reset on entry.
+    tracemalloc is process wide: the peak includes what other threads allocate inside the block.
+    '''
+
+    def __enter__(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._base = tracemalloc.get_traced_memory()[0]
+        self.peak = 0
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.peak = tracemalloc.get_traced_memory()[1] - self._base
+        if self._started:
+            tracemalloc.stop()
+        return False
+
+
+def full_frame_bytes(frame_shape, face_pixels, use_warp):
+    return frame_shape[0] * frame_shape[1] * FULL_FRAME_BYTES_PER_PIXEL[use_warp] + face_pixels * FACE_BYTES_PER_PIXEL + RENDER_OVERHEAD_BYTES
+
+
+def paste_bytes(frame_shape, crop_shape, paste_rows, use_warp):
+    # The returned photo, the crop results alive while it is pasted (see PASTE_CROPS) and the band remapped at a time
+    crop = crop_shape[0] * crop_shape[1] * CROP_BYTES_PER_PIXEL
+    return (frame_shape[0] * frame_shape[1] * OUTPUT_BYTES_PER_PIXEL + PASTE_CROPS[use_warp] * crop
+            + min(paste_rows, crop_shape[0]) * crop_shape[1] * CROP_BYTES_PER_PIXEL)
+
+
+def face_roi_bytes(frame_shape, crop_shape, face_pixels, use_warp, paste_rows):
+    # The larger of the stages on the crop and the paste into the photo
+    stages = crop_shape[0] * crop_shape[1] * FACE_ROI_BYTES_PER_PIXEL[use_warp] + face_pixels * FACE_BYTES_PER_PIXEL
+    return max(stages, paste_bytes(frame_shape, crop_shape, paste_rows, use_warp)) + RENDER_OVERHEAD_BYTES
+
+
+def tiled_bytes(frame_shape, face_pixels, part_pixels, paste_rows):
+    # augment_tiles: the eye masks are built before the returned photo, which then holds one band or the in place normalisation
+    output = frame_shape[0] * frame_shape[1] * OUTPUT_BYTES_PER_PIXEL
+    band = part_pixels * PART_BYTES_PER_PIXEL + face_pixels * TILED_FACE_BYTES_PER_PIXEL
+    return max(face_pixels * FACE_BYTES_PER_PIXEL, output + max(band, min(paste_rows, frame_shape[0]) * frame_shape[1] * OUTPUT_BYTES_PER_PIXEL)) + RENDER_OVERHEAD_BYTES
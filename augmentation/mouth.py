@@ -13,6 +13,7 @@ sys.path.append(parent_directory)
 # Import necessary modules
 from landmarking.load import load_feature_landmarks
 from augmentation.resize_overlay import resize_and_overlay_feature
+from augmentation.mask import TileMask
 from utils.img_utils import multi_res_blend, poisson_blend
 
 
@@ -64,8 +65,6 @@ def create_mouth_mask(img, feature_points, width_margin_factor, height_margin_fa
     if not (0 <= width_margin_factor <= 1) or not (0 <= height_margin_factor <= 1):
         raise ValueError("Width and height margin factors must be numbers between 0 and 1.")
     # Create the mask
-    # Create an empty mask
-    mask = np.zeros_like(img)
     # Calculate the minimum and maximum coordinates of the feature points
     x_min, y_min = np.min(feature_points, axis=0).astype(int)
     x_max, y_max = np.max(feature_points, axis=0).astype(int)
@@ -77,9 +76,8 @@ def create_mouth_mask(img, feature_points, width_margin_factor, height_margin_fa
     y_min = max(y_min - height_margin, 0)
     x_max = min(x_max + width_margin, img.shape[1])
     y_max = min(y_max + height_margin, img.shape[0])
-    # Fill the rectangle defined by the adjusted coordinates with white color
-    mask[y_min:y_max, x_min:x_max] = 255
-    return mask
+    # Only the white rectangle defined by the adjusted coordinates is stored, the rest of the mask is black
+    return TileMask.box(img.shape, x_min, y_min, x_max, y_max)
 
 def multiply_mouth_mask(mouth_mask1, mouth_mask2, img, original_img):
     '''
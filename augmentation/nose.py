@@ -13,6 +13,8 @@ sys.path.append(parent_directory)
 # Import necessary modules
 from landmarking.load import load_feature_landmarks
 from augmentation.resize_overlay import resize_and_overlay_feature
+from augmentation.blend import blend, mask_weights
+from augmentation.mask import TileMask
 from utils.img_utils import multi_res_blend, poisson_blend
 
 
@@ -64,8 +66,6 @@ def create_nose_mask(img, feature_points, width_margin_factor, height_margin_fac
     if not (0 <= width_margin_factor <= 1) or not (0 <= height_margin_factor <= 1):
         raise ValueError("Width and height margin factors must be numbers between 0 and 1.")
     # Create the mask
-    # Create an empty mask
-    mask = np.zeros_like(img)
     # Calculate the minimum and maximum coordinates of the feature points
     x_min, y_min = np.min(feature_points, axis=0).astype(int)
     x_max, y_max = np.max(feature_points, axis=0).astype(int)
@@ -77,9 +77,8 @@ def create_nose_mask(img, feature_points, width_margin_factor, height_margin_fac
     y_min = max(y_min - height_margin, 0)
     x_max = min(x_max + width_margin, img.shape[1])
     y_max = min(y_max + height_margin, img.shape[0])
-    # Fill the rectangle defined by the adjusted coordinates with white color
-    mask[y_min:y_max, x_min:x_max] = 255
-    return mask
+    # Only the white rectangle defined by the adjusted coordinates is stored, the rest of the mask is black
+    return TileMask.box(img.shape, x_min, y_min, x_max, y_max)
 
 def multiply_nose_mask(nose_mask1, nose_mask2, img, original_img):
     '''
@@ -88,19 +87,7 @@ def multiply_nose_mask(nose_mask1, nose_mask2, img, original_img):
     The four images are then added together to create the final result.
     This allows the noses to be highlighted in the final image, while the rest of the face is still visible.
     '''
-    # Convert the masks to float32 and normalize them to the range [0, 1]
-    nose_mask1 = nose_mask1.astype(np.float32) / 255
-    nose_mask2 = nose_mask2.astype(np.float32) / 255
-    # Create the inverse masks
-    inverse_nose_mask1 = 1 - nose_mask1
-    inverse_nose_mask2 = 1 - nose_mask2
-    # Multiply the image and original image by the masks and inverse masks respectively
-    img1 = cv2.multiply(img, nose_mask1[:, :, None])
-    img2 = cv2.multiply(img, nose_mask2[:, :, None])
-    original_img1 = cv2.multiply(original_img, inverse_nose_mask1[:, :, None])
-    original_img2 = cv2.multiply(original_img, inverse_nose_mask2[:, :, None])
-    # Add the four images together
-    result = cv2.add(img1, original_img1)
-    result = cv2.add(result, img2)
-    result = cv2.add(result, original_img2)
-    return result
\ No newline at end of file
+    # Blend the image over the original image once per mask, single channel masks are broadcast across the colour channels
+    result = blend(img, original_img, mask_weights(nose_mask1))
+    # Add the two blends together, saturating like cv2.add
+    return cv2.add(result, blend(img, original_img, mask_weights(nose_mask2)))
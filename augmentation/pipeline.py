@@ -0,0 +1,95 @@
+# pipeline.py
+
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import sys
+import os
+
+# Get the current and parent directory
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from augmentation.augment import augment_decoded, augment_params, augmented_path
+
+# Threads decoding and encoding, cv2.imread and cv2.imwrite release the GIL so they overlap with the augmentation
+DEFAULT_DECODE_WORKERS = 2
+DEFAULT_ENCODE_WORKERS = 2
+# Images waiting between two stages, bounds the decoded images alive at once
+DEFAULT_MAX_QUEUED = 4
+
+
+def decode_image(img_path):
+    img = cv2.imread(img_path)
+    if img is None:
+        raise ValueError(f"Could not read image '{img_path}'.")
+    return img
+
+
+def encode_image(augmented_img_path, img):
+    if not cv2.imwrite(augmented_img_path, img):
+        raise ValueError(f"Could not write image '{augmented_img_path}'.")
+    return augmented_img_path
+
+
+def stream_augment(image_paths, landmark_store, feature_stats, augmented_directory, decode_workers=DEFAULT_DECODE_WORKERS,
+                   encode_workers=DEFAULT_ENCODE_WORKERS, max_queued=DEFAULT_MAX_QUEUED, cache=None, use_face_roi=True, use_warp=True,
+                   memory_budget=None):
+    '''
+    Generator that augments image_paths as a three stage stream: a decode thread pool reads the photos ahead,
+    the calling thread augments them one at a time and an encode thread pool writes the results behind it,
+    so reading and writing overlap with the augmentation instead of running between images.
+    At most max_queued images wait to be augmented and at most max_queued results wait to be written.
+    Yields one (img_path, augmented_img_path, error) tuple per image in input order, as augment_batch returns
+    them; error is None on success and the formatted traceback when the image failed.
+    memory_budget (bytes) caps the memory each augmentation is planned with (see AugmentParams), the decoded
+    images waiting for it come on top; the plan and estimated memory of each image are printed (not a measured
+    peak, which would include the images of the decode and encode threads).
+    '''
+    if max_queued < 1:
+        raise ValueError("max_queued must be at least 1.")
+    image_paths = list(image_paths)
+    decoding = deque()
+    encoding = deque()
+    next_index = 0
+    with ThreadPoolExecutor(decode_workers) as decoder, ThreadPoolExecutor(encode_workers) as encoder:
+        try:
+            for img_num, img_path in enumerate(image_paths):
+                # Keep the decoders max_queued images ahead of the augmentation
+                while next_index < len(image_paths) and len(decoding) < max_queued:
+                    decoding.append(decoder.submit(decode_image, image_paths[next_index]))
+                    next_index += 1
+                decoded = decoding.popleft()
+                try:
+                    img = decoded.result()
+                    image_id = landmark_store.image_id(os.path.basename(img_path), img_num)
+                    params = augment_params(image_id, landmark_store, feature_stats, use_face_roi, use_warp, memory_budget)
+                    img = augment_decoded(img, img_path, image_id, landmark_store, params, cache)
+                    augmented_img_path = augmented_path(augmented_directory, img_path)
+                    encoding.append((img_path, encoder.submit(encode_image, augmented_img_path, img), None))
+                except Exception:
+                    encoding.append((img_path, None, traceback.format_exc()))
+                # Only the encoder holds on to the result now
+                img = None
+                # Hand back finished results in order, waiting for the oldest when too many are queued
+                while encoding and (len(encoding) > max_queued or encoding[0][1] is None or encoding[0][1].done()):
+                    yield _encoded_result(encoding.popleft())
+            while encoding:
+                yield _encoded_result(encoding.popleft())
+        finally:
+            # The consumer stopped early (or failed), drop the work that has not started
+            for future in decoding:
+                future.cancel()
+
+
+def _encoded_result(entry):
+    img_path, encoded, error = entry
+    if encoded is None:
+        return img_path, None, error
+    try:
+        return img_path, encoded.result(), None
+    except Exception:
+        return img_path, None, traceback.format_exc()
@@ -0,0 +1,130 @@
+# roi.py
+
+import copy
+import numpy as np
+import cv2
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from landmarking.load import load_feature_landmarks
+from augmentation.make_image import calculate_reductions, stage_affines
+
+# Padding around the jawline and eyebrows, as a fraction of the face size
+FACE_ROI_PADDING = 0.25
+# Extra pixels for the widest mask blur (the nose and mouth masks, sigma 21, reach 63 px)
+MASK_BLUR_MARGIN = 100
+# Extra pixels for the sigma 8 blur make_face_img applies after its transform
+FACE_BLUR_MARGIN = 26
+# Rows of the crop paste_normalized remaps at a time, so no crop sized temporary is made
+PASTE_ROWS = 256
+
+
+class FaceROI:
+    '''
+    A rectangle [x0, x1) x [y0, y1) of a photo (frame) that contains everything the augmentation changes.
+    The stages run on crop(frame) with landmarks from crop_features(); make_img uses x0, y0 and
+    frame_shape to apply its full photo transforms to the crop, and paste_normalized() puts the
+    result back with the same min-max normalisation augment_eyes applies to a full photo.
+    '''
+
+    def __init__(self, frame, x0, y0, x1, y1):
+        self.frame = frame
+        self.frame_shape = frame.shape
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        # Range of the pixels outside the crop, they take part in the min-max normalisation
+        bands = [frame[:y0], frame[y1:], frame[y0:y1, :x0], frame[y0:y1, x1:]]
+        bands = [band for band in bands if band.size]
+        self.outside_min = min((int(band.min()) for band in bands), default=255)
+        self.outside_max = max((int(band.max()) for band in bands), default=0)
+
+    @property
+    def shape(self):
+        return (self.y1 - self.y0, self.x1 - self.x0) + tuple(self.frame_shape[2:])
+
+    def crop(self, img=None):
+        # Copy of the crop of img (default: the frame), the stages write into their input
+        img = self.frame if img is None else img
+        return img[self.y0:self.y1, self.x0:self.x1].copy()
+
+    def crop_features(self, facial_features):
+        # Landmark rows with x and y relative to the crop
+        features = np.array(facial_features, dtype=np.int64)
+        features[:, 3] -= self.x0
+        features[:, 4] -= self.y0
+        return features
+
+    def sub_roi(self, x0, y0, x1, y1):
+        '''
+        FaceROI of the part [x0, x1) x [y0, y1) of this crop, for running make_img on part of it.
+        The range outside is left that of this ROI, so paste_normalized is only meant for the ROI itself.
+        '''
+        part = copy.copy(self)
+        part.x0, part.y0, part.x1, part.y1 = self.x0 + x0, self.y0 + y0, self.x0 + x1, self.y0 + y1
+        return part
+
+    def paste_normalized(self, result):
+        '''
+        Min-max normalises result (the uint8 crop augment_eyes builds) together with the untouched pixels
+        outside the crop and returns the full photo, as cv2.normalize on the full result would.
+        '''
+        lut = normalization_lut(min(int(result.min()), self.outside_min), max(int(result.max()), self.outside_max))
+        # The pixels only need remapping when the normalisation is not the identity
+        if np.array_equal(lut, np.arange(256)):
+            output = self.frame.copy()
+            output[self.y0:self.y1, self.x0:self.x1] = result
+        else:
+            output = cv2.LUT(self.frame, lut)
+            for start in range(0, result.shape[0], PASTE_ROWS):
+                stop = min(start + PASTE_ROWS, result.shape[0])
+                output[self.y0 + start:self.y0 + stop, self.x0:self.x1] = cv2.LUT(result[start:stop], lut)
+        return output
+
+
+def normalization_lut(low, high):
+    # The lookup table of the min-max normalisation of a uint8 image whose range is [low, high]
+    scale = 255/(high - low) if high > low else 0
+    return np.clip(np.rint((np.arange(256) - low)*scale), 0, 255).astype(np.uint8)
+
+
+def normalize_in_place(img, rows=PASTE_ROWS):
+    # cv2.normalize(img, NORM_MINMAX) of a uint8 image as paste_normalized does it, written back into img a band of rows at a time
+    lut = normalization_lut(int(img.min()), int(img.max()))
+    if not np.array_equal(lut, np.arange(256)):
+        for start in range(0, img.shape[0], rows):
+            img[start:start + rows] = cv2.LUT(img[start:start + rows], lut)
+    return img
+
+
+def face_roi(img, facial_features, image_id, feature_to_int, padding=FACE_ROI_PADDING):
+    '''
+    Returns the FaceROI the augmentation of this face needs: the jawline and eyebrow box, padded by padding
+    times the face size plus the mask blur reach, then grown to cover the pixels the eye and face
+    transforms of make_img sample for it. Returns None when the transforms cannot be localised (make_img
+    then fails on the full photo in the same way it always has).
+    '''
+    face_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'jawline')
+    eyebrow_landmarks = load_feature_landmarks(facial_features, image_id, feature_to_int, 'eyebrows')
+    h, w = img.shape[:2]
+    points = np.vstack([face_landmarks, eyebrow_landmarks])
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    margin = int(padding*max(x_max - x_min, y_max - y_min)) + MASK_BLUR_MARGIN
+    x0, y0 = max(x_min - margin, 0), max(y_min - margin, 0)
+    x1, y1 = min(x_max + margin + 1, w), min(y_max + margin + 1, h)
+
+    height_reduced, width_reduced = calculate_reductions(face_landmarks, eyebrow_landmarks, img)[:2]
+    if height_reduced < 0 or width_reduced < 0:
+        return None
+    # Grow the box by the positions the transforms read for it (plus the face blur) so no sample falls outside the crop
+    corners = np.array([[x0 - FACE_BLUR_MARGIN, y0 - FACE_BLUR_MARGIN, 1], [x1 + FACE_BLUR_MARGIN, y1 + FACE_BLUR_MARGIN, 1]])
+    for affine in stage_affines(height_reduced, width_reduced, w, h):
+        (sx0, sy0), (sx1, sy1) = corners @ affine.T
+        x0, y0 = min(x0, int(np.floor(sx0)) - 1), min(y0, int(np.floor(sy0)) - 1)
+        x1, y1 = max(x1, int(np.ceil(sx1)) + 2), max(y1, int(np.ceil(sy1)) + 2)
+    return FaceROI(img, max(x0, 0), max(y0, 0), min(x1, w), min(y1, h))
@@ -0,0 +1,130 @@
+# smooth.py
+
+import functools
+import numpy as np
+import cv2
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Largest reduction tried, past it the resizes cost more than the blur they save
+MAX_FACTOR = 16
+# The reduced kernel keeps at least this many taps, below that the blur is cheap at full size
+MIN_REDUCED_TAPS = 7
+
+
+def gaussian_radius(ksize, sigma):
+    # Reach of cv2.GaussianBlur on a uint8 image, the kernel size it derives from sigma when ksize is 0
+    return gaussian_ksize(ksize, sigma) // 2
+
+
+def gaussian_ksize(ksize, sigma):
+    if ksize <= 0:
+        ksize = int(round(sigma * 3 * 2 + 1)) | 1
+    return ksize
+
+
+def reduced_kernel(kernel, factor):
+    '''
+    Kernel that blurs an image reduced factor times by area averaging the way kernel blurs the full image:
+    kernel spread over one reduced pixel (a box of factor pixels, half weights at the ends for an even factor)
+    and sampled every factor pixels from its centre. The taps still sum to 1.
+    '''
+    box = np.ones(factor) if factor % 2 else np.r_[0.5, np.ones(factor - 1), 0.5]
+    spread = np.convolve(kernel, box / factor)
+    centre = len(spread) // 2
+    taps = centre // factor
+    return spread[centre - taps * factor:centre + taps * factor + 1:factor] * factor
+
+
+def reduced_blur_1d(signal, kernel, factor):
+    # The reduce, blur, enlarge path of smooth() on the rows of a 2D array whose length is a multiple of factor
+    length = signal.shape[0]
+    reduced = signal.reshape(length // factor, factor, -1).mean(axis=1)
+    small = reduced_kernel(kernel, factor)
+    padded = np.pad(reduced, ((len(small) // 2,) * 2, (0, 0)), mode='edge')
+    blurred = sum(tap * padded[n:n + len(reduced)] for n, tap in enumerate(small))
+    # cv2.resize INTER_LINEAR reads full pixel x at reduced position (x + 0.5) / factor - 0.5, clamped to the ends
+    position = np.clip((np.arange(length) + 0.5) / factor - 0.5, 0, len(reduced) - 1)
+    low = np.floor(position).astype(int)
+    high = np.minimum(low + 1, len(reduced) - 1)
+    weight = (position - low)[:, None]
+    return blurred[low] * (1 - weight) + blurred[high] * weight
+
+
+@functools.lru_cache(maxsize=None)
+def reduction_error(ksize, sigma, factor):
+    '''
+    Largest difference, in mask levels, between the reduced path of smooth() and the full blur on a straight
+    edge from 0 to 255, over every position of the edge within a reduced pixel, counted once per axis.
+    Masks are a few smooth blobs more than a kernel across, so every pixel is close to the error of its
+    nearest edge; the row sum bound over every possible input is far larger, it is set by aliasing of
+    patterns masks never contain.
+    '''
+    if factor == 1:
+        return 0.0
+    kernel = cv2.getGaussianKernel(ksize, sigma).ravel()
+    reach = ksize // 2
+    length = factor * (4 * (reach // factor + 1) + 8)
+    worst = 0.0
+    for phase in range(factor):
+        step = np.zeros((length, 1))
+        step[length // 2 + phase:] = 1
+        exact = np.convolve(np.pad(step[:, 0], reach, mode='edge'), kernel, mode='valid')
+        reduced = reduced_blur_1d(step, kernel, factor)[:, 0]
+        # Leave out the ends, where the two paths see different borders
+        worst = max(worst, np.abs(reduced - exact)[reach:length - reach].max())
+    return 2 * 255 * worst
+
+
+@functools.lru_cache(maxsize=None)
+def smoothing_factor(ksize, sigma, tolerance):
+    '''
+    Largest reduction of smooth() whose results stay within tolerance mask levels of cv2.GaussianBlur
+    (one level goes to rounding both to uint8), 1 when none does and the blur is done at full size.
+    '''
+    ksize = gaussian_ksize(ksize, sigma)
+    best = 1
+    for factor in range(2, MAX_FACTOR + 1):
+        if ksize // factor < MIN_REDUCED_TAPS:
+            break
+        if reduction_error(ksize, sigma, factor) + 1 <= tolerance:
+            best = factor
+    return best
+
+
+def smooth(mask, ksize, sigma, tolerance=0, frame_edges=(False, False, False, False)):
+    '''
+    cv2.GaussianBlur(mask, (ksize, ksize), sigma) of a single channel uint8 mask, within tolerance levels.
+    Large kernels are applied to the mask reduced smoothing_factor() times by area averaging, with the
+    kernel reduced to match (see reduced_kernel), and the result is enlarged back with linear interpolation;
+    the cost falls with the square of the factor. With tolerance 0 this is cv2.GaussianBlur itself.
+    The full blur reflects at the image border, frame_edges (top, bottom, left, right) says which sides of
+    mask are the border so the reduced path reflects there too; the other sides are taken to continue with
+    the value of their edge pixels for at least the blur reach, as the sides of a padded TileMask tile do.
+    '''
+    factor = smoothing_factor(ksize, sigma, tolerance)
+    if factor == 1:
+        return cv2.GaussianBlur(mask, (ksize, ksize), sigma)
+    ksize = gaussian_ksize(ksize, sigma)
+    kernel = reduced_kernel(cv2.getGaussianKernel(ksize, sigma).ravel(), factor).astype(np.float32)
+    # Margin for the reduced kernel and the interpolation, reflected at the border and repeated elsewhere
+    margin = ksize // 2 + 2 * factor
+    height, width = mask.shape[:2]
+    reflected = [margin if edge else 0 for edge in frame_edges]
+    padded = cv2.copyMakeBorder(mask, *reflected, cv2.BORDER_REFLECT_101)
+    repeated = [margin - amount for amount in reflected]
+    # Round the size up to whole reduced pixels
+    repeated[1] += -(height + 2 * margin) % factor
+    repeated[3] += -(width + 2 * margin) % factor
+    padded = cv2.copyMakeBorder(padded, *repeated, cv2.BORDER_REPLICATE)
+    size = (padded.shape[1] // factor, padded.shape[0] // factor)
+    reduced = cv2.resize(padded.astype(np.float32), size, interpolation=cv2.INTER_AREA)
+    reduced = cv2.sepFilter2D(reduced, -1, kernel, kernel, borderType=cv2.BORDER_REPLICATE)
+    enlarged = cv2.resize(reduced, (padded.shape[1], padded.shape[0]), interpolation=cv2.INTER_LINEAR)
+    result = enlarged[margin:margin + height, margin:margin + width]
+    return np.clip(np.rint(result), 0, 255).astype(np.uint8)
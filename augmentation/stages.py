@@ -0,0 +1,167 @@
+# stages.py
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from augmentation.cache import MapCache, DEFAULT_MEMORY_BYTES
+from augmentation.make_image import make_img, calculate_reductions, stage_affines
+from augmentation.roi import FACE_BLUR_MARGIN
+
+# Images whose last eye stage input and result are kept for partial updates
+LATEST_IMAGES = 4
+# Share of the crop above which the eye stage is rerun in full instead of in part
+PARTIAL_UPDATE_LIMIT = 0.5
+
+
+class StageCache:
+    '''
+    Memoizes the output of every augmentation stage (see augment_stages) under a key chained from the input
+    image and landmarks plus the parameters of that stage and of every stage before it. Re-rendering an image
+    with one changed parameter then only reruns that stage and the ones after it, and going back to an
+    earlier value reruns nothing.
+    The eye stage has no parameters of its own; after a change upstream it is redone only in the part of
+    the image the change reaches, starting from its latest result for the image (see update_eye_result).
+    Outputs are kept in the memory tier of a MapCache of max_bytes, which also holds the warp grids and masks
+    when augment_array is given no cache of its own.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES):
+        self.results = MapCache(max_bytes)
+        self._latest = OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, stage, key_parts, compute):
+        # Returns the key and the (memoized) output tuple of a stage, the key is a key part of the next stage
+        key = MapCache.key(stage, *key_parts)
+        return key, self.results.get_or_compute(key, compute)
+
+    def latest(self, image_key):
+        # (eye stage input, eye stage result) of the last render of an image, or None
+        with self._lock:
+            if image_key not in self._latest:
+                return None
+            self._latest.move_to_end(image_key)
+            return self._latest[image_key]
+
+    def remember_latest(self, image_key, stage_input, result):
+        with self._lock:
+            self._latest[image_key] = (stage_input, result)
+            self._latest.move_to_end(image_key)
+            while len(self._latest) > LATEST_IMAGES:
+                self._latest.popitem(last=False)
+
+    def stats(self):
+        return self.results.stats()
+
+
+def changed_box(previous, current):
+    # Bounding box (x0, y0, x1, y1) of the pixels that differ between two images, None when they are equal
+    changed = previous != current
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+    return int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1
+
+
+def grow_box(box, margin, shape):
+    # Box grown by margin on every side and clipped to an image of shape
+    x0, y0, x1, y1 = box
+    return max(x0 - margin, 0), max(y0 - margin, 0), min(x1 + margin, shape[1]), min(y1 + margin, shape[0])
+
+
+def union_box(*boxes):
+    return min(box[0] for box in boxes), min(box[1] for box in boxes), max(box[2] for box in boxes), max(box[3] for box in boxes)
+
+
+def affine_reach(affine, box, roi, shape):
+    '''
+    Box of the result pixels of a stage_affines transform that sample the input pixels in box.
+    Boxes are in crop coordinates and the transform in full photo coordinates; it only scales and shifts,
+    and a bilinear sample at s reads the pixels within one of s, hence the one pixel margins.
+    '''
+    x0, y0, x1, y1 = box
+    offsets = (roi.x0, roi.y0)
+    lows, highs = [], []
+    for axis, (low, high) in enumerate([(x0, x1), (y0, y1)]):
+        scale, shift = affine[axis, axis], affine[axis, 2]
+        lows.append(int(np.floor((low + offsets[axis] - 1 - shift) / scale)) - offsets[axis] - 1)
+        highs.append(int(np.ceil((high + offsets[axis] - shift) / scale)) - offsets[axis] + 2)
+    return grow_box((lows[0], lows[1], highs[0], highs[1]), 0, shape)
+
+
+def affine_sources(affine, box, roi, shape):
+    # Box of the input pixels the result pixels in box sample under a stage_affines transform
+    x0, y0, x1, y1 = box
+    offsets = (roi.x0, roi.y0)
+    lows, highs = [], []
+    for axis, (low, high) in enumerate([(x0, x1), (y0, y1)]):
+        scale, shift = affine[axis, axis], affine[axis, 2]
+        lows.append(int(np.floor(scale * (low + offsets[axis]) + shift)) - offsets[axis] - 1)
+        highs.append(int(np.ceil(scale * (high + offsets[axis]) + shift)) - offsets[axis] + 2)
+    return grow_box((lows[0], lows[1], highs[0], highs[1]), 0, shape)
+
+
+def eye_sources(dirty, eye_affine, face_affine, roi, shape):
+    # Box of the input pixels the eye stage reads for the result pixels in dirty, the face image is needed over the blur reach around them
+    blurred = grow_box(dirty, FACE_BLUR_MARGIN, shape)
+    return union_box(blurred, affine_sources(eye_affine, dirty, roi, shape), affine_sources(face_affine, blurred, roi, shape))
+
+
+def eye_part(part, masks, face_landmarks, eyebrow_landmarks, roi, dirty, sources):
+    '''
+    The result pixels in the box dirty of the eye stage (the two make_img calls of eye_result) on a face crop
+    of roi, computed from part, the pixels of the crop in the box sources (see eye_sources), only.
+    '''
+    x0, y0, x1, y1 = sources
+    part_roi = roi.sub_roi(x0, y0, x1, y1)
+    face_landmarks, eyebrow_landmarks = face_landmarks - [x0, y0], eyebrow_landmarks - [x0, y0]
+    reduced_eyes_mask, blurred_eyes_mask = masks
+    result = make_img(part, blurred_eyes_mask.crop(x0, y0, x1, y1), face_landmarks, eyebrow_landmarks, part, "blurred_eyes_mask", part_roi)
+    result = make_img(part, reduced_eyes_mask.crop(x0, y0, x1, y1), face_landmarks, eyebrow_landmarks, result, "reduced_eyes_mask", part_roi)
+    dx0, dy0, dx1, dy1 = dirty
+    return result[dy0 - y0:dy1 - y0, dx0 - x0:dx1 - x0]
+
+
+def update_eye_result(previous_input, previous_result, img, masks, face_landmarks, eyebrow_landmarks, roi):
+    '''
+    Returns the eye stage result (the two make_img calls of eye_result) for img, a face crop of roi, given
+    the result previous_result of the same stage for previous_input.
+    Only the pixels whose inputs differ are recomputed: the changed box of the input, the result pixels the
+    eye and face transforms map onto it, and those within the face blur of the latter. They are computed on
+    the smallest part of img that holds every pixel they read. Returns None when the shapes differ or the
+    part is larger than PARTIAL_UPDATE_LIMIT of the crop, the caller then reruns the stage in full.
+    '''
+    if previous_input.shape != img.shape:
+        return None
+    changed = changed_box(previous_input, img)
+    if changed is None:
+        return previous_result
+    shape = img.shape
+    height_reduced, width_reduced, h, w, c = calculate_reductions(face_landmarks, eyebrow_landmarks, img, roi)
+    eye_affine, face_affine = stage_affines(height_reduced, width_reduced, w, h)
+
+    # Result pixels that change: the blends read the input directly, the eye image through its transform
+    # and the face image through its transform followed by the face blur
+    dirty = union_box(changed, affine_reach(eye_affine, changed, roi, shape),
+                      grow_box(affine_reach(face_affine, changed, roi, shape), FACE_BLUR_MARGIN, shape))
+    sources = eye_sources(dirty, eye_affine, face_affine, roi, shape)
+    if (sources[2] - sources[0]) * (sources[3] - sources[1]) > PARTIAL_UPDATE_LIMIT * shape[0] * shape[1]:
+        return None
+
+    output = previous_result.copy()
+    dx0, dy0, dx1, dy1 = dirty
+    x0, y0, x1, y1 = sources
+    output[dy0:dy1, dx0:dx1] = eye_part(img[y0:y1, x0:x1], masks, face_landmarks, eyebrow_landmarks, roi, dirty, sources)
+    return output
@@ -0,0 +1,150 @@
+# warp.py
+
+import numpy as np
+import cv2
+import sys
+import os
+
+# Get the current directory and parent directory for importing modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Import necessary modules
+from landmarking.load import load_feature_landmarks
+
+# How each feature is exaggerated, in the order the warps are applied.
+# region: margins of the box that is scaled about its centre (those of resize_nose / resize_mouth / resize_eyes)
+# mask: margins of the box whose blurred edge fades the warp out (those of create_nose_mask / create_mouth_mask)
+# double_blend: augment_nose blends twice, which turns the mask weight m into 1 - (1 - m)^2
+FEATURE_WARPS = {
+    'nose': {'region': (0.6, 0.7), 'mask': (0.4, 0.1), 'double_blend': True},
+    'lips': {'region': (0.8, 0.1), 'mask': (0.1, 0.1), 'double_blend': False},
+    'eyes': {'region': (0.25, 0.4), 'mask': (0.25, 0.4), 'double_blend': False},
+}
+# Sigma of the mask blur, as in augment_nose and augment_mouth
+MASK_SIGMA = 21
+
+
+def feature_box(points, width_margin_factor, height_margin_factor, shape):
+    # Landmark bounding box plus margins, clipped to the image, the same box create_nose_mask fills
+    x_min, y_min = np.min(points, axis=0).astype(int)
+    x_max, y_max = np.max(points, axis=0).astype(int)
+    width_margin = int((x_max - x_min) * width_margin_factor)
+    height_margin = int((y_max - y_min) * height_margin_factor)
+    return (max(x_min - width_margin, 0), max(y_min - height_margin, 0),
+            min(x_max + width_margin, shape[1]), min(y_max + height_margin, shape[0]))
+
+
+def scale_centre(points, width_margin_factor, height_margin_factor, shape):
+    # Centre the scaled region of resize_and_overlay_feature is pasted around, margins shrink the same way it does
+    x_min, y_min = np.min(points, axis=0).astype(int)
+    x_max, y_max = np.max(points, axis=0).astype(int)
+    width_margin = int((x_max - x_min) * width_margin_factor)
+    height_margin = int((y_max - y_min) * height_margin_factor)
+    if (x_max - x_min - 2 * width_margin <= 0) or (y_max - y_min - 2 * height_margin <= 0):
+        width_margin = (x_max - x_min) // 2
+        height_margin = (y_max - y_min) // 2
+    x_min, y_min = max(x_min - width_margin, 0), max(y_min - height_margin, 0)
+    x_max, y_max = min(x_max + width_margin, shape[1]), min(y_max + height_margin, shape[0])
+    return (x_min + x_max) / 2 - 0.5, (y_min + y_max) / 2 - 0.5
+
+
+def blurred_box_profiles(box, shape, sigma=MASK_SIGMA):
+    '''
+    Returns the row and column profiles of a filled box blurred with a Gaussian of sigma.
+    The blur of a box is separable, so np.outer(profile_y, profile_x) equals GaussianBlur of the box mask
+    (divided by 255) without ever building or blurring a full size mask.
+    '''
+    x0, y0, x1, y1 = box
+    kernel = cv2.getGaussianKernel(int(round(sigma * 3 * 2 + 1)) | 1, sigma, cv2.CV_32F)
+    profiles = []
+    for start, stop, length in [(y0, y1, shape[0]), (x0, x1, shape[1])]:
+        indicator = np.zeros((1, length), dtype=np.float32)
+        indicator[0, start:stop] = 1
+        profiles.append(cv2.sepFilter2D(indicator, -1, kernel, np.ones((1, 1), np.float32), borderType=cv2.BORDER_REFLECT_101)[0])
+    return profiles[0], profiles[1]
+
+
+def feature_displacement(shape, points, scale_factor, region, mask, double_blend, rows=None):
+    '''
+    Returns the displacement that scales a feature by scale_factor about its centre:
+    the pixel at p is read from p + w(p) * (c + (p - c) / scale_factor - p), where w is the blurred box weight.
+    Where w is 1 this is exactly the resize of resize_and_overlay_feature; where the mask fades out the
+    warp fades out with it instead of cross-fading two images.
+    The result is (x0, y0, dx, dy), dx and dy covering only the window from (x0, y0) where w is not zero,
+    and only its rows within rows=(y0, y1) when given.
+    '''
+    centre_x, centre_y = scale_centre(points, region[0], region[1], shape)
+    profile_y, profile_x = blurred_box_profiles(feature_box(points, mask[0], mask[1], shape), shape)
+    if rows is not None:
+        profile_y = profile_y.copy()
+        profile_y[:max(rows[0], 0)] = 0
+        profile_y[max(rows[1], 0):] = 0
+    nonzero_rows, columns = np.flatnonzero(profile_y), np.flatnonzero(profile_x)
+    if len(nonzero_rows) == 0 or len(columns) == 0:
+        return 0, 0, np.zeros((0, 0), np.float32), np.zeros((0, 0), np.float32)
+    y0, y1, x0, x1 = nonzero_rows[0], nonzero_rows[-1] + 1, columns[0], columns[-1] + 1
+    weights = np.outer(profile_y[y0:y1], profile_x[x0:x1])
+    if double_blend:
+        weights = 1 - (1 - weights)**2
+    weights *= np.float32(1 - 1 / scale_factor)
+    dx = (centre_x - np.arange(x0, x1, dtype=np.float32))[None, :] * weights
+    dy = (centre_y - np.arange(y0, y1, dtype=np.float32))[:, None] * weights
+    return x0, y0, dx, dy
+
+
+def build_warp_maps(shape, facial_features, image_id, feature_to_int, scale_factors, rows=None):
+    '''
+    Turns per feature scale factors ({'nose': 1.2, 'lips': 1.1, ...}, applied in FEATURE_WARPS order) into
+    one pair of float32 cv2.remap maps for an image of the given shape.
+    Later features see the image the earlier ones produced, as the separate stages did, so the maps are
+    composed (the earlier displacement is sampled at the positions the later one reads) rather than added.
+    rows=(y0, y1) only builds those rows of the maps, the same values as the full maps have there.
+    The maps only depend on the landmarks, the scale factors and the shape, so they can be cached.
+    '''
+    height, width = shape[:2]
+    y_start, y_stop = rows if rows is not None else (0, height)
+    map_x = np.tile(np.arange(width, dtype=np.float32), (y_stop - y_start, 1))
+    map_y = np.repeat(np.arange(y_start, y_stop, dtype=np.float32)[:, None], width, axis=1)
+    warps = [name for name in FEATURE_WARPS if scale_factors.get(name, 1) != 1]
+    # Compose from the last feature back: total(p) = first(second(...last(p))). max_shift bounds how far
+    # the maps built so far move any pixel, which limits where an earlier displacement can be read from.
+    max_shift = 0
+    for name in reversed(warps):
+        settings = FEATURE_WARPS[name]
+        points = load_feature_landmarks(facial_features, image_id, feature_to_int, name)
+        # Only the rows the maps built so far can read from
+        pad = int(np.ceil(max_shift)) + 1
+        window_rows = (y_start - pad, y_stop + pad) if rows is not None else None
+        x0, y0, dx, dy = feature_displacement((height, width), points, scale_factors[name], settings['region'], settings['mask'], settings['double_blend'], window_rows)
+        if dx.size == 0:
+            continue
+        # Sampling a displacement never makes it larger, so its own largest shift bounds the composed one too
+        shift = max(float(np.abs(dx).max()), float(np.abs(dy).max()))
+        if max_shift > 0:
+            # Sample this displacement where the later warps read, over the output pixels that can reach its window
+            wx0, wy0 = max(x0 - pad, 0), max(y0 - pad, y_start)
+            wx1, wy1 = min(x0 + dx.shape[1] + pad, width), min(y0 + dx.shape[0] + pad, y_stop)
+            if wy1 <= wy0:
+                max_shift += shift
+                continue
+            read_x, read_y = map_x[wy0 - y_start:wy1 - y_start, wx0:wx1] - np.float32(x0), map_y[wy0 - y_start:wy1 - y_start, wx0:wx1] - np.float32(y0)
+            dx = cv2.remap(dx, read_x, read_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+            dy = cv2.remap(dy, read_x, read_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+            x0, y0 = wx0, wy0
+        else:
+            # Only the rows of the window that fall in rows
+            top, bottom = max(y_start - y0, 0), max(min(y_stop - y0, dx.shape[0]), 0)
+            dx, dy, y0 = dx[top:bottom], dy[top:bottom], y0 + top
+        if dx.size:
+            map_x[y0 - y_start:y0 - y_start + dx.shape[0], x0:x0 + dx.shape[1]] += dx
+            map_y[y0 - y_start:y0 - y_start + dy.shape[0], x0:x0 + dy.shape[1]] += dy
+        max_shift += shift
+    return map_x, map_y
+
+
+def warp_image(img, maps):
+    # Applies maps from build_warp_maps to img in one resampling pass
+    map_x, map_y = maps
+    return cv2.remap(img, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
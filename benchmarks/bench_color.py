@@ -0,0 +1,62 @@
+# bench_color.py
+# Timing and agreement of the YCbCr conversions of utils.color against the float64 / float32 numpy versions
+# img_utils used to run, for the cv2.transform path, the fixed point path and the Y only conversion.
+# Usage: python benchmarks/bench_color.py [--megapixels 1 4 12]
+
+import argparse
+import time
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.color import ycbcr_from_rgb, rgb_from_ycbcr
+
+
+def numpy_ycbcr(image):
+    ycbcr = image.dot(np.array([[.299, .587, .114], [-.1687, -.3313, .5], [.5, -.4187, -.0813]]).T)
+    ycbcr[:, :, [1, 2]] += 128
+    return np.clip(ycbcr, 0, 255).astype(np.uint8)
+
+
+def numpy_rgb(image):
+    image = image.astype(np.float32)
+    Y, Cb, Cr = image[:, :, 0], image[:, :, 1] - 128, image[:, :, 2] - 128
+    return np.clip(np.stack((Y + 1.402 * Cr, Y - 0.344136 * Cb - 0.714136 * Cr, Y + 1.772 * Cb), axis=-1), 0, 255).astype(np.uint8)
+
+
+def best_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def benchmark(megapixels, repeats=3):
+    rng = np.random.default_rng(0)
+    print("Conversion time (ms) and share of pixels off the numpy conversion (all within one level)")
+    print(f"{'MP':>5}{'direction':>11}{'numpy':>9}{'transform':>11}{'off':>8}{'fixed':>9}{'off':>8}{'Y only':>9}")
+    for size in megapixels:
+        width = int(np.sqrt(size * 1e6 * 4 / 3))
+        image = rng.integers(0, 256, (width * 3 // 4, width, 3), dtype=np.uint8)
+        out = np.empty_like(image)
+        for direction, reference, convert in [('to YCbCr', numpy_ycbcr, ycbcr_from_rgb), ('to RGB', numpy_rgb, rgb_from_ycbcr)]:
+            numpy_time, expected = best_time(lambda: reference(image), repeats)
+            row = f"{size:>5}{direction:>11}{numpy_time * 1000:>9.1f}"
+            for fixed_point in (False, True):
+                convert_time, result = best_time(lambda: convert(image, out=out, fixed_point=fixed_point), repeats)
+                row += f"{convert_time * 1000:>{11 if not fixed_point else 9}.1f}{np.mean(result != expected):>8.2%}"
+            if convert is ycbcr_from_rgb:
+                row += f"{best_time(lambda: ycbcr_from_rgb(image, y_only=True), repeats)[0] * 1000:>9.1f}"
+            print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the utils.color conversions with the numpy ones they replace.")
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4, 12])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.megapixels, args.repeats)
@@ -0,0 +1,87 @@
+# bench_detection.py
+# Accuracy report and timing for coarse to fine face detection (landmarking.landmark.detect_faces).
+# Usage: python benchmarks/bench_detection.py [image_directory] [--max-sides 640 1000 1500]
+
+import argparse
+import time
+import cv2
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from landmarking.landmark import detect_faces, predictor
+from utils.file_utils import get_dir
+
+
+def landmarks_for(gray, detection_max_side):
+    # Returns a (faces, 68, 2) array of landmarks and the time the detector plus predictor took
+    start = time.perf_counter()
+    faces = detect_faces(gray, detection_max_side)
+    points = []
+    for face in faces:
+        shape = predictor(gray, face)
+        points.append([(shape.part(n).x, shape.part(n).y) for n in range(68)])
+    elapsed = time.perf_counter() - start
+    return np.array(points, dtype=np.float64).reshape(-1, 68, 2), elapsed
+
+
+def inter_ocular(points):
+    # Distance between the outer eye corners, the usual normaliser for landmark error
+    return np.linalg.norm(points[36] - points[45])
+
+
+def accuracy_report(image_paths, max_sides):
+    print("Accuracy of coarse detection against the full resolution path")
+    print(f"{'image':<32}{'max side':>10}{'faces':>8}{'mean px':>10}{'max px':>10}{'mean NME':>10}{'speedup':>10}")
+    for path in image_paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        reference, reference_time = landmarks_for(gray, None)
+        for max_side in max_sides:
+            coarse, coarse_time = landmarks_for(gray, max_side)
+            faces = f"{len(coarse)}/{len(reference)}"
+            if len(coarse) != len(reference) or len(reference) == 0:
+                print(f"{os.path.basename(path):<32}{max_side:>10}{faces:>8}{'-':>10}{'-':>10}{'-':>10}{reference_time / coarse_time:>10.2f}")
+                continue
+            # Pair faces by box centre so a different detection order does not count as an error
+            errors, normalised = [], []
+            for face in reference:
+                match = coarse[np.argmin([np.linalg.norm(face.mean(0) - other.mean(0)) for other in coarse])]
+                error = np.linalg.norm(face - match, axis=1)
+                errors.append(error)
+                normalised.append(error.mean() / inter_ocular(face))
+            errors = np.concatenate(errors)
+            print(f"{os.path.basename(path):<32}{max_side:>10}{faces:>8}{errors.mean():>10.2f}{errors.max():>10.2f}{np.mean(normalised):>10.4f}{reference_time / coarse_time:>10.2f}")
+
+
+def resolution_benchmark(image_paths, max_sides, resolutions, repeats=3):
+    print("\nDetection plus landmarking time (s) by input long side")
+    header = f"{'long side':>10}{'full res':>10}" + ''.join(f"{'coarse ' + str(m):>14}" for m in max_sides)
+    print(header)
+    grays = [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in image_paths]
+    grays = [gray for gray in grays if gray is not None]
+    for resolution in resolutions:
+        resized = []
+        for gray in grays:
+            scale = resolution / max(gray.shape[:2])
+            resized.append(cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR))
+        row = f"{resolution:>10}"
+        for max_side in [None] + list(max_sides):
+            best = min(sum(landmarks_for(gray, max_side)[1] for gray in resized) for _ in range(repeats))
+            row += f"{best / len(resized):>10.3f}" if max_side is None else f"{best / len(resized):>14.3f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare coarse to fine face detection with the full resolution path.")
+    parser.add_argument('image_directory', nargs='?', default=get_dir('data/original_images'))
+    parser.add_argument('--max-sides', type=int, nargs='+', default=[640, 1000, 1500])
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[1000, 2000, 3000, 4032])
+    args = parser.parse_args()
+    image_paths = sorted(os.path.join(args.image_directory, filename) for filename in os.listdir(args.image_directory)
+                         if filename.lower().endswith(('.png', '.jpg', '.jpeg')))
+    accuracy_report(image_paths, args.max_sides)
+    resolution_benchmark(image_paths, args.max_sides, args.resolutions)
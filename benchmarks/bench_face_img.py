@@ -0,0 +1,70 @@
+# bench_face_img.py
+# Timing and peak memory of the face image of the eye stage: the 2x upscale, border and resize back that
+# make_face_img used to run on the full frame against its single warp restricted to the box of the eye mask.
+# Usage: python benchmarks/bench_face_img.py [--sides 1000 2000 4000]
+
+import argparse
+import time
+import cv2
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.make_image import make_face_img, prepare_masks
+from augmentation.mask import TileMask
+from augmentation.memory import PeakMemory
+from augmentation.blend import blend
+
+
+def upscaled_face_img(img, width_reduced, w, h, mask):
+    face = cv2.resize(img, (w*2, h*2))
+    face = cv2.copyMakeBorder(face, 0, 0, int(width_reduced*0.3), int(width_reduced*0.3), cv2.BORDER_CONSTANT)
+    face = cv2.resize(face, (w, h))
+    face = cv2.GaussianBlur(face, (0, 0), 8)
+    return blend(face, img, mask)
+
+
+def eye_mask(shape):
+    # The blurred eye mask of a face filling about a third of the width of the photo
+    h, w = shape[:2]
+    face = w // 3
+    eye = np.array([[-face // 6, 0], [0, -face // 14], [face // 6, 0], [0, face // 14]])
+    polygons = [eye + [w // 2 - face // 4, h // 2 - face // 5], eye + [w // 2 + face // 4, h // 2 - face // 5]]
+    return TileMask.polygons(shape, polygons).close(40).blur(99, 32)
+
+
+def measure(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    with PeakMemory() as peak:
+        result = function()
+    return min(times), peak.peak, result
+
+
+def benchmark(sides, repeats=3):
+    rng = np.random.default_rng(0)
+    print(f"{'side':>6}{'MP':>6}{'upscale ms':>12}{'upscale MB':>12}{'warp ms':>10}{'warp MB':>10}{'max diff':>10}")
+    for side in sides:
+        shape = (side * 3 // 4, side, 3)
+        img = cv2.resize(rng.integers(0, 256, (shape[0] // 8, side // 8, 3), dtype=np.uint8), (side, shape[0]))
+        mask = eye_mask(shape)
+        width_reduced = side // 24
+        full_mask = mask.to_array(single_channel=True)
+        old_time, old_peak, expected = measure(lambda: upscaled_face_img(img, width_reduced, side, shape[0], full_mask), repeats)
+        new_time, new_peak, result = measure(lambda: make_face_img(img, width_reduced, side, shape[0], *prepare_masks(mask)), repeats)
+        error = np.abs(result.astype(int) - expected).max()
+        print(f"{side:>6}{side * shape[0] / 1e6:>6.1f}{old_time * 1000:>12.1f}{old_peak / 2**20:>12.1f}"
+              f"{new_time * 1000:>10.1f}{new_peak / 2**20:>10.1f}{error:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare make_face_img with the 2x upscale it replaces.")
+    parser.add_argument('--sides', type=int, nargs='+', default=[1000, 2000, 4000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.sides, args.repeats)
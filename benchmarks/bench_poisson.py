@@ -0,0 +1,64 @@
+# bench_poisson.py
+# Timing of the two backends of utils.img_utils.poisson_blend by size of the blended region: the direct
+# solve (one sparse factorization for all channels) and multigrid preconditioned conjugate gradient, cold
+# started from the source and warm started from an alpha blend.
+# Usage: python benchmarks/bench_poisson.py [--radii 50 100 200 400] [--tolerance 1e-6]
+
+import argparse
+import time
+import cv2
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.img_utils import poisson_blend
+
+
+def blend_inputs(radius, rng):
+    # An elliptic feature mask of the given half width, a smooth source under it and a larger target around it
+    side = 2 * radius + 20
+    mask = np.zeros((side, side), dtype=np.uint8)
+    cv2.ellipse(mask, (side // 2, side // 2), (radius, int(radius * 0.8)), 0, 0, 360, 255, -1)
+    source = cv2.GaussianBlur(rng.random((side, side, 3)), (0, 0), 3)
+    target = cv2.GaussianBlur(rng.random((side + 80, side + 80, 3)), (0, 0), 3)
+    return mask, source, target
+
+
+def alpha_blend_start(mask, source, target, offset):
+    # The source pasted over the target with a feathered mask, a warm start close to the solution
+    start = target.copy()
+    weight = cv2.GaussianBlur(mask.astype(np.float64) / 255, (0, 0), 5)[:, :, None]
+    rows, columns = slice(offset[0], offset[0] + mask.shape[0]), slice(offset[1], offset[1] + mask.shape[1])
+    start[rows, columns] = source * weight + start[rows, columns] * (1 - weight)
+    return start
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def benchmark(radii, tolerance):
+    rng = np.random.default_rng(0)
+    offset = (40, 40)
+    print(f"Poisson blend time (s) and largest difference from the direct solve, tolerance {tolerance}")
+    print(f"{'radius':>7}{'pixels':>9}{'direct':>9}{'multigrid':>11}{'error':>10}{'warm':>9}{'error':>10}")
+    for radius in radii:
+        mask, source, target = blend_inputs(radius, rng)
+        direct_time, direct = timed(lambda: poisson_blend(mask, source, target.copy(), offset))
+        cold_time, cold = timed(lambda: poisson_blend(mask, source, target.copy(), offset, 'multigrid', tolerance=tolerance))
+        start = alpha_blend_start(mask, source, target, offset)
+        warm_time, warm = timed(lambda: poisson_blend(mask, source, target.copy(), offset, 'multigrid', start, tolerance))
+        print(f"{radius:>7}{np.count_nonzero(mask):>9}{direct_time:>9.2f}{cold_time:>11.2f}{np.abs(cold - direct).max():>10.1e}"
+              f"{warm_time:>9.2f}{np.abs(warm - direct).max():>10.1e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the direct and multigrid backends of poisson_blend.")
+    parser.add_argument('--radii', type=int, nargs='+', default=[50, 100, 200, 400])
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    args = parser.parse_args()
+    benchmark(args.radii, args.tolerance)
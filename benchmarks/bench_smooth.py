@@ -0,0 +1,69 @@
+# bench_smooth.py
+# Timing and error of the mask blurs of the augmentation: the full frame cv2.GaussianBlur the stages used to run,
+# the exact blur of the mask tile (TileMask.blur) and the reduced blur within a tolerance (augmentation.smooth).
+# Usage: python benchmarks/bench_smooth.py [--sides 1000 2000 4000] [--tolerances 2 3 5]
+
+import argparse
+import time
+import cv2
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.mask import TileMask
+from augmentation.smooth import smoothing_factor
+
+
+def face_masks(side):
+    '''
+    Masks of the size the stages build for a face filling about a third of a side x 3/4 side photo:
+    the nose and mouth boxes and the closed eye polygons, with the kernels the stages blur them with.
+    '''
+    shape = (side * 3 // 4, side)
+    face = side // 3
+    cx, cy = side // 2, shape[0] // 2
+    nose = TileMask.box(shape, cx - face // 8, cy - face // 6, cx + face // 8, cy + face // 8)
+    mouth = TileMask.box(shape, cx - face // 5, cy + face // 5, cx + face // 5, cy + face // 3)
+    eye = np.array([[-face // 6, 0], [0, -face // 14], [face // 6, 0], [0, face // 14]])
+    eyes = TileMask.polygons(shape, [eye + [cx - face // 4, cy - face // 5], eye + [cx + face // 4, cy - face // 5]]).close(40)
+    # The landmark derived kernel of the reduced eye mask grows with the face
+    eye_kernel = (face // 10) | 1
+    return [('nose', nose, 0, 21), ('mouth', mouth, 0, 21), ('eyes reduced', eyes, eye_kernel, 99), ('eyes blurred', eyes, 99, 32)]
+
+
+def best_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def benchmark(sides, tolerances, repeats=5):
+    header = f"{'side':>6}{'mask':>14}{'kernel':>10}{'full frame':>12}{'tile':>10}"
+    header += ''.join(f"{'tol ' + str(tolerance):>10}{'factor':>8}{'error':>7}" for tolerance in tolerances)
+    print("Mask blur time (ms), reduction factor and largest error (levels) against cv2.GaussianBlur")
+    print(header)
+    for side in sides:
+        for name, mask, ksize, sigma in face_masks(side):
+            full = mask.to_array(single_channel=True)
+            full_time, expected = best_time(lambda: cv2.GaussianBlur(full, (ksize, ksize), sigma), repeats)
+            tile_time = best_time(lambda: mask.blur(ksize, sigma), repeats)[0]
+            row = f"{side:>6}{name:>14}{f'{ksize}/{sigma}':>10}{full_time * 1000:>12.1f}{tile_time * 1000:>10.1f}"
+            for tolerance in tolerances:
+                smooth_time, result = best_time(lambda: mask.blur(ksize, sigma, tolerance), repeats)
+                error = np.abs(result.to_array(single_channel=True).astype(int) - expected).max()
+                row += f"{smooth_time * 1000:>10.1f}{smoothing_factor(ksize, sigma, tolerance):>8}{error:>7}"
+            print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the reduced mask blur with the cv2.GaussianBlur calls it replaces.")
+    parser.add_argument('--sides', type=int, nargs='+', default=[1000, 2000, 4000])
+    parser.add_argument('--tolerances', type=int, nargs='+', default=[2, 3, 5])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.sides, args.tolerances, args.repeats)
@@ -14,9 +14,14 @@ import landmarking.landmark as fl
 import augmentation.augment as af
 from tkinter import *
 from tkinter import filedialog
+from tkinter import messagebox
 import customtkinter
 import shutil
+import threading
+import cv2
 from PIL import Image, ImageTk
+from landmarking.store import load_landmark_store
+from landmarking.feature_stats import load_feature_statistics
 
 filename, label, vid = '', '', ''
 
@@ -77,16 +82,60 @@ def create_caricature(frame, aug_frame, checked, text_box, button):
         text_box.delete("1.0", "end")
         text_box.config(state='disabled')
         filename = ''
-        # call facial landmarking to update processed photo folder
-        fl.main()
-        af.augment_image()
+        try:
+            # call facial landmarking to update processed photo folder, only new or changed photos are re-detected
+            fl.main(incremental=True)
+            # show a low resolution preview straight away, the full resolution render replaces it when done
+            img_path = os.path.join(os.path.abspath("../data/original_images"), os.path.basename(fname))
+            render = start_render(img_path)
+        except Exception as error:
+            # e.g. no face found in the photo, an exception would leave the window half updated
+            messagebox.showerror("Caricature failed", f"Could not create the caricature:\n{error}")
+            button['state'] = 'normal'
+            return
         error_label = customtkinter.CTkLabel(frame, text="Successfully Created Caricature!", text_color="green", font=('Times New Roman', 20))
         error_label.grid(row=4, column=0, columnspan=2)
         frame.after(3500, error_label.destroy)
-        show_images_frame(aug_frame, frame, ('Times New Roman', 20), fname)
+        aug_image = show_images_frame(aug_frame, frame, ('Times New Roman', 20), fname, render['preview'])
         aug_frame.tkraise()
+        poll_render(aug_frame, aug_image, render)
     button['state'] = 'normal'
 
+# Render the preview of an image and start its full resolution render in the background
+def start_render(img_path):
+    landmark_store = load_landmark_store()
+    feature_stats = load_feature_statistics(store=landmark_store)
+    img_num = [os.path.basename(path) for path in af.get_image_paths(os.path.dirname(img_path))].index(os.path.basename(img_path))
+    render = {'preview': af.augment_preview(img_path, img_num, landmark_store, feature_stats), 'path': None, 'error': None, 'done': False}
+    augmented_directory = os.path.abspath("../data/augmented_images")
+    os.makedirs(augmented_directory, exist_ok=True)
+
+    def full_render():
+        try:
+            render['path'] = af.augment_image_file(img_path, img_num, landmark_store, feature_stats, augmented_directory)
+        except Exception as error:
+            # Handed to poll_render, an exception in this thread would otherwise be lost
+            render['error'] = error
+        finally:
+            render['done'] = True
+    # Tk is not thread safe, the worker only fills in render and poll_render updates the window
+    threading.Thread(target=full_render, daemon=True).start()
+    return render
+
+# Swap the preview for the full resolution result once the background render has finished
+def poll_render(frame, aug_image, render):
+    if not render['done']:
+        frame.after(100, lambda: poll_render(frame, aug_image, render))
+    elif render['error'] is not None:
+        messagebox.showerror("Caricature failed", f"The full resolution caricature could not be created, only the preview is shown:\n{render['error']}")
+    elif render['path'] is not None and aug_image.winfo_exists():
+        set_label_image(aug_image, Image.open(render['path']))
+
+def set_label_image(label, image):
+    imgtk = ImageTk.PhotoImage(image.resize((550, 400)))
+    label.imgtk = imgtk
+    label.configure(image=imgtk)
+
 def get_main_frame(frame, main_frame):
     lp.clear_frame(frame)
     frame.destroy()
@@ -102,7 +151,7 @@ def check_snapshot(filename, file_text):
 def webcam_view(frame1, file_text):
     frame1.after(1, camera_status(frame1, True, file_text))
 
-def show_images_frame(frame, main_frame, font, file):
+def show_images_frame(frame, main_frame, font, file, preview=None):
     # Make a label for the window
     frame_width, frame_height = main_frame.winfo_width(), main_frame.winfo_height()
     frame1 = customtkinter.CTkFrame(master=frame, width=frame_width, height=800)
@@ -121,13 +170,13 @@ def show_images_frame(frame, main_frame, font, file):
         label.imgtk = imgtk
         label.configure(image=imgtk)
         label.grid(row=1, column=0, padx=5, pady=60)
-        newfile = f"../data/augmented_images/augmented_{os.path.basename(file)}"
         aug_image = Label(frame1, width=550, height=400)
-        image = Image.open(newfile)
-        img = image.resize((550, 400))
-        imgtk = ImageTk.PhotoImage(img)
-        aug_image.imgtk = imgtk
-        aug_image.configure(image=imgtk)
+        if preview is None:
+            newfile = f"../data/augmented_images/augmented_{os.path.basename(file)}"
+            set_label_image(aug_image, Image.open(newfile))
+        else:
+            # preview is a BGR array from augment_preview
+            set_label_image(aug_image, Image.fromarray(cv2.cvtColor(preview, cv2.COLOR_BGR2RGB)))
         aug_image.grid(row=1, column=1, padx=5, pady=60)
         # newfile2 = f"../data/caricature_images/caricature_{os.path.basename(file)}"
         newfile2 = f"../data/caricature_images/bj_novak.jpeg"
@@ -141,6 +190,8 @@ def show_images_frame(frame, main_frame, font, file):
 
     # Liability button
     customtkinter.CTkButton(frame1, text='Return to main Page', font=font, command=lambda: get_main_frame(frame1, main_frame)).grid(row=2, column=1, columnspan=2)
+    if not(file == ''):
+        return aug_image
 
 def show_main_page_frame(frame, img_frame, font):
     # Make a label for the window
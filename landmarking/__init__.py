@@ -1,5 +1,7 @@
 # __init.py__ for landmarking package
 
-from landmarking.load import load_feature_landmarks
+from landmarking.load import load_feature_landmarks, LandmarkIndex, get_landmark_index
+from landmarking.store import LandmarkStore, save_landmark_store, open_landmark_store, load_landmark_store, load_facial_features, export_csv, dataset_version
 from landmarking.landmark import main
-from landmarking.landmark_math import calc_dist, avg_feature_sizes, get_region_pts, global_avg_sizes, std_dev_features, print_sizes_and_devs
\ No newline at end of file
+from landmarking.landmark_math import calc_dist, avg_feature_sizes, get_region_pts, global_avg_sizes, std_dev_features, print_sizes_and_devs, feature_size_table, feature_statistics
+from landmarking.feature_stats import FeatureStatistics, load_feature_statistics, update_feature_statistics
\ No newline at end of file
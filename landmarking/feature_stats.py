@@ -0,0 +1,170 @@
+# feature_stats.py
+# Precomputed feature size statistics, so augmenting an image does not recompute them for the whole dataset.
+
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.file_utils import get_dir
+from landmarking.landmark_math import feature_size_table, REGION_NAMES
+from landmarking.store import load_landmark_store, dataset_version
+
+STATS_FILENAME = 'feature_stats.npz'
+
+
+def image_stats_key(store, image_id):
+    # Statistics are keyed by image file name so they survive images being renumbered; legacy stores fall back to the id
+    return store.image_keys[image_id] if store.image_keys is not None else str(image_id)
+
+
+class FeatureStatistics:
+    '''
+    Per image feature sizes plus the running global mean and standard deviation of every region.
+    The global values are kept as Welford aggregates (count, mean, m2), so adding, replacing or removing
+    one image updates them in O(1) instead of recomputing them over every image.
+    Arrays have one column per region of REGION_NAMES; version is the dataset_version it was built from.
+    '''
+
+    def __init__(self, version=None):
+        self.version = version
+        self.sizes = {}
+        self.count = 0
+        self.mean = np.zeros(len(REGION_NAMES))
+        self.m2 = np.zeros(len(REGION_NAMES))
+
+    @classmethod
+    def from_features(cls, facial_features, image_keys=None, version=None):
+        # Full build from a 5 column landmark array, image_keys maps its image ids to keys
+        stats = cls(version)
+        if facial_features.size == 0:
+            return stats
+        image_ids, sizes = feature_size_table(facial_features)
+        for image_id, image_sizes in zip(image_ids, sizes):
+            stats.sizes[image_keys[image_id] if image_keys is not None else str(image_id)] = image_sizes
+        stats.count = len(sizes)
+        stats.mean = sizes.mean(axis=0)
+        stats.m2 = ((sizes - stats.mean)**2).sum(axis=0)
+        return stats
+
+    @classmethod
+    def from_store(cls, store, version=None):
+        return cls.from_features(store.to_features(), store.image_keys, version)
+
+    @property
+    def global_avgs(self):
+        return self.mean.copy()
+
+    @property
+    def std_devs(self):
+        # Population standard deviation, the same as np.std in std_dev_features
+        if self.count == 0:
+            return np.zeros(len(REGION_NAMES))
+        return np.sqrt(np.maximum(self.m2, 0) / self.count)
+
+    def __contains__(self, image_key):
+        return image_key in self.sizes
+
+    def image_sizes(self, image_key):
+        if image_key not in self.sizes:
+            raise KeyError(f"No feature statistics for image '{image_key}'.")
+        return self.sizes[image_key]
+
+    def add(self, image_key, image_sizes):
+        # Welford update; an image that is already present is replaced
+        if image_key in self.sizes:
+            self.remove(image_key)
+        image_sizes = np.asarray(image_sizes, dtype=np.float64)
+        self.count += 1
+        delta = image_sizes - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (image_sizes - self.mean)
+        self.sizes[image_key] = image_sizes
+
+    def remove(self, image_key):
+        # Inverse Welford update
+        image_sizes = self.sizes.pop(image_key)
+        if self.count == 1:
+            self.count, self.mean, self.m2 = 0, np.zeros(len(REGION_NAMES)), np.zeros(len(REGION_NAMES))
+            return
+        previous_mean = (self.count * self.mean - image_sizes) / (self.count - 1)
+        self.m2 = np.maximum(self.m2 - (image_sizes - previous_mean) * (image_sizes - self.mean), 0)
+        self.mean = previous_mean
+        self.count -= 1
+
+    def add_image_features(self, image_key, image_features):
+        # Adds (or replaces) one image from its landmark rows; an image without landmarks is dropped
+        if image_features.size == 0:
+            if image_key in self.sizes:
+                self.remove(image_key)
+            return
+        self.add(image_key, feature_size_table(image_features)[1][0])
+
+    def save(self, path):
+        keys = list(self.sizes.keys())
+        sizes = np.array([self.sizes[key] for key in keys]).reshape(-1, len(REGION_NAMES))
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, keys=np.array(keys, dtype=str), sizes=sizes, count=self.count, mean=self.mean,
+                 m2=self.m2, version=np.array('' if self.version is None else self.version), regions=np.array(REGION_NAMES))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if list(data['regions']) != REGION_NAMES:
+                raise ValueError(f"{path} was written for different regions.")
+            stats = cls(str(data['version']) or None)
+            stats.sizes = {str(key): sizes for key, sizes in zip(data['keys'], data['sizes'])}
+            stats.count = int(data['count'])
+            stats.mean = data['mean']
+            stats.m2 = data['m2']
+        return stats
+
+
+def load_feature_statistics(data_directory=None, store=None):
+    '''
+    Returns the statistics for the current landmark data, read from data/feature_stats.npz.
+    If the file is missing or was built from another version of the landmarks it is rebuilt once and saved.
+    '''
+    data_directory = data_directory or get_dir('data')
+    path = os.path.join(data_directory, STATS_FILENAME)
+    version = dataset_version(data_directory)
+    if os.path.exists(path):
+        try:
+            stats = FeatureStatistics.load(path)
+            if stats.version == version:
+                return stats
+        except (OSError, ValueError, KeyError):
+            pass
+    stats = FeatureStatistics.from_store(store or load_landmark_store(data_directory), version)
+    stats.save(path)
+    return stats
+
+
+def update_feature_statistics(store, changed_ids, previous_version, data_directory=None):
+    '''
+    Brings data/feature_stats.npz up to date after landmarking rewrote the store.
+    When the saved statistics match previous_version (the store before this run) only the images in
+    changed_ids and the images no longer in the store are updated; otherwise everything is rebuilt.
+    '''
+    data_directory = data_directory or get_dir('data')
+    path = os.path.join(data_directory, STATS_FILENAME)
+    version = dataset_version(data_directory)
+    stats = None
+    if previous_version is not None and os.path.exists(path):
+        try:
+            stats = FeatureStatistics.load(path)
+        except (OSError, ValueError, KeyError):
+            stats = None
+    if stats is None or stats.version != previous_version:
+        stats = FeatureStatistics.from_store(store, version)
+    else:
+        current_keys = {image_stats_key(store, image_id) for image_id in range(store.n_images)}
+        for image_key in [key for key in stats.sizes if key not in current_keys]:
+            stats.remove(image_key)
+        for image_id in changed_ids:
+            stats.add_image_features(image_stats_key(store, image_id), store.image_features(image_id))
+        stats.version = version
+    stats.save(path)
+    return stats
@@ -3,23 +3,55 @@
 import dlib
 import cv2
 import numpy as np
-import csv
 import sys
 import os
+import json
+import hashlib
+import argparse
+import multiprocessing
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
 from utils.file_utils import get_dir
+from landmarking.store import save_landmark_store, load_landmark_store, export_csv, dataset_version, STORE_FILENAME
+from landmarking.feature_stats import update_feature_statistics
 
 detector = dlib.get_frontal_face_detector()
 dat = get_dir("landmarking/shape_predictor_68_face_landmarks.dat")
 predictor = dlib.shape_predictor(dat)
 
+MANIFEST_VERSION = 1
+DEFAULT_CHUNK_SIZE = 4
 
-def process_image_to_array(image_path, image_path_to_int, feature_to_int):
+
+def detect_faces(gray, detection_max_side=None):
+    '''
+    Runs the HOG face detector and returns the face rectangles in full resolution coordinates.
+    With detection_max_side set, images whose long side is larger are first shrunk (INTER_AREA) so the
+    long side fits, the detector runs on the small copy and the boxes are scaled back up. The 68 point
+    predictor still runs on the full resolution image, so only the box is coarse, not the landmarks.
+    If the small copy yields no face (e.g. a face too small to survive the shrink) it falls back to full resolution.
+    '''
+    long_side = max(gray.shape[:2])
+    if detection_max_side is None or long_side <= detection_max_side:
+        return list(detector(gray))
+    scale = long_side / detection_max_side
+    small_size = (max(1, int(round(gray.shape[1] / scale))), max(1, int(round(gray.shape[0] / scale))))
+    small = cv2.resize(gray, small_size, interpolation=cv2.INTER_AREA)
+    scale_x, scale_y = gray.shape[1] / small_size[0], gray.shape[0] / small_size[1]
+    faces = []
+    for face in detector(small):
+        faces.append(dlib.rectangle(int(round(face.left() * scale_x)), int(round(face.top() * scale_y)),
+                                    int(round((face.right() + 1) * scale_x)) - 1, int(round((face.bottom() + 1) * scale_y)) - 1))
+    if not faces:
+        return list(detector(gray))
+    return faces
+
+
+def process_image_to_array(image_path, image_path_to_int, feature_to_int, detection_max_side=None):
     img = cv2.imread(image_path)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    faces = detector(gray)
+    faces = detect_faces(gray, detection_max_side)
     all_features_array = []
     for face in faces:
         landmarks = predictor(gray, face)
@@ -31,6 +63,44 @@ def process_image_to_array(image_path, image_path_to_int, feature_to_int):
     return np.array(all_features_array)
 
 
+def init_worker(predictor_path):
+    '''
+    Pool initializer: every worker process loads its own detector and shape predictor exactly once,
+    instead of unpickling a model per task. process_image_to_array then picks them up as module globals.
+    '''
+    global detector, predictor
+    detector = dlib.get_frontal_face_detector()
+    predictor = dlib.shape_predictor(predictor_path)
+
+
+def process_image_task(task):
+    # Worker entry point: only the path and its id are shipped, not the whole path to id table
+    image_path, image_id, feature_to_int, detection_max_side = task
+    return process_image_to_array(image_path, {image_path: image_id}, feature_to_int, detection_max_side)
+
+
+def landmark_image_paths(image_paths, image_ids, feature_to_int, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, detection_max_side=None):
+    '''
+    Yields the landmark array of each image in image_paths, in the same order as image_paths.
+    With workers > 1 the images are spread over a process pool in chunks of chunk_size; imap keeps the
+    results in submission order, so the output is identical to the serial path.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1.")
+    workers = min(workers, len(image_paths))
+    if workers <= 1:
+        for path, image_id in zip(image_paths, image_ids):
+            yield process_image_to_array(path, {path: image_id}, feature_to_int, detection_max_side)
+        return
+
+    tasks = [(path, image_id, feature_to_int, detection_max_side) for path, image_id in zip(image_paths, image_ids)]
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(dat,)) as pool:
+        for features_array in pool.imap(process_image_task, tasks, chunksize=chunk_size):
+            yield features_array
+
+
 def draw_landmarks_and_save(image_path, landmarks, output_directory):
     img = cv2.imread(image_path)
     for landmark in landmarks:
@@ -42,41 +112,190 @@ def draw_landmarks_and_save(image_path, landmarks, output_directory):
     cv2.imwrite(output_path, img)
 
 
-def save_array_to_csv(array, file_name):
-    with open(file_name, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Image ID', 'Feature', 'Landmark Index', 'X', 'Y'])
-        writer.writerows(array)
+def hash_file(path, chunk_size=1 << 20):
+    '''
+    Returns the SHA-256 hex digest of the file contents.
+    The file is read in chunks so large photos are never held in memory twice.
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    '''
+    Loads the landmark manifest, which maps each image filename to the content hash, size and mtime
+    it had when it was last landmarked, plus the image id its rows were stored under.
+    A missing, unreadable or outdated manifest is treated as empty, which forces a full landmarking run.
+    '''
+    empty = {'version': MANIFEST_VERSION, 'images': {}}
+    if not os.path.exists(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return empty
+    if manifest.get('version') != MANIFEST_VERSION or not isinstance(manifest.get('images'), dict):
+        return empty
+    return manifest
+
+
+def save_manifest(manifest, manifest_path):
+    # Write to a temporary file first so an interrupted run never leaves a half written manifest behind
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def group_rows_by_image(features):
+    # Split a landmark array into {image_id: rows} with one sort instead of one mask per image
+    if features is None or features.size == 0:
+        return {}
+    order = np.argsort(features[:, 0], kind='stable')
+    sorted_features = features[order]
+    image_ids, starts = np.unique(sorted_features[:, 0], return_index=True)
+    ends = np.append(starts[1:], len(sorted_features))
+    return {int(image_id): sorted_features[start:end] for image_id, start, end in zip(image_ids, starts, ends)}
 
 
-def main():
+def update_landmarks(image_paths, previous_features, manifest, feature_to_int, incremental=True, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, detection_max_side=None):
+    '''
+    Landmarks every image in image_paths and returns (all_features, new_manifest, changed_paths).
+    Image ids are the positions in image_paths, the same numbering augment_image uses.
+    In incremental mode an image whose size and mtime match the manifest is reused as is, and an image whose
+    mtime changed but whose content hash did not is reused as well; only new or modified images are run
+    through the detector, optionally on a pool of workers. Reused rows are renumbered to the image's current position.
+    '''
+    previous_entries = manifest.get('images', {}) if incremental else {}
+    previous_rows = group_rows_by_image(previous_features) if incremental else {}
+    new_manifest = {'version': MANIFEST_VERSION, 'images': {}}
+    all_features_list = []
+    changed_paths = []
+    changed_ids = []
+
+    for image_id, path in enumerate(image_paths):
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = previous_entries.get(name)
+        # Rows can only be reused if the previous run actually stored them (or found no face at all)
+        reusable = entry is not None and (entry.get('image_id') in previous_rows or entry.get('faces') == 0)
+        if reusable and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            digest = entry['sha256']
+            unchanged = True
+        else:
+            digest = hash_file(path)
+            unchanged = reusable and digest == entry.get('sha256')
+
+        if unchanged:
+            features_array = previous_rows.get(entry['image_id'], np.empty((0, 5), dtype=np.int64)).copy()
+            features_array[:, 0] = image_id
+        else:
+            # Placeholder, filled in below once the new or changed images have been landmarked
+            features_array = None
+            changed_paths.append(path)
+            changed_ids.append(image_id)
+        all_features_list.append(features_array)
+        new_manifest['images'][name] = {
+            'sha256': digest,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'image_id': image_id,
+        }
+
+    for image_id, features_array in zip(changed_ids, landmark_image_paths(changed_paths, changed_ids, feature_to_int, workers, chunk_size, detection_max_side)):
+        all_features_list[image_id] = features_array
+
+    for image_id, path in enumerate(image_paths):
+        if all_features_list[image_id].size == 0:
+            all_features_list[image_id] = np.empty((0, 5), dtype=np.int64)
+        new_manifest['images'][os.path.basename(path)]['faces'] = len(all_features_list[image_id]) // 68
+
+    if all_features_list:
+        all_features = np.vstack(all_features_list)
+    else:
+        all_features = np.empty((0, 5), dtype=np.int64)
+    return all_features, new_manifest, changed_paths
+
+
+def draw_processed_images(image_paths, all_features, changed_set):
+    # Redraws the landmarks of the changed images, and of any image whose processed copy is missing
+    output_directory = os.path.abspath(get_dir('data/processed_images'))
+    rows_by_image = group_rows_by_image(all_features)
+    for image_id, path in enumerate(image_paths):
+        processed_path = os.path.join(output_directory, f"Processed_{os.path.basename(path)}")
+        if path in changed_set or not os.path.exists(processed_path):
+            current_image_landmarks = rows_by_image.get(image_id, np.empty((0, 5), dtype=np.int64))
+            draw_landmarks_and_save(path, current_image_landmarks, output_directory)
+
+
+def main(incremental=False, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, detection_max_side=None, csv_export=False):
+    '''
+    Landmarks the images in data/original_images and saves the results to the landmark store,
+    data/facial_features.lmk (see landmarking/store.py). csv_export=True also writes facial_features.csv.
+    With incremental=True only images that are new or whose contents changed since the last run
+    (according to data/landmark_manifest.json) are re-detected and redrawn; the rest keep their stored rows.
+    workers sets the number of detector processes (None uses every core) and chunk_size how many images
+    each worker takes at a time; the saved landmarks are the same for any worker count.
+    detection_max_side enables coarse to fine detection for large photos (see detect_faces).
+    '''
     if not os.path.exists(get_dir('data/processed_images')):
         os.makedirs(get_dir('data/processed_images'))
 
     image_directory = get_dir('data/original_images')
     image_paths = [os.path.join(image_directory, filename) for filename in os.listdir(image_directory) if filename.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    image_path_to_int = {path: idx for idx, path in enumerate(image_paths)}
     feature_to_int = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
-    all_features_list = []
-
-    for path in image_paths:
-        features_array = process_image_to_array(path, image_path_to_int, feature_to_int)
-        all_features_list.append(features_array)
+    store_path = os.path.join(get_dir('data'), STORE_FILENAME)
+    manifest_path = os.path.join(get_dir('data'), 'landmark_manifest.json')
 
-    all_features = np.vstack(all_features_list)
-    np.save(get_dir('data/facial_features.npy'), all_features)
+    manifest = load_manifest(manifest_path)
+    previous_features = None
+    if incremental and os.path.exists(store_path):
+        previous_features = load_landmark_store().to_features()
+    else:
+        incremental = False
 
-    save_array_to_csv(all_features, get_dir('data/facial_features.csv'))
+    previous_images = manifest.get('images', {})
+    all_features, manifest, changed_paths = update_landmarks(image_paths, previous_features, manifest, feature_to_int, incremental, workers, chunk_size, detection_max_side)
+    changed_set = set(changed_paths)
+    if incremental and not changed_set and previous_images.keys() == manifest['images'].keys() and \
+            all(previous_images[name].get('image_id') == entry['image_id'] for name, entry in manifest['images'].items()):
+        # Nothing new, changed or removed and every image keeps its id: the store and everything derived from it are current
+        if manifest != {'version': MANIFEST_VERSION, 'images': previous_images}:
+            # Only modification times moved, record them so the files are not hashed again
+            save_manifest(manifest, manifest_path)
+        draw_processed_images(image_paths, all_features, changed_set)
+        print(f"No new or changed images, the landmark store {STORE_FILENAME} is up to date.")
+        return
+    previous_version = dataset_version() if incremental else None
+    save_landmark_store(store_path, all_features, [os.path.basename(path) for path in image_paths])
+    save_manifest(manifest, manifest_path)
+    # Keep the feature size statistics in step with the store, only changed images are folded in
+    changed_ids = [image_id for image_id, path in enumerate(image_paths) if path in changed_set]
+    update_feature_statistics(load_landmark_store(), changed_ids, previous_version)
+    if csv_export:
+        export_csv(store_path, os.path.join(get_dir('data'), 'facial_features.csv'))
 
-    output_directory = os.path.abspath(get_dir('data/processed_images'))
-    for path in image_paths:
-        current_image_landmarks = all_features[all_features[:, 0] == image_path_to_int[path]]
-        draw_landmarks_and_save(path, current_image_landmarks, output_directory)
+    draw_processed_images(image_paths, all_features, changed_set)
 
     print("Success.")
-    print("The landmarkings have been saved to a NumPy array, and facial_features.npy ")
-    print("For double checking, the array data was also saved to facial_features.csv ")
+    if incremental:
+        print(f"Landmarked {len(changed_paths)} new or changed image(s), reused {len(image_paths) - len(changed_paths)}.")
+    print(f"The landmarkings have been saved to the landmark store, {STORE_FILENAME} ")
+    if csv_export:
+        print("For double checking, the array data was also saved to facial_features.csv ")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Landmark the images in data/original_images.")
+    parser.add_argument('--incremental', action='store_true', help="only landmark new or changed images")
+    parser.add_argument('--workers', type=int, default=1, help="number of detector processes, 0 uses every core")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="images handed to a worker at a time")
+    parser.add_argument('--detection-max-side', type=int, default=None, help="detect faces on a copy shrunk to this long side")
+    parser.add_argument('--export-csv', action='store_true', help="also export the landmarks to facial_features.csv")
+    args = parser.parse_args()
+    main(incremental=args.incremental, workers=args.workers or None, chunk_size=args.chunk_size,
+         detection_max_side=args.detection_max_side, csv_export=args.export_csv)
@@ -6,7 +6,7 @@ import os
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
-from utils.file_utils import get_dir
+from landmarking.store import load_facial_features
 
 def calc_dist(pt1, pt2):
     return np.sqrt((pt1[0] - pt2[0])**2 + (pt1[1] - pt2[1])**2)
@@ -29,34 +29,67 @@ def get_region_pts(features, img_id):
     img_features = features[features[:, 0] == img_id]
     return {region: img_features[np.isin(img_features[:, 2], indices)] for region, indices in regions.items()}
 
+# Landmark index ranges of each region, in the order the size tables use
+REGION_NAMES = ['jawline', 'eyebrows', 'nose', 'eyes', 'lips']
+REGION_BOUNDS = np.array([0, 17, 27, 36, 48, 68])
+
+def feature_size_table(features):
+    '''
+    Batched avg_feature_sizes for every image at once.
+    Returns (image_ids, sizes) where sizes[i, r] is the mean distance between consecutive landmarks of
+    region REGION_NAMES[r] in image image_ids[i] (0 if the region has fewer than two points).
+    Rows are grouped with one stable sort on (image, region), so consecutive points keep the order they
+    have in the array, and the per group means are two bincount reductions over the segment lengths.
+    '''
+    n_regions = len(REGION_NAMES)
+    image_ids, image_rank = np.unique(features[:, 0], return_inverse=True)
+    image_rank = image_rank.reshape(-1)
+    landmark_index = features[:, 2]
+    rows = np.flatnonzero((landmark_index >= REGION_BOUNDS[0]) & (landmark_index < REGION_BOUNDS[-1]))
+    group = image_rank[rows] * n_regions + np.searchsorted(REGION_BOUNDS[1:], landmark_index[rows], side='right')
+    order = np.argsort(group, kind='stable')
+    group = group[order]
+    points = features[rows[order], 3:5].astype(np.int64)
+
+    # A segment joins two consecutive points of the same group
+    same_group = group[1:] == group[:-1]
+    deltas = points[1:][same_group] - points[:-1][same_group]
+    lengths = np.sqrt(deltas[:, 0]**2 + deltas[:, 1]**2)
+    segment_group = group[1:][same_group]
+    n_groups = len(image_ids) * n_regions
+    sums = np.bincount(segment_group, weights=lengths, minlength=n_groups)
+    counts = np.bincount(segment_group, minlength=n_groups)
+    sizes = np.divide(sums, counts, out=np.zeros(n_groups), where=counts > 0)
+    return image_ids, sizes.reshape(len(image_ids), n_regions)
+
+def feature_statistics(features):
+    '''
+    Returns (image_ids, sizes, global_avgs, std_devs) as arrays with one column per region of REGION_NAMES,
+    the array form of global_avg_sizes and std_dev_features.
+    '''
+    image_ids, sizes = feature_size_table(features)
+    global_avgs = sizes.mean(axis=0)
+    std_devs = np.std(sizes - global_avgs, axis=0)
+    return image_ids, sizes, global_avgs, std_devs
+
 def global_avg_sizes(features):
-    total_sizes = {region: [] for region in get_region_pts(features, 0).keys()}
-    for img_id in np.unique(features[:, 0]):
-        img_sizes = avg_feature_sizes(features, img_id)
-        for region, size in img_sizes.items():
-            total_sizes[region].append(size)
-    return {region: np.mean(sizes) for region, sizes in total_sizes.items()}
+    _, sizes = feature_size_table(features)
+    return {region: np.mean(sizes[:, r]) for r, region in enumerate(REGION_NAMES)}
 
 def std_dev_features(features, global_avgs):
-    deviations = {region: [] for region in global_avgs.keys()}
-    for img_id in np.unique(features[:, 0]):
-        img_sizes = avg_feature_sizes(features, img_id)
-        for region, global_avg in global_avgs.items():
-            dev = img_sizes[region] - global_avg
-            deviations[region].append(dev)
-    return {region: np.std(devs) for region, devs in deviations.items()}
+    _, sizes = feature_size_table(features)
+    return {region: np.std(sizes[:, REGION_NAMES.index(region)] - global_avg) for region, global_avg in global_avgs.items()}
 
 def print_sizes_and_devs(features):
-    global_avgs = global_avg_sizes(features)
-    std_devs = std_dev_features(features, global_avgs)
+    image_ids, sizes, _, std_devs = feature_statistics(features)
 
-    for img_id in np.unique(features[:, 0]):
-        img_feature_sizes = avg_feature_sizes(features, img_id)
+    for img_id, img_feature_sizes in zip(image_ids, sizes):
         print(f"Image ID {img_id}:")
-        for region, size in img_feature_sizes.items():
-            print(f"    Average size for {region}: {size}")
-            print(f"    Standard deviation for {region}: {std_devs[region]}")
+        for r, region in enumerate(REGION_NAMES):
+            print(f"    Average size for {region}: {img_feature_sizes[r]}")
+            print(f"    Standard deviation for {region}: {std_devs[r]}")
 
-features = np.load(get_dir("data/facial_features.npy"))
-print_sizes_and_devs(features)
+if __name__ == "__main__":
+    features = load_facial_features()
+    print_sizes_and_devs(features)
 
@@ -1,16 +1,88 @@
 # load.py
+import numpy as np
+
+
+class LandmarkIndex:
+    '''
+    Sorted view of a facial_features array for constant time lookups.
+    The rows are sorted once by (image_id, feature), keeping the original order inside each group,
+    and an offsets table records where every (image_id, feature) group starts. A lookup is then two
+    array reads and a slice, which returns a view into the sorted rows instead of a masked copy.
+    '''
+
+    def __init__(self, facial_features):
+        # Check if the facial_features array is empty or not a 2D array
+        if facial_features.size == 0 or len(facial_features.shape) != 2:
+            raise ValueError("facial_features array is empty or not correctly formatted.")
+        image_ids = facial_features[:, 0].astype(np.int64)
+        features = facial_features[:, 1].astype(np.int64)
+        if image_ids.min() < 0 or features.min() < 0:
+            raise ValueError("Image ids and feature ids must be non-negative.")
+
+        # lexsort is stable, so landmarks keep their original order within a group
+        order = np.lexsort((features, image_ids))
+        self.source = facial_features
+        self.rows = facial_features[order]
+        self.rows.flags.writeable = False
+        self.n_images = int(image_ids.max()) + 1
+        self.n_features = int(features.max()) + 1
+
+        # offsets[k] .. offsets[k + 1] are the rows of group k = image_id * n_features + feature
+        keys = image_ids[order] * self.n_features + features[order]
+        counts = np.bincount(keys, minlength=self.n_images * self.n_features)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def lookup(self, image_id, feature):
+        # Returns the full rows of one (image_id, feature) group, empty if there are none
+        if not (0 <= image_id < self.n_images and 0 <= feature < self.n_features):
+            return self.rows[:0]
+        key = int(image_id) * self.n_features + int(feature)
+        return self.rows[self.offsets[key]:self.offsets[key + 1]]
+
+    def image_rows(self, image_id):
+        # Returns every row of one image, in (feature, original) order
+        if not 0 <= image_id < self.n_images:
+            return self.rows[:0]
+        start = int(image_id) * self.n_features
+        return self.rows[self.offsets[start]:self.offsets[start + self.n_features]]
+
+    def image_ids(self):
+        # Returns the ids of the images that have at least one landmark
+        counts = np.diff(self.offsets[::self.n_features])
+        return np.flatnonzero(counts)
+
+
+_cached_index = None
+
+
+def get_landmark_index(facial_features):
+    '''
+    Returns a LandmarkIndex for facial_features, building it only when a different array is passed in.
+    augment_image hands the same array to every stage of every image, so the sort happens once per run.
+    The array is made read-only when it is indexed, so editing it in place afterwards raises instead of
+    being served the stale index; to edit it, copy it or set it writeable again, which rebuilds the index
+    on the next call.
+    '''
+    global _cached_index
+    if isinstance(facial_features, LandmarkIndex):
+        return facial_features
+    if _cached_index is None or _cached_index.source is not facial_features or facial_features.flags.writeable:
+        _cached_index = LandmarkIndex(facial_features)
+        facial_features.flags.writeable = False
+    return _cached_index
+
+
 def load_feature_landmarks(facial_features, image_id, feature_to_int, feature_name):
-    
+
     # Check if the facial_features array is empty or not a 2D array
-    if facial_features.size == 0 or len(facial_features.shape) != 2:
+    if not isinstance(facial_features, LandmarkIndex) and (facial_features.size == 0 or len(facial_features.shape) != 2):
         raise ValueError("facial_features array is empty or not correctly formatted.")
-    
-    # Filter the landmarks for the specified image_id and feature
-    mask = (facial_features[:, 0] == image_id) & (facial_features[:, 1] == feature_to_int.get(feature_name, -1))
-    filtered_landmarks = facial_features[mask]
-    
+
+    # Look up the landmarks for the specified image_id and feature
+    filtered_landmarks = get_landmark_index(facial_features).lookup(image_id, feature_to_int.get(feature_name, -1))
+
     # Check if there are any landmarks after filtering
     if filtered_landmarks.size == 0:
         raise ValueError(f"No landmarks found for image_id {image_id} and feature '{feature_name}'.")
-    
-    return filtered_landmarks[:, 3:5]
\ No newline at end of file
+
+    return filtered_landmarks[:, 3:5]
@@ -0,0 +1,236 @@
+# store.py
+# Compact on-disk landmark format, opened with np.memmap so readers only touch the pages they use.
+#
+# File layout (little endian, every section 8 byte aligned):
+#   header        HEADER_DTYPE, one record
+#   image offsets uint64[n_images + 1]  rows of image i are records[offsets[i]:offsets[i + 1]]
+#   key offsets   uint64[n_images + 1]  bytes of key i are keys[key_offsets[i]:key_offsets[i + 1]]
+#   keys          utf-8 string table mapping image ids to stable image keys (file names)
+#   records       LANDMARK_DTYPE[n_rows]
+
+import csv
+import argparse
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.file_utils import get_dir
+
+MAGIC = b'COMICLMK'
+STORE_VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('n_images', '<u4'), ('n_rows', '<u8'),
+                         ('offsets_start', '<u8'), ('key_offsets_start', '<u8'), ('keys_start', '<u8'),
+                         ('keys_size', '<u8'), ('records_start', '<u8')])
+LANDMARK_DTYPE = np.dtype([('feature', 'u1'), ('index', 'u1'), ('x', '<i2'), ('y', '<i2')])
+STORE_FILENAME = 'facial_features.lmk'
+LEGACY_FILENAME = 'facial_features.npy'
+
+
+def _align(position, alignment=8):
+    return (position + alignment - 1) // alignment * alignment
+
+
+class LandmarkStore:
+    '''
+    Read access to a landmark store. offsets and records are np.memmap views of the file when the store
+    was opened from disk, so looking up one image reads only that image's offsets and records.
+    image_features() and to_features() convert back to the 5 column (image id, feature, index, x, y)
+    array the augmentation functions take.
+    '''
+
+    def __init__(self, offsets, records, image_keys=None):
+        self.offsets = offsets
+        self.records = records
+        self.image_keys = image_keys
+        self._key_to_id = None if image_keys is None else {key: image_id for image_id, key in enumerate(image_keys)}
+
+    @classmethod
+    def from_features(cls, facial_features, image_keys=None):
+        # Builds an in memory store from a 5 column array, e.g. a legacy facial_features.npy
+        offsets, records = _encode(facial_features, None if image_keys is None else len(image_keys))
+        return cls(offsets, records, image_keys)
+
+    @property
+    def n_images(self):
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return len(self.records)
+
+    def image_id(self, image_key, default=None):
+        '''
+        Returns the id stored for image_key (a file name). Stores built from a legacy array have no keys,
+        in which case default, the caller's own numbering, is returned instead.
+        '''
+        if self._key_to_id is None:
+            if default is None:
+                raise KeyError(f"Landmark store has no image keys, cannot look up '{image_key}'.")
+            return default
+        if image_key not in self._key_to_id:
+            raise KeyError(f"No landmarks stored for image '{image_key}'.")
+        return self._key_to_id[image_key]
+
+    def image_records(self, image_id):
+        # Structured records of one image, a slice of the memory map
+        if not 0 <= image_id < self.n_images:
+            return self.records[:0]
+        return self.records[int(self.offsets[image_id]):int(self.offsets[image_id + 1])]
+
+    def image_features(self, image_id):
+        # 5 column landmark array of one image
+        return _decode(self.image_records(image_id), image_id)
+
+    def to_features(self, image_ids=None):
+        # 5 column landmark array of every image, or only of image_ids
+        if image_ids is None:
+            counts = np.diff(np.asarray(self.offsets, dtype=np.int64))
+            return _decode(np.asarray(self.records), np.repeat(np.arange(self.n_images), counts))
+        parts = [self.image_features(image_id) for image_id in image_ids]
+        return np.vstack(parts) if parts else np.empty((0, 5), dtype=np.int64)
+
+
+def _encode(facial_features, n_images=None):
+    # Sorts the rows by image id (stable, so landmark order is kept) and packs them into records plus offsets
+    facial_features = np.asarray(facial_features)
+    if facial_features.size == 0:
+        facial_features = np.empty((0, 5), dtype=np.int64)
+    if facial_features.ndim != 2 or facial_features.shape[1] != 5:
+        raise ValueError("facial_features must be a 2D array with 5 columns.")
+    image_ids = facial_features[:, 0].astype(np.int64)
+    if len(image_ids) and image_ids.min() < 0:
+        raise ValueError("Image ids must be non-negative.")
+    if n_images is None:
+        n_images = int(image_ids.max()) + 1 if len(image_ids) else 0
+    elif len(image_ids) and image_ids.max() >= n_images:
+        raise ValueError("Every image id needs an image key.")
+    for column, name in [(1, 'feature'), (2, 'index'), (3, 'x'), (4, 'y')]:
+        info = np.iinfo(LANDMARK_DTYPE[name])
+        values = facial_features[:, column]
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise ValueError(f"Landmark {name} values must be in [{info.min}, {info.max}].")
+
+    order = np.argsort(image_ids, kind='stable')
+    sorted_features = facial_features[order]
+    records = np.empty(len(sorted_features), dtype=LANDMARK_DTYPE)
+    for column, name in [(1, 'feature'), (2, 'index'), (3, 'x'), (4, 'y')]:
+        records[name] = sorted_features[:, column]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(image_ids, minlength=n_images)))).astype(np.uint64)
+    return offsets, records
+
+
+def _decode(records, image_ids):
+    features = np.empty((len(records), 5), dtype=np.int64)
+    features[:, 0] = image_ids
+    for column, name in [(1, 'feature'), (2, 'index'), (3, 'x'), (4, 'y')]:
+        features[:, column] = records[name]
+    return features
+
+
+def save_landmark_store(path, facial_features, image_keys):
+    '''
+    Writes facial_features (5 column array whose image ids index image_keys) to path.
+    The file is written next to the target and renamed into place, so readers never see a partial store.
+    '''
+    offsets, records = _encode(facial_features, len(image_keys))
+    encoded_keys = [key.encode('utf-8') for key in image_keys]
+    key_offsets = np.concatenate(([0], np.cumsum([len(key) for key in encoded_keys]))).astype(np.uint64)
+    keys = b''.join(encoded_keys)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = STORE_VERSION
+    header['n_images'] = len(image_keys)
+    header['n_rows'] = len(records)
+    header['offsets_start'] = _align(HEADER_DTYPE.itemsize)
+    header['key_offsets_start'] = _align(int(header['offsets_start'][0]) + offsets.nbytes)
+    header['keys_start'] = _align(int(header['key_offsets_start'][0]) + key_offsets.nbytes)
+    header['keys_size'] = len(keys)
+    header['records_start'] = _align(int(header['keys_start'][0]) + len(keys))
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        for start, data in [(0, header.tobytes()), (header['offsets_start'][0], offsets.tobytes()),
+                            (header['key_offsets_start'][0], key_offsets.tobytes()), (header['keys_start'][0], keys),
+                            (header['records_start'][0], records.tobytes())]:
+            file.write(b'\x00' * (int(start) - file.tell()))
+            file.write(data)
+    os.replace(temp_path, path)
+
+
+def open_landmark_store(path):
+    # Opens a store written by save_landmark_store; offsets and records stay on disk as memory maps
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header['magic'][0] != MAGIC:
+        raise ValueError(f"{path} is not a landmark store.")
+    if header['version'][0] != STORE_VERSION:
+        raise ValueError(f"Unsupported landmark store version {header['version'][0]}.")
+    n_images, n_rows = int(header['n_images'][0]), int(header['n_rows'][0])
+    offsets = np.memmap(path, dtype='<u8', mode='r', offset=int(header['offsets_start'][0]), shape=(n_images + 1,))
+    key_offsets = np.fromfile(path, dtype='<u8', count=n_images + 1, offset=int(header['key_offsets_start'][0]))
+    with open(path, 'rb') as file:
+        file.seek(int(header['keys_start'][0]))
+        keys = file.read(int(header['keys_size'][0]))
+    image_keys = [keys[int(key_offsets[i]):int(key_offsets[i + 1])].decode('utf-8') for i in range(n_images)]
+    if n_rows:
+        records = np.memmap(path, dtype=LANDMARK_DTYPE, mode='r', offset=int(header['records_start'][0]), shape=(n_rows,))
+    else:
+        records = np.empty(0, dtype=LANDMARK_DTYPE)
+    return LandmarkStore(offsets, records, image_keys)
+
+
+def load_landmark_store(data_directory=None):
+    '''
+    Opens data/facial_features.lmk. Trees that were landmarked before the store existed only have
+    data/facial_features.npy; that array is wrapped in an in memory store without image keys.
+    '''
+    data_directory = data_directory or get_dir('data')
+    store_path = os.path.join(data_directory, STORE_FILENAME)
+    if os.path.exists(store_path):
+        return open_landmark_store(store_path)
+    legacy_path = os.path.join(data_directory, LEGACY_FILENAME)
+    if os.path.exists(legacy_path):
+        return LandmarkStore.from_features(np.load(legacy_path))
+    raise FileNotFoundError(f"No landmark store found in {data_directory}, run landmarking first.")
+
+
+def dataset_version(data_directory=None):
+    '''
+    Returns a short fingerprint (file, size and mtime) of the landmark data in data_directory.
+    Artifacts derived from the landmarks, such as the feature statistics, record it to detect that they are stale.
+    '''
+    data_directory = data_directory or get_dir('data')
+    for filename in [STORE_FILENAME, LEGACY_FILENAME]:
+        path = os.path.join(data_directory, filename)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return f"{filename}:{stat.st_size}:{stat.st_mtime_ns}"
+    return None
+
+
+def load_facial_features(data_directory=None):
+    # The whole store as a 5 column array, for consumers that work on every image at once
+    return load_landmark_store(data_directory).to_features()
+
+
+def export_csv(store, file_name):
+    # Writes the store in the old facial_features.csv layout
+    if isinstance(store, str):
+        store = open_landmark_store(store)
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Image ID', 'Feature', 'Landmark Index', 'X', 'Y'])
+        for image_id in range(store.n_images):
+            writer.writerows(store.image_features(image_id).tolist())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Landmark store tools.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export-csv', help="export the landmark store to CSV")
+    export_parser.add_argument('output', nargs='?', default=os.path.join(get_dir('data'), 'facial_features.csv'))
+    args = parser.parse_args()
+    if args.command == 'export-csv':
+        export_csv(load_landmark_store(), args.output)
+        print(f"The landmarkings have been exported to {args.output}")
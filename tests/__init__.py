@@ -2,4 +2,24 @@ from tests.test_augment_integration import TestAugmentingFeatures
 from tests.test_augment import TestAugment
 from tests.test_image_utils import TestImageUtils
 from tests.test_make_image import TestMakeImage
-from tests.test_nose import TestNose
\ No newline at end of file
+from tests.test_nose import TestNose
+from tests.test_landmark import TestIncrementalLandmarking, TestParallelLandmarking
+from tests.test_load import TestLandmarkIndex
+from tests.test_store import TestLandmarkStore
+from tests.test_landmark_math import TestLandmarkMath
+from tests.test_feature_stats import TestFeatureStatistics
+from tests.test_batch import TestAugmentBatch
+from tests.test_roi import TestFaceROI
+from tests.test_blend import TestBlend
+from tests.test_warp import TestWarp
+from tests.test_cache import TestMapCache
+from tests.test_preview import TestPreview
+from tests.test_augment_array import TestAugmentArray
+from tests.test_pipeline import TestStreamAugment
+from tests.test_stages import TestStageCache
+from tests.test_mask import TestTileMask
+from tests.test_smooth import TestSmooth
+from tests.test_memory import TestMemoryBudget
+from tests.test_multigrid import TestMultigrid
+from tests.test_pyramid import TestPyramid
+from tests.test_color import TestColor
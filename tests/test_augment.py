@@ -1,4 +1,5 @@
 import unittest
+import tempfile
 import numpy as np
 import cv2
 import sys
@@ -8,13 +9,13 @@ parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
 from augmentation.augment import augment_image, augment_nose, augment_eyes
 from utils.file_utils import get_dir
+from landmarking.store import load_facial_features
 
 class TestAugment(unittest.TestCase):
     def setUp(self):
-        self.facial_features = np.load(get_dir('data/facial_features.npy'))
+        self.facial_features = load_facial_features()
         self.feature_to_int = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
         self.image_directory = get_dir('data/original_images')
-        self.augmented_directory = get_dir('data/augmented_images')
         self.nose_scale_factor = 1.25
         self.image_paths = [os.path.join(self.image_directory, filename) for filename in os.listdir(self.image_directory) if
                    filename.lower().endswith(('.png', '.jpg', '.jpeg'))]
@@ -34,9 +35,11 @@ class TestAugment(unittest.TestCase):
             self.assertIsNotNone(augmented_img)
 
     def test_augment_image(self):
-        augment_image()
-        augmented_images = os.listdir(self.augmented_directory)
-        self.assertTrue(len(augmented_images) > 0)
+        # The map cache and the results go to temporary directories, not data/map_cache and the tracked samples
+        with tempfile.TemporaryDirectory() as cache_directory, tempfile.TemporaryDirectory() as augmented_directory:
+            augment_image(cache_directory=cache_directory, augmented_directory=augmented_directory)
+            augmented_images = os.listdir(augmented_directory)
+        self.assertEqual(len(augmented_images), len(self.image_paths))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
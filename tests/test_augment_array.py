@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.augment import augment_array, AugmentParams, landmark_rows
+from landmarking.feature_stats import FeatureStatistics
+
+def face_points(centre_x=200, centre_y=210, size=100):
+    # 68 points in dlib order laid out like a frontal face
+    angles = np.linspace(np.pi, 0, 17)
+    jawline = np.column_stack([centre_x + size*np.cos(angles), centre_y + 0.2*size - 1.1*size*np.sin(angles - np.pi)])
+    eyebrows = np.array([[centre_x + size*(x - 0.5), centre_y - 0.55*size - 0.1*size*np.sin(np.pi*(n % 5)/4)] for n, x in enumerate(np.r_[np.linspace(-0.3, 0.35, 5), np.linspace(0.65, 1.3, 5)])])
+    nose = np.array([[centre_x, centre_y - 0.35*size + 0.12*size*n] for n in range(4)] + [[centre_x + 0.1*size*(n - 2), centre_y + 0.15*size] for n in range(5)])
+    eyes = []
+    for eye_x in (centre_x - 0.45*size, centre_x + 0.45*size):
+        eyes += [[eye_x - 0.2*size, centre_y - 0.3*size], [eye_x - 0.07*size, centre_y - 0.36*size], [eye_x + 0.07*size, centre_y - 0.36*size],
+                 [eye_x + 0.2*size, centre_y - 0.3*size], [eye_x + 0.07*size, centre_y - 0.25*size], [eye_x - 0.07*size, centre_y - 0.25*size]]
+    lip_angles = np.linspace(0, 2*np.pi, 20, endpoint=False)
+    lips = np.column_stack([centre_x + 0.35*size*np.cos(lip_angles + np.pi), centre_y + 0.5*size + 0.12*size*np.sin(lip_angles)])
+    return np.rint(np.vstack([jawline, eyebrows, nose, np.array(eyes), lips])).astype(np.int64)
+
+class TestAugmentArray(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.img = cv2.GaussianBlur(rng.integers(40, 220, (480, 400, 3), dtype=np.uint8), (0, 0), 3)
+        self.points = face_points()
+
+    def test_returns_augmented_copy(self):
+        original = self.img.copy()
+        for use_face_roi in (True, False):
+            for use_warp in (True, False):
+                params = AugmentParams(1.2, 1.25, use_face_roi, use_warp)
+                augmented = augment_array(self.img, self.points, params)
+                self.assertEqual(augmented.shape, self.img.shape)
+                self.assertEqual(augmented.dtype, np.uint8)
+                self.assertFalse(np.array_equal(augmented, self.img))
+                np.testing.assert_array_equal(self.img, original)
+
+    def test_points_and_rows_give_same_result(self):
+        rows = landmark_rows(self.points, image_id=7)
+        np.testing.assert_array_equal(rows[:, 3:5], self.points)
+        self.assertEqual(list(np.bincount(rows[:, 1])), [17, 10, 9, 12, 20])
+        np.testing.assert_array_equal(augment_array(self.img, rows), augment_array(self.img, self.points))
+
+    def test_invalid_inputs(self):
+        with self.assertRaises(ValueError):
+            augment_array(self.img.astype(np.float32), self.points)
+        with self.assertRaises(ValueError):
+            augment_array(self.img[:, :, 0], self.points)
+        with self.assertRaises(ValueError):
+            augment_array(self.img, self.points[:60])
+        rows = landmark_rows(self.points)
+        rows[0, 0] = 1
+        with self.assertRaises(ValueError):
+            augment_array(self.img, rows)
+
+    def test_params_from_statistics(self):
+        faces = [landmark_rows(face_points(size=size), image_id) for image_id, size in enumerate([80, 100, 120])]
+        stats = FeatureStatistics.from_features(np.vstack(faces))
+        params = AugmentParams.from_statistics(self.points, stats, use_warp=False)
+        self.assertGreaterEqual(params.nose_scale_factor, 1)
+        self.assertLessEqual(params.nose_scale_factor, 1.25)
+        self.assertLessEqual(params.mouth_scale_factor, 1.25)
+        self.assertFalse(params.use_warp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 # test_augment_integration.py
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
+import tempfile
 import numpy as np
 import cv2
 import sys
@@ -9,52 +10,51 @@ import os
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
-from augmentation.augment import augment_image, augment_nose, augment_eyes
+import augmentation.augment as augment
+from augmentation.augment import augment_image, augment_array, AugmentParams
+from tests.test_augment_array import face_points
 
 class TestAugmentingFeatures(unittest.TestCase):
-    
-    def setUp(self):
-        # Set up a dummy image with the correct shape
-        self.dummy_image = np.zeros((4032, 3024, 3), dtype=np.uint8)
-        self.dummy_features = np.array([[10, 10], [20, 20]])
-        self.dummy_image_id = 0
-
-    @patch('augmentation.augment.cv2.imread')
-    @patch('os.listdir')
-    @patch('utils.file_utils.get_dir')
-    @patch('augmentation.nose.resize_nose')
-    @patch('landmarking.load.load_feature_landmarks')
-    @patch('augmentation.nose.create_nose_mask')
-    @patch('augmentation.augment.augment_nose')
-    @patch('augmentation.augment.augment_eyes')
-    @patch('cv2.GaussianBlur')
-    @patch('cv2.imwrite')
-    def test_augment_image(self, mock_imwrite, mock_blur, mock_augment_nose, 
-                           mock_augment_eyes, mock_create_mask, mock_load_landmarks, 
-                           mock_resize_nose, mock_get_dir, mock_listdir, mock_imread):
-        # Mock the dependencies that interact with the file system
-        mock_get_dir.side_effect = lambda x: '/test/dir/' + x
-        mock_listdir.return_value = ['image1.jpg', 'image2.png']
-        mock_imread.return_value = self.dummy_image
-
-        # Mock the image processing functions
-        mock_load_landmarks.return_value = self.dummy_features
-        mock_create_mask.return_value = self.dummy_image
-        mock_blur.return_value = self.dummy_image
-        mock_resize_nose.return_value = self.dummy_image
-        mock_augment_nose.return_value = self.dummy_image
-        mock_augment_eabout:blank#blockedyes.return_value = self.dummy_image
-        mock_imwrite.return_value = True
-
-        # Run the function under test
-        augment_image()
 
-        # Verify that the image processing functions were called correctly
-        mock_augment_nose.assert_called()
-        mock_augment_eyes.assert_called()
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.img = cv2.GaussianBlur(rng.integers(40, 220, (480, 400, 3), dtype=np.uint8), (0, 0), 3)
+        self.points = face_points()
+
+    def stage_mocks(self):
+        # The stages of augment_array, still run for real but recorded
+        return [patch.object(augment, name, wraps=getattr(augment, name)) for name in
+                ('augment_features', 'augment_nose', 'augment_mouth', 'augment_eyes')]
+
+    @patch('augmentation.pipeline.cv2.imwrite', return_value=True)
+    def test_augment_image(self, mock_imwrite):
+        # The default path exaggerates the nose and mouth with one warp, then augments the eyes
+        mocks = self.stage_mocks()
+        with tempfile.TemporaryDirectory() as cache_directory, tempfile.TemporaryDirectory() as augmented_directory, \
+                mocks[0] as mock_features, mocks[1] as mock_nose, mocks[2] as mock_mouth, mocks[3] as mock_eyes:
+            augment_image(cache_directory=cache_directory, augmented_directory=augmented_directory)
+        mock_features.assert_called()
+        mock_eyes.assert_called()
+        mock_nose.assert_not_called()
+        mock_mouth.assert_not_called()
+        mock_imwrite.assert_called()
+
+    def test_stages_of_each_path(self):
+        for use_warp in (True, False):
+            mocks = self.stage_mocks()
+            with mocks[0] as mock_features, mocks[1] as mock_nose, mocks[2] as mock_mouth, mocks[3] as mock_eyes:
+                augmented = augment_array(self.img, self.points, AugmentParams(use_warp=use_warp))
+            self.assertEqual(augmented.shape, self.img.shape)
+            mock_eyes.assert_called_once()
+            if use_warp:
+                mock_features.assert_called_once()
+                mock_nose.assert_not_called()
+                mock_mouth.assert_not_called()
+            else:
+                # The legacy path resizes and blends the nose, then the mouth
+                mock_features.assert_not_called()
+                mock_nose.assert_called_once()
+                mock_mouth.assert_called_once()
 
 if __name__ == '__main__':
     unittest.main()
-
-
-
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import tempfile
+import shutil
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.batch import augment_batch
+from augmentation.augment import augmented_path
+from landmarking.store import save_landmark_store
+
+def fake_augment_image_file(img_path, img_num, landmark_store, feature_stats, augmented_directory, cache=None, memory_budget=None):
+    if 'bad' in img_path:
+        raise ValueError("No landmarks found.")
+    if 'crash' in img_path:
+        # A worker killed mid image, e.g. for running out of memory
+        os._exit(1)
+    # The worker state must have been initialised before any image is processed
+    assert landmark_store is not None and feature_stats is not None
+    augmented_img_path = augmented_path(augmented_directory, img_path)
+    open(augmented_img_path, 'w').close()
+    return augmented_img_path
+
+class TestAugmentBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, 'original_images'))
+        self.names = ['a.jpg', 'bad.jpg', 'c.png', 'd.jpeg', 'e.jpg']
+        for name in self.names:
+            open(os.path.join(self.directory, 'original_images', name), 'w').close()
+        rows = [[image_id, 0, n, image_id * 10 + n, n] for image_id in range(len(self.names)) for n in range(68)]
+        save_landmark_store(os.path.join(self.directory, 'facial_features.lmk'), np.array(rows), self.names)
+        self.image_paths = [os.path.join(self.directory, 'original_images', name) for name in self.names]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @patch('augmentation.batch.augment_image_file', side_effect=fake_augment_image_file)
+    def test_failures_are_reported_per_image(self, mock_augment):
+        results = augment_batch(self.image_paths, workers=2, max_in_flight=2, data_directory=self.directory)
+        self.assertEqual([result[0] for result in results], self.image_paths)
+        for img_path, augmented_img_path, error in results:
+            if 'bad' in img_path:
+                self.assertIsNone(augmented_img_path)
+                self.assertIn("No landmarks found", error)
+            else:
+                self.assertIsNone(error)
+                self.assertTrue(os.path.exists(augmented_img_path))
+
+    @patch('augmentation.batch.augment_image_file', side_effect=fake_augment_image_file)
+    def test_worker_crash_only_fails_its_image(self, mock_augment):
+        names = ['f.jpg', 'crash.jpg', 'g.jpg', 'h.jpg']
+        image_paths = [os.path.join(self.directory, 'original_images', name) for name in names]
+        results = augment_batch(image_paths, workers=2, max_in_flight=4, data_directory=self.directory)
+        self.assertEqual([result[0] for result in results], image_paths)
+        for img_path, augmented_img_path, error in results:
+            if 'crash' in img_path:
+                self.assertIsNone(augmented_img_path)
+                self.assertIn("terminated abruptly", error)
+            else:
+                self.assertIsNone(error)
+                self.assertTrue(os.path.exists(augmented_img_path))
+
+    def test_invalid_max_in_flight(self):
+        with self.assertRaises(ValueError):
+            augment_batch(self.image_paths, workers=2, max_in_flight=-1, data_directory=self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
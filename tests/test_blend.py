@@ -0,0 +1,61 @@
+import unittest
+import importlib
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.blend import blend, mask_weights
+# The package re-exports blend(), so fetch the module itself to change BAND_ROWS
+blend_module = importlib.import_module('augmentation.blend')
+
+class TestBlend(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.foreground = rng.integers(0, 256, (300, 40, 3), dtype=np.uint8)
+        self.background = rng.integers(0, 256, (300, 40, 3), dtype=np.uint8)
+        self.mask = rng.integers(0, 256, (300, 40), dtype=np.uint8)
+        weights = self.mask[:, :, None] / 255
+        self.expected = self.foreground * weights + self.background * (1 - weights)
+
+    def test_fixed_point_matches_float64(self):
+        result = blend(self.foreground, self.background, self.mask)
+        self.assertEqual(result.dtype, np.uint8)
+        np.testing.assert_array_equal(result, np.rint(self.expected))
+
+    def test_three_channel_mask(self):
+        mask = np.repeat(self.mask[:, :, None], 3, axis=2)
+        np.testing.assert_array_equal(blend(self.foreground, self.background, mask), blend(self.foreground, self.background, self.mask))
+
+    def test_in_place(self):
+        expected = blend(self.foreground, self.background, self.mask)
+        out = self.background.copy()
+        result = blend(self.foreground, out, self.mask, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, expected)
+
+    def test_float_images(self):
+        result = blend(self.foreground / 255, self.background / 255, self.mask)
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_allclose(result, self.expected / 255, atol=1e-6)
+
+    def test_band_boundaries(self):
+        # Results must not depend on how the rows are split into bands
+        original = blend_module.BAND_ROWS
+        try:
+            blend_module.BAND_ROWS = 7
+            result = blend(self.foreground, self.background, self.mask)
+        finally:
+            blend_module.BAND_ROWS = original
+        np.testing.assert_array_equal(result, np.rint(self.expected))
+
+    def test_float_mask_weights(self):
+        np.testing.assert_array_equal(mask_weights(np.array([[0.0, 0.5, 1.0]])), [[0, 128, 255]])
+
+    def test_mismatched_shapes(self):
+        with self.assertRaises(ValueError):
+            blend(self.foreground, self.background[:10], self.mask)
+
+if __name__ == '__main__':
+    unittest.main()
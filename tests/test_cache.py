@@ -0,0 +1,101 @@
+import unittest
+import tempfile
+import shutil
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.cache import MapCache, cached
+
+class TestMapCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.landmarks = np.array([[0, 2, n, 100 + n, 200 + n] for n in range(9)])
+        self.maps = (np.arange(12, dtype=np.float32).reshape(3, 4), np.ones((3, 4), np.float32))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key_depends_on_landmarks_and_parameters(self):
+        key = MapCache.key('warp', self.landmarks, (3, 4), {'nose': 1.2, 'lips': 1.1})
+        self.assertEqual(key, MapCache.key('warp', self.landmarks.copy(), (3, 4), {'lips': 1.1, 'nose': 1.2}))
+        moved = self.landmarks.copy()
+        moved[0, 3] += 1
+        self.assertNotEqual(key, MapCache.key('warp', moved, (3, 4), {'nose': 1.2, 'lips': 1.1}))
+        self.assertNotEqual(key, MapCache.key('warp', self.landmarks, (3, 4), {'nose': 1.25, 'lips': 1.1}))
+        self.assertNotEqual(key, MapCache.key('eye_masks', self.landmarks, (3, 4), {'nose': 1.2, 'lips': 1.1}))
+
+    def test_memory_hits_and_misses(self):
+        cache = MapCache()
+        calls = []
+        compute = lambda: calls.append(1) or self.maps
+        first = cache.get_or_compute('a', compute)
+        second = cache.get_or_compute('a', compute)
+        self.assertEqual(len(calls), 1)
+        self.assertIs(first, second)
+        self.assertFalse(first[0].flags.writeable)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['disk_hits'], stats['misses']), (1, 0, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_least_recently_used_is_evicted(self):
+        entry_bytes = sum(array.nbytes for array in self.maps)
+        cache = MapCache(max_bytes=2 * entry_bytes)
+        for key in ['a', 'b']:
+            cache.put(key, self.maps)
+        cache.get('a')
+        cache.put('c', self.maps)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['memory_bytes'], 2 * entry_bytes)
+
+    def test_disk_tier(self):
+        MapCache(directory=self.directory).put('a', self.maps)
+        cache = MapCache(directory=self.directory)
+        arrays = cache.get('a')
+        for array, expected in zip(arrays, self.maps):
+            np.testing.assert_array_equal(array, expected)
+        cache.get('a')
+        self.assertEqual((cache.hits, cache.disk_hits, cache.misses), (1, 1, 0))
+
+    def test_disk_tier_evicts_least_recently_used(self):
+        cache = MapCache(directory=self.directory)
+        cache.put('a', self.maps)
+        file_bytes = os.path.getsize(os.path.join(self.directory, 'a.npz'))
+        cache = MapCache(directory=self.directory, max_disk_bytes=int(2.5 * file_bytes))
+        cache.put('b', self.maps)
+        # A disk hit renews a, so b is the oldest file when c goes over the cap
+        os.utime(os.path.join(self.directory, 'a.npz'), (0, 0))
+        os.utime(os.path.join(self.directory, 'b.npz'), (1, 1))
+        MapCache(directory=self.directory).get('a')
+        cache.put('c', self.maps)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.npz', 'c.npz'])
+
+    def test_writes_leave_no_temporary_files(self):
+        caches = [MapCache(directory=self.directory) for _ in range(2)]
+        for cache in caches:
+            cache.put('a', self.maps)
+        self.assertEqual(os.listdir(self.directory), ['a.npz'])
+
+    def test_damaged_file_is_a_miss(self):
+        with open(os.path.join(self.directory, 'a.npz'), 'wb') as file:
+            file.write(b'not an npz file')
+        cache = MapCache(directory=self.directory)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', self.maps)
+        self.assertIsNotNone(MapCache(directory=self.directory).get('a'))
+
+    def test_clear(self):
+        cache = MapCache(directory=self.directory)
+        cache.put('a', self.maps)
+        cache.clear(disk=True)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_without_cache(self):
+        self.assertIs(cached(None, 'warp', (self.landmarks,), lambda: self.maps), self.maps)
+
+if __name__ == '__main__':
+    unittest.main()
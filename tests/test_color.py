@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.color import ycbcr_from_rgb, rgb_from_ycbcr, TOLERANCE
+
+def reference_ycbcr(image):
+    # The float64 conversion img_utils.rgb_to_ycbcr used to run
+    ycbcr = image.dot(np.array([[.299, .587, .114], [-.1687, -.3313, .5], [.5, -.4187, -.0813]]).T)
+    ycbcr[:, :, [1, 2]] += 128
+    return np.clip(ycbcr, 0, 255).astype(np.uint8)
+
+def reference_rgb(image):
+    # and the float32 conversion back of img_utils.ycbcr_to_rgb
+    image = image.astype(np.float32)
+    Y, Cb, Cr = image[:, :, 0], image[:, :, 1] - 128, image[:, :, 2] - 128
+    return np.clip(np.stack((Y + 1.402 * Cr, Y - 0.344136 * Cb - 0.714136 * Cr, Y + 1.772 * Cb), axis=-1), 0, 255).astype(np.uint8)
+
+class TestColor(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+        # Every grey level and the corners of the cube as well
+        self.image[0, :256] = np.arange(256)[:, None]
+        self.image[1, :8] = [[r, g, b] for r in (0, 255) for g in (0, 255) for b in (0, 255)]
+
+    def assert_within_tolerance(self, result, expected):
+        self.assertEqual(result.shape, expected.shape)
+        self.assertEqual(result.dtype, np.uint8)
+        self.assertLessEqual(np.abs(result.astype(int) - expected).max(), TOLERANCE)
+
+    def test_matches_reference(self):
+        for fixed_point in (False, True):
+            self.assert_within_tolerance(ycbcr_from_rgb(self.image, fixed_point=fixed_point), reference_ycbcr(self.image))
+            self.assert_within_tolerance(rgb_from_ycbcr(self.image, fixed_point=fixed_point), reference_rgb(self.image))
+        # Float images take the float32 path
+        floats = self.image.astype(np.float32)
+        self.assert_within_tolerance(ycbcr_from_rgb(floats), reference_ycbcr(floats))
+        self.assert_within_tolerance(rgb_from_ycbcr(floats), reference_rgb(floats))
+
+    def test_grey_round_trip(self):
+        # Grey levels have no chroma and come back unchanged
+        grey = np.repeat(np.arange(256, dtype=np.uint8)[None, :, None], 3, axis=2)
+        for fixed_point in (False, True):
+            ycbcr = ycbcr_from_rgb(grey, fixed_point=fixed_point)
+            np.testing.assert_array_equal(ycbcr[0, :, 1:], 128)
+            np.testing.assert_array_equal(rgb_from_ycbcr(ycbcr, fixed_point=fixed_point), grey)
+
+    def test_y_only_and_out(self):
+        for fixed_point in (False, True):
+            full = ycbcr_from_rgb(self.image, fixed_point=fixed_point)
+            out = np.empty(self.image.shape[:2], dtype=np.uint8)
+            y = ycbcr_from_rgb(self.image, out=out, y_only=True, fixed_point=fixed_point)
+            self.assertIs(y, out)
+            # cv2.transform rounds three output channels less precisely than one, hence the tolerance
+            self.assert_within_tolerance(y, full[:, :, 0])
+            if fixed_point:
+                np.testing.assert_array_equal(y, full[:, :, 0])
+            # In place
+            image = self.image.copy()
+            self.assertIs(rgb_from_ycbcr(image, out=image, fixed_point=fixed_point), image)
+            np.testing.assert_array_equal(image, rgb_from_ycbcr(self.image, fixed_point=fixed_point))
+        with self.assertRaises(ValueError):
+            ycbcr_from_rgb(self.image, out=np.empty(self.image.shape, dtype=np.float32))
+
+if __name__ == '__main__':
+    unittest.main()
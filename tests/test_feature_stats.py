@@ -0,0 +1,93 @@
+import unittest
+import numpy as np
+import tempfile
+import shutil
+import time
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from landmarking.feature_stats import FeatureStatistics, load_feature_statistics, update_feature_statistics
+from landmarking.landmark_math import feature_statistics
+from landmarking.store import save_landmark_store, open_landmark_store, dataset_version
+
+def make_features(n_images, seed):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for image_id in range(n_images):
+        for n in range(68):
+            rows.append([image_id, np.searchsorted([17, 27, 36, 48], n, side='right'), n, rng.integers(0, 4000), rng.integers(0, 3000)])
+    return np.array(rows, dtype=np.int64)
+
+class TestFeatureStatistics(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.features = make_features(6, 3)
+        self.keys = [f'{i}.jpg' for i in range(6)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assert_matches_full_build(self, stats, features):
+        _, _, global_avgs, std_devs = feature_statistics(features)
+        np.testing.assert_allclose(stats.global_avgs, global_avgs, rtol=1e-10)
+        np.testing.assert_allclose(stats.std_devs, std_devs, rtol=1e-10)
+
+    def test_full_build(self):
+        stats = FeatureStatistics.from_features(self.features, self.keys)
+        self.assert_matches_full_build(stats, self.features)
+        self.assertEqual(len(stats.sizes), 6)
+
+    def test_welford_add_and_remove(self):
+        stats = FeatureStatistics.from_features(self.features[self.features[:, 0] < 4], self.keys)
+        for image_id in [4, 5]:
+            stats.add_image_features(self.keys[image_id], self.features[self.features[:, 0] == image_id])
+        self.assert_matches_full_build(stats, self.features)
+        stats.remove(self.keys[0])
+        self.assert_matches_full_build(stats, self.features[self.features[:, 0] != 0])
+
+    def test_add_replaces_existing_image(self):
+        stats = FeatureStatistics.from_features(self.features, self.keys)
+        replacement = make_features(1, 9)
+        stats.add_image_features(self.keys[0], replacement)
+        expected = np.vstack([replacement, self.features[self.features[:, 0] != 0]])
+        self.assert_matches_full_build(stats, expected)
+
+    def test_save_and_load(self):
+        stats = FeatureStatistics.from_features(self.features, self.keys, 'v1')
+        path = os.path.join(self.directory, 'feature_stats.npz')
+        stats.save(path)
+        loaded = FeatureStatistics.load(path)
+        self.assertEqual(loaded.version, 'v1')
+        np.testing.assert_array_equal(loaded.image_sizes('3.jpg'), stats.image_sizes('3.jpg'))
+        np.testing.assert_array_equal(loaded.std_devs, stats.std_devs)
+
+    def test_stale_statistics_are_rebuilt(self):
+        store_path = os.path.join(self.directory, 'facial_features.lmk')
+        save_landmark_store(store_path, self.features[self.features[:, 0] < 3], self.keys[:3])
+        stats = load_feature_statistics(self.directory)
+        self.assertEqual(len(stats.sizes), 3)
+        self.assertEqual(load_feature_statistics(self.directory).version, dataset_version(self.directory))
+        time.sleep(0.01)
+        save_landmark_store(store_path, self.features, self.keys)
+        stats = load_feature_statistics(self.directory)
+        self.assertEqual(len(stats.sizes), 6)
+
+    def test_incremental_update_matches_full_build(self):
+        store_path = os.path.join(self.directory, 'facial_features.lmk')
+        save_landmark_store(store_path, self.features[self.features[:, 0] < 5], self.keys[:5])
+        load_feature_statistics(self.directory)
+        previous_version = dataset_version(self.directory)
+        # Drop image 0 and add image 5, which renumbers every remaining image
+        features = self.features[self.features[:, 0] > 0].copy()
+        features[:, 0] -= 1
+        time.sleep(0.01)
+        save_landmark_store(store_path, features, self.keys[1:])
+        stats = update_feature_statistics(open_landmark_store(store_path), [4], previous_version, self.directory)
+        self.assertEqual(sorted(stats.sizes), self.keys[1:])
+        self.assert_matches_full_build(stats, features)
+        self.assertEqual(stats.version, dataset_version(self.directory))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,7 @@ import os
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
-from utils.img_utils import rgb_to_ycbcr, ycbcr_to_rgb, dynamic_range_compression, equalize_grayscale, match_histograms, equalize_color, alpha_blend
+from utils.img_utils import rgb_to_ycbcr, ycbcr_to_rgb, dynamic_range_compression, equalize_grayscale, match_histograms, equalize_color, alpha_blend, poisson_blend, HistogramMatcher, match_histograms_batch
 
 class TestImageUtils(unittest.TestCase):
     def setUp(self):
@@ -87,5 +87,65 @@ class TestImageUtils(unittest.TestCase):
         end_time = time.time()
         self.assertTrue(end_time - start_time < 5, "Dynamic range compression should run in less than 5 seconds.")
 
+    def test_histogram_matcher(self):
+        rng = np.random.default_rng(0)
+        template = cv2.GaussianBlur(rng.integers(0, 256, (80, 120, 3), dtype=np.uint8), (0, 0), 2)
+        sources = [np.clip(template.astype(int) * 0.6 + 40 * n, 0, 255).astype(np.uint8) for n in range(3)]
+        matcher = HistogramMatcher(template)
+        self.assertEqual(len(matcher.template_cdfs), 3)
+        self.assertEqual(matcher.template_cdfs[0][-1], 1)
+        matched = matcher.match_batch(sources)
+        for source, result in zip(sources, matched):
+            np.testing.assert_array_equal(result, match_histograms(source, template))
+        np.testing.assert_array_equal(match_histograms_batch(sources, template)[1], matched[1])
+        # The level tables are monotonic and sources of another size and grayscale ones are matched too
+        lut = matcher.lut(matcher.preprocess(sources[0]))
+        self.assertEqual(lut.shape, (256, 1, 3))
+        self.assertTrue((np.diff(lut.astype(int), axis=0) >= 0).all())
+        self.assertEqual(matcher.match(sources[0][:40]).shape, (40, 120, 3))
+        self.assertEqual(matcher.match(cv2.cvtColor(sources[0], cv2.COLOR_BGR2GRAY)).shape, (80, 120))
+
+    def poisson_inputs(self):
+        rng = np.random.default_rng(0)
+        target = cv2.GaussianBlur(rng.random((120, 160, 3)), (0, 0), 4) * 0.5 + 0.25
+        source = cv2.GaussianBlur(rng.random((60, 80, 3)), (0, 0), 2) * 0.4 + 0.3
+        mask = np.zeros((60, 80), dtype=np.uint8)
+        cv2.ellipse(mask, (40, 30), (30, 20), 0, 0, 360, 255, -1)
+        return mask, source, target
+
+    def test_poisson_blend_solves_equation(self):
+        mask, source, target = self.poisson_inputs()
+        blended = poisson_blend(mask, source, target.copy(), (30, 40))
+        # Inside the mask the discrete Laplacian of the result is that of the source, outside it the target is kept
+        ys, xs = np.nonzero(mask)
+        laplacian = lambda img, y, x: 4*img[y, x] - img[y - 1, x] - img[y + 1, x] - img[y, x - 1] - img[y, x + 1]
+        np.testing.assert_allclose(laplacian(blended, ys + 30, xs + 40), laplacian(source, ys, xs), atol=1e-9)
+        outside = np.ones(target.shape[:2], dtype=bool)
+        outside[ys + 30, xs + 40] = False
+        np.testing.assert_array_equal(blended[outside], target[outside])
+
+    def test_poisson_blend_shifted_copy(self):
+        # A brightened copy of the target has its gradients, so blending it back gives the target
+        mask, _, target = self.poisson_inputs()
+        blended = poisson_blend(mask, target[30:90, 40:120] + 0.1, target.copy(), (30, 40))
+        np.testing.assert_allclose(blended, target, atol=1e-9)
+
+    def test_poisson_blend_clipped_offset(self):
+        mask, source, target = self.poisson_inputs()
+        blended = poisson_blend(mask, source[:, :, 0], target[:, :, 0].copy(), (-10, 100))
+        self.assertEqual(blended.shape, target.shape[:2])
+        np.testing.assert_array_equal(blended[:, :100], target[:, :100, 0])
+
+    def test_poisson_blend_multigrid(self):
+        mask, source, target = self.poisson_inputs()
+        direct = poisson_blend(mask, source, target.copy(), (30, 40))
+        iterative = poisson_blend(mask, source, target.copy(), (30, 40), solver='multigrid', tolerance=1e-8)
+        np.testing.assert_allclose(iterative, direct, atol=1e-6)
+        # Warm started from the solution a single iteration is enough
+        warm = poisson_blend(mask, source, target.copy(), (30, 40), solver='multigrid', initial=direct, max_iterations=1)
+        np.testing.assert_allclose(warm, direct, atol=1e-9)
+        with self.assertRaises(ValueError):
+            poisson_blend(mask, source, target.copy(), (30, 40), solver='jacobi')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
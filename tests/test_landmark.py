@@ -0,0 +1,145 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import tempfile
+import shutil
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from landmarking.landmark import update_landmarks, load_manifest, save_manifest, group_rows_by_image, landmark_image_paths, main
+from landmarking.store import STORE_FILENAME
+
+def fake_process_image_to_array(image_path, image_path_to_int, feature_to_int, detection_max_side=None):
+    # 68 landmark rows whose coordinates depend on the file contents
+    with open(image_path, 'rb') as file:
+        seed = sum(file.read())
+    image_id = image_path_to_int[image_path]
+    return np.array([[image_id, 0, n, seed + n, seed - n] for n in range(68)])
+
+class TestIncrementalLandmarking(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.feature_to_int = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
+        self.image_paths = []
+        for name, contents in [('a.jpg', b'aaa'), ('b.jpg', b'bbbb'), ('c.jpg', b'c')]:
+            path = os.path.join(self.directory, name)
+            with open(path, 'wb') as file:
+                file.write(contents)
+            self.image_paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_update(self, image_paths, previous_features, manifest, incremental=True):
+        with patch('landmarking.landmark.process_image_to_array', side_effect=fake_process_image_to_array) as mock_process:
+            result = update_landmarks(image_paths, previous_features, manifest, self.feature_to_int, incremental)
+        return result + (mock_process.call_count,)
+
+    def test_unchanged_images_are_not_redetected(self):
+        features, manifest, changed, calls = self.run_update(self.image_paths, None, load_manifest('missing.json'), incremental=False)
+        self.assertEqual(calls, 3)
+        features2, manifest2, changed2, calls2 = self.run_update(self.image_paths, features, manifest)
+        self.assertEqual(calls2, 0)
+        self.assertEqual(changed2, [])
+        np.testing.assert_array_equal(features, features2)
+
+    def test_only_changed_image_is_redetected(self):
+        features, manifest, _, _ = self.run_update(self.image_paths, None, {}, incremental=False)
+        with open(self.image_paths[1], 'wb') as file:
+            file.write(b'changed')
+        features2, _, changed, calls = self.run_update(self.image_paths, features, manifest)
+        self.assertEqual(calls, 1)
+        self.assertEqual(changed, [self.image_paths[1]])
+        expected, _, _, _ = self.run_update(self.image_paths, None, {}, incremental=False)
+        np.testing.assert_array_equal(features2, expected)
+
+    def test_touched_but_identical_image_is_reused(self):
+        features, manifest, _, _ = self.run_update(self.image_paths, None, {}, incremental=False)
+        os.utime(self.image_paths[0], ns=(0, 0))
+        _, manifest2, _, calls = self.run_update(self.image_paths, features, manifest)
+        self.assertEqual(calls, 0)
+        self.assertEqual(manifest2['images']['a.jpg']['mtime_ns'], 0)
+
+    def test_new_image_shifts_ids_of_existing_rows(self):
+        features, manifest, _, _ = self.run_update(self.image_paths[1:], None, {}, incremental=False)
+        features2, _, changed, calls = self.run_update(self.image_paths, features, manifest)
+        self.assertEqual(calls, 1)
+        self.assertEqual(changed, [self.image_paths[0]])
+        expected, _, _, _ = self.run_update(self.image_paths, None, {}, incremental=False)
+        np.testing.assert_array_equal(features2, expected)
+
+    def test_manifest_round_trip(self):
+        _, manifest, _, _ = self.run_update(self.image_paths, None, {}, incremental=False)
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        save_manifest(manifest, manifest_path)
+        self.assertEqual(load_manifest(manifest_path), manifest)
+
+    def test_group_rows_by_image(self):
+        features = np.array([[1, 0, 0, 5, 5], [0, 0, 0, 1, 1], [1, 0, 1, 6, 6]])
+        groups = group_rows_by_image(features)
+        np.testing.assert_array_equal(groups[1][:, 2], [0, 1])
+        self.assertEqual(len(groups[0]), 1)
+
+class TestLandmarkingMain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, 'data', 'original_images'))
+        for name, contents in [('a.jpg', b'aaa'), ('b.jpg', b'bbbb')]:
+            with open(os.path.join(self.directory, 'data', 'original_images', name), 'wb') as file:
+                file.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_main(self):
+        # main with data/ in the temporary directory, returns the store's modification time
+        get_dir = lambda relative_path: os.path.join(self.directory, relative_path)
+        with patch('landmarking.landmark.get_dir', side_effect=get_dir), patch('landmarking.store.get_dir', side_effect=get_dir), \
+                patch('landmarking.feature_stats.get_dir', side_effect=get_dir), \
+                patch('landmarking.landmark.process_image_to_array', side_effect=fake_process_image_to_array), \
+                patch('landmarking.landmark.draw_landmarks_and_save'):
+            main(incremental=True)
+        return os.stat(os.path.join(self.directory, 'data', STORE_FILENAME)).st_mtime_ns
+
+    def test_unchanged_run_leaves_store_alone(self):
+        first = self.run_main()
+        os.utime(os.path.join(self.directory, 'data', STORE_FILENAME), ns=(0, 0))
+        self.assertEqual(self.run_main(), 0)
+        # Removing an image rewrites it
+        os.remove(os.path.join(self.directory, 'data', 'original_images', 'a.jpg'))
+        self.assertNotEqual(self.run_main(), 0)
+        self.assertGreater(first, 0)
+
+class TestParallelLandmarking(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.feature_to_int = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
+        self.image_paths = []
+        for i in range(7):
+            path = os.path.join(self.directory, f'{i}.jpg')
+            with open(path, 'wb') as file:
+                file.write(bytes([i + 1]) * (i + 1))
+            self.image_paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @patch('landmarking.landmark.init_worker')
+    @patch('landmarking.landmark.process_image_to_array', side_effect=fake_process_image_to_array)
+    def test_parallel_matches_serial(self, mock_process, mock_init_worker):
+        image_ids = list(range(len(self.image_paths)))
+        serial = list(landmark_image_paths(self.image_paths, image_ids, self.feature_to_int, workers=1))
+        parallel = list(landmark_image_paths(self.image_paths, image_ids, self.feature_to_int, workers=3, chunk_size=2))
+        self.assertEqual(len(serial), len(parallel))
+        for expected, actual in zip(serial, parallel):
+            self.assertEqual(expected.dtype, actual.dtype)
+            np.testing.assert_array_equal(expected, actual)
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            list(landmark_image_paths(self.image_paths, [0], self.feature_to_int, workers=2, chunk_size=0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from landmarking.landmark_math import avg_feature_sizes, global_avg_sizes, std_dev_features, feature_size_table, feature_statistics, REGION_NAMES
+
+def loop_global_avg_sizes(features):
+    # The per image implementation the batched functions replace
+    total_sizes = {region: [] for region in REGION_NAMES}
+    for img_id in np.unique(features[:, 0]):
+        for region, size in avg_feature_sizes(features, img_id).items():
+            total_sizes[region].append(size)
+    return {region: np.mean(sizes) for region, sizes in total_sizes.items()}
+
+def loop_std_dev_features(features, global_avgs):
+    deviations = {region: [] for region in global_avgs.keys()}
+    for img_id in np.unique(features[:, 0]):
+        img_sizes = avg_feature_sizes(features, img_id)
+        for region, global_avg in global_avgs.items():
+            deviations[region].append(img_sizes[region] - global_avg)
+    return {region: np.std(devs) for region, devs in deviations.items()}
+
+class TestLandmarkMath(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        rows = []
+        for image_id in [4, 0, 7, 2, 9]:
+            for n in range(68):
+                rows.append([image_id, np.searchsorted([17, 27, 36, 48], n, side='right'), n, rng.integers(0, 4000), rng.integers(0, 3000)])
+        self.features = np.array(rows, dtype=np.int32)
+        # Interleave the images so grouping has to keep the original row order
+        self.features = self.features[rng.permutation(len(self.features))]
+
+    def test_size_table_matches_avg_feature_sizes(self):
+        image_ids, sizes = feature_size_table(self.features)
+        np.testing.assert_array_equal(image_ids, [0, 2, 4, 7, 9])
+        for image_id, image_sizes in zip(image_ids, sizes):
+            expected = avg_feature_sizes(self.features, image_id)
+            np.testing.assert_allclose(image_sizes, [expected[region] for region in REGION_NAMES], rtol=1e-12)
+
+    def test_statistics_match_loop_implementation(self):
+        expected_avgs = loop_global_avg_sizes(self.features)
+        expected_devs = loop_std_dev_features(self.features, expected_avgs)
+        avgs = global_avg_sizes(self.features)
+        devs = std_dev_features(self.features, avgs)
+        _, _, avg_array, dev_array = feature_statistics(self.features)
+        for r, region in enumerate(REGION_NAMES):
+            self.assertAlmostEqual(avgs[region], expected_avgs[region], places=9)
+            self.assertAlmostEqual(devs[region], expected_devs[region], places=9)
+            self.assertAlmostEqual(avg_array[r], expected_avgs[region], places=9)
+            self.assertAlmostEqual(dev_array[r], expected_devs[region], places=9)
+
+    def test_region_with_one_point_has_zero_size(self):
+        features = np.array([[0, 0, 0, 0, 0], [0, 0, 1, 3, 4], [0, 2, 27, 5, 5]])
+        _, sizes = feature_size_table(features)
+        np.testing.assert_allclose(sizes[0], [5, 0, 0, 0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from landmarking.load import load_feature_landmarks, LandmarkIndex, get_landmark_index
+
+class TestLandmarkIndex(unittest.TestCase):
+    def setUp(self):
+        self.feature_to_int = {'jawline': 0, 'eyebrows': 1, 'nose': 2, 'eyes': 3, 'lips': 4}
+        rng = np.random.default_rng(0)
+        rows = []
+        for image_id in [3, 0, 5, 1]:
+            for feature, indices in enumerate([range(17), range(17, 27), range(27, 36), range(36, 48), range(48, 68)]):
+                for n in indices:
+                    rows.append([image_id, feature, n, rng.integers(0, 4000), rng.integers(0, 3000)])
+        self.facial_features = np.array(rows)
+        rng.shuffle(self.facial_features)
+
+    def test_matches_boolean_mask(self):
+        for image_id in [0, 1, 3, 5]:
+            for feature_name, feature in self.feature_to_int.items():
+                mask = (self.facial_features[:, 0] == image_id) & (self.facial_features[:, 1] == feature)
+                expected = self.facial_features[mask][:, 3:5]
+                actual = load_feature_landmarks(self.facial_features, image_id, self.feature_to_int, feature_name)
+                np.testing.assert_array_equal(actual, expected)
+
+    def test_lookup_is_a_view(self):
+        index = LandmarkIndex(self.facial_features)
+        landmarks = index.lookup(3, 2)
+        self.assertTrue(np.shares_memory(landmarks, index.rows))
+        self.assertFalse(landmarks.flags.writeable)
+
+    def test_index_is_reused_for_the_same_array(self):
+        self.assertIs(get_landmark_index(self.facial_features), get_landmark_index(self.facial_features))
+        self.assertIsNot(get_landmark_index(self.facial_features), get_landmark_index(self.facial_features.copy()))
+
+    def test_index_follows_in_place_edits(self):
+        nose = load_feature_landmarks(self.facial_features, 3, self.feature_to_int, 'nose')
+        # The indexed array is read-only, an edit in place cannot go unnoticed
+        self.assertFalse(self.facial_features.flags.writeable)
+        with self.assertRaises(ValueError):
+            self.facial_features[:, 3] += 1
+        # Made writeable again and edited, the next lookup rebuilds the index
+        self.facial_features.flags.writeable = True
+        self.facial_features[:, 3] += 1
+        edited = load_feature_landmarks(self.facial_features, 3, self.feature_to_int, 'nose')
+        np.testing.assert_array_equal(edited[:, 0], nose[:, 0] + 1)
+
+    def test_image_rows_and_ids(self):
+        index = LandmarkIndex(self.facial_features)
+        np.testing.assert_array_equal(index.image_ids(), [0, 1, 3, 5])
+        self.assertEqual(len(index.image_rows(5)), 68)
+        self.assertEqual(len(index.image_rows(2)), 0)
+
+    def test_missing_landmarks(self):
+        with self.assertRaises(ValueError):
+            load_feature_landmarks(self.facial_features, 2, self.feature_to_int, 'nose')
+        with self.assertRaises(ValueError):
+            load_feature_landmarks(self.facial_features, 0, self.feature_to_int, 'ears')
+        with self.assertRaises(ValueError):
+            load_feature_landmarks(self.facial_features, 99, self.feature_to_int, 'nose')
+
+    def test_invalid_array(self):
+        with self.assertRaises(ValueError):
+            load_feature_landmarks(np.array([]), 0, self.feature_to_int, 'nose')
+        with self.assertRaises(ValueError):
+            LandmarkIndex(np.zeros(5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,24 @@
 import unittest
 from unittest.mock import patch
 import numpy as np
+import cv2
 import sys
 import os
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
-from augmentation.make_image import make_img
+from augmentation.make_image import make_img, make_face_img, prepare_masks
 from augmentation.eyes import multiply_eye_mask
+from augmentation.mask import TileMask
+from augmentation.blend import blend
+
+def upscaled_face_img(img, width_reduced, w, h, mask):
+    # The face image as make_face_img built it before its transform was one warp: 2x upscale, side borders, resize back
+    face = cv2.resize(img, (w*2, h*2))
+    face = cv2.copyMakeBorder(face, 0, 0, int(width_reduced*0.3), int(width_reduced*0.3), cv2.BORDER_CONSTANT)
+    face = cv2.resize(face, (w, h))
+    face = cv2.GaussianBlur(face, (0, 0), 8)
+    return blend(face, img, mask)
 
 class TestMakeImage(unittest.TestCase):
     def setUp(self):
@@ -53,5 +64,19 @@ class TestMakeImage(unittest.TestCase):
         with self.assertRaises(ValueError):
             make_img(self.img, self.mask, self.face_landmarks, self.eyebrow_landmarks, self.face_img, None)
 
+    def test_face_img_matches_upscale(self):
+        rng = np.random.default_rng(0)
+        img = cv2.GaussianBlur(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8), (0, 0), 2)
+        eyes = np.array([[210, 160], [320, 120], [430, 160], [320, 240]])
+        mask = TileMask.polygons(img.shape, [eyes]).blur(0, 10)
+        for width_reduced in (10, 25, 40):
+            expected = upscaled_face_img(img, width_reduced, 640, 480, mask.to_array(single_channel=True))
+            result = make_face_img(img, width_reduced, 640, 480, *prepare_masks(mask))
+            self.assertLessEqual(np.abs(result.astype(int) - expected).max(), 1)
+            # Only the box around the tile is warped and blurred, the result is that of the full frame mask
+            full = make_face_img(img, width_reduced, 640, 480, *prepare_masks(mask.to_array()))
+            self.assertLessEqual(np.abs(result.astype(int) - full).max(), 1)
+            np.testing.assert_array_equal(result[:, :mask.x0], img[:, :mask.x0])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
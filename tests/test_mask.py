@@ -0,0 +1,88 @@
+import unittest
+import importlib
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.mask import TileMask
+from augmentation.eyes import create_eye_mask
+blend_module = importlib.import_module('augmentation.blend')
+
+class TestTileMask(unittest.TestCase):
+    def setUp(self):
+        self.shape = (240, 320, 3)
+        # Boxes in the middle and against the frame edges, where the full frame operations reflect
+        self.boxes = [(100, 80, 180, 150), (0, 0, 40, 30), (290, 200, 320, 240)]
+
+    def full_box(self, box):
+        x0, y0, x1, y1 = box
+        mask = np.zeros(self.shape[:2], np.uint8)
+        mask[y0:y1, x0:x1] = 255
+        return mask
+
+    def test_box_materializes_as_full_mask(self):
+        mask = TileMask.box(self.shape, 100, 80, 180, 150)
+        self.assertEqual(mask.shape, self.shape)
+        self.assertEqual(mask.nbytes, 80 * 70)
+        np.testing.assert_array_equal(mask[:, :, 0], self.full_box((100, 80, 180, 150)))
+        np.testing.assert_array_equal(np.asarray(mask)[:, :, 2], self.full_box((100, 80, 180, 150)))
+
+    def test_blur_matches_full_frame(self):
+        for box in self.boxes:
+            for ksize, sigma in [(0, 21), (99, 32), (15, 99)]:
+                expected = cv2.GaussianBlur(self.full_box(box), (ksize, ksize), sigma)
+                np.testing.assert_array_equal(TileMask.box(self.shape, *box).blur(ksize, sigma).to_array(single_channel=True), expected)
+
+    def test_polygons_and_close_match_full_frame(self):
+        polygons = [np.array([[30, 100], [60, 90], [90, 100], [60, 112]]), np.array([[150, 100], [180, 88], [210, 101], [180, 115]])]
+        expected = np.zeros(self.shape[:2], np.uint8)
+        for polygon in polygons:
+            cv2.fillConvexPoly(expected, polygon, 255)
+        np.testing.assert_array_equal(TileMask.polygons(self.shape, polygons).to_array(single_channel=True), expected)
+        expected = cv2.morphologyEx(expected, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (40, 40)))
+        np.testing.assert_array_equal(create_eye_mask(polygons[0], polygons[1], np.zeros(self.shape, np.uint8))[:, :, 0], expected)
+
+    def test_off_frame_polygon_is_empty(self):
+        # Landmarks past the right or bottom edge draw nothing on the full frame
+        for polygon in [np.array([[150, 10], [160, 10], [160, 20]]), np.array([[10, 150], [20, 150], [20, 160]])]:
+            mask = TileMask.polygons((100, 100, 3), [polygon])
+            self.assertEqual(mask.nbytes, 0)
+            for result in [mask, mask.close(40), mask.blur(99, 32), mask.invert().blur(0, 5)]:
+                np.testing.assert_array_equal(result.to_array(), np.full((100, 100, 3), result.outside, np.uint8))
+        np.testing.assert_array_equal(TileMask.box(self.shape, 400, 300, 420, 320).to_array(), np.zeros(self.shape, np.uint8))
+        # Parts of the frame above, below and beside the tile, as the tiled render crops them
+        mask = TileMask.box(self.shape, 100, 80, 180, 150)
+        for part in [(0, 0, 320, 50), (0, 160, 320, 240), (200, 0, 320, 240), (150, 100, 320, 200)]:
+            cropped = mask.crop(*part)
+            self.assertLessEqual(cropped.x1, part[2] - part[0])
+            self.assertLessEqual(cropped.y1, part[3] - part[1])
+            np.testing.assert_array_equal(cropped.to_array(), mask.to_array()[part[1]:part[3], part[0]:part[2]])
+
+    def test_invert_and_crop(self):
+        mask = TileMask.box(self.shape, 100, 80, 180, 150).blur(0, 5)
+        inverse = mask.invert()
+        np.testing.assert_array_equal(inverse.to_array(), 255 - mask.to_array())
+        np.testing.assert_array_equal(inverse.crop(50, 60, 150, 200).to_array(), inverse.to_array()[60:200, 50:150])
+        np.testing.assert_array_equal(TileMask.from_arrays(*mask.to_arrays()).to_array(), mask.to_array())
+
+    def test_blend_matches_full_mask(self):
+        rng = np.random.default_rng(0)
+        foreground = rng.integers(0, 256, self.shape, dtype=np.uint8)
+        background = rng.integers(0, 256, self.shape, dtype=np.uint8)
+        for mask in [TileMask.box(self.shape, *self.boxes[0]).blur(0, 9), TileMask.box(self.shape, *self.boxes[1]).invert()]:
+            expected = blend_module.blend(foreground, background, mask.to_array(single_channel=True))
+            np.testing.assert_array_equal(blend_module.blend(foreground, background, mask), expected)
+            # In place into either image, as augment_nose does
+            for target in ('foreground', 'background'):
+                images = {'foreground': foreground.copy(), 'background': background.copy()}
+                blend_module.blend(images['foreground'], images['background'], mask, out=images[target])
+                np.testing.assert_array_equal(images[target], expected)
+            float_expected = blend_module.blend(foreground.astype(np.float32) / 255, background, mask.to_array(single_channel=True))
+            # Outside the tile the float blend copies the image instead of weighting it by 255 * (1/255)
+            np.testing.assert_allclose(blend_module.blend(foreground.astype(np.float32) / 255, background, mask), float_expected, atol=1e-3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.augment import augment_array, plan_render, landmark_rows, AugmentParams, FEATURE_TO_INT
+from augmentation.roi import face_roi
+from augmentation.warp import build_warp_maps
+from augmentation.memory import MemoryReport, PeakMemory, MIN_BAND_ROWS
+from augmentation.stages import StageCache
+from tests.test_augment_array import face_points
+
+class TestMemoryBudget(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # A face that fills most of the photo, so the photo itself is a small part of what the crop needs
+        self.img = cv2.GaussianBlur(rng.integers(40, 220, (600, 500, 3), dtype=np.uint8), (0, 0), 3)
+        self.points = face_points(250, 280, 120)
+        self.facial_features = landmark_rows(self.points)
+        self.roi = face_roi(self.img, self.facial_features, 0, FEATURE_TO_INT)
+
+    def plan(self, budget, use_face_roi=True):
+        return plan_render(self.img, self.facial_features, 0, AugmentParams(use_face_roi=use_face_roi, memory_budget=budget), self.roi)
+
+    def test_plan_modes(self):
+        unlimited = self.plan(None)
+        self.assertEqual(unlimited.mode, 'face roi')
+        full = self.plan(None, use_face_roi=False)
+        self.assertEqual(full.mode, 'full frame')
+        self.assertGreater(full.estimated_bytes, unlimited.estimated_bytes)
+        # The full frame falls back to the crop when it does not fit, the crop to bands
+        self.assertEqual(self.plan(full.estimated_bytes - 1, use_face_roi=False).mode, 'face roi')
+        tiled = self.plan(unlimited.estimated_bytes - 1)
+        self.assertEqual(tiled.mode, 'tiled')
+        self.assertLessEqual(tiled.estimated_bytes, tiled.budget)
+        smaller = self.plan(tiled.estimated_bytes - 1)
+        self.assertEqual(smaller.mode, 'tiled')
+        self.assertLess(smaller.band_rows, tiled.band_rows)
+        self.assertGreaterEqual(smaller.band_rows, MIN_BAND_ROWS)
+        with self.assertRaises(ValueError):
+            self.plan(2**20)
+
+    def test_tiled_matches_face_roi(self):
+        expected = augment_array(self.img, self.points)
+        budget = self.plan(None).estimated_bytes - 1
+        report = MemoryReport(measure_peak=True)
+        tiled = augment_array(self.img, self.points, AugmentParams(memory_budget=budget), memory_report=report)
+        self.assertEqual(report.mode, 'tiled')
+        self.assertLessEqual(np.abs(tiled.astype(int) - expected).max(), 1)
+        self.assertLessEqual(report.peak_bytes, budget)
+        self.assertIn('tiled', str(report))
+
+    def test_large_frame_stays_within_estimate(self):
+        # A 24 MP photo with a small face, where the paste into the photo is the peak: a budget equal to the
+        # estimate of each plan must hold
+        img = np.full((4200, 5600, 3), 120, np.uint8)
+        img[::7] = 60
+        points = face_points(2800, 2100, 400)
+        facial_features = landmark_rows(points)
+        roi = face_roi(img, facial_features, 0, FEATURE_TO_INT)
+        for use_warp in (True, False):
+            for use_face_roi in (True, False):
+                params = AugmentParams(use_face_roi=use_face_roi, use_warp=use_warp)
+                params.memory_budget = plan_render(img, facial_features, 0, params, roi).estimated_bytes
+                report = MemoryReport(measure_peak=True)
+                augment_array(img, points, params, memory_report=report)
+                self.assertLessEqual(report.peak_bytes, params.memory_budget)
+
+    def test_peak_over_budget_raises(self):
+        report = MemoryReport(measure_peak=True)
+        with patch('augmentation.augment.plan_render', return_value=MemoryReport('face roi', 1, budget=1)):
+            with self.assertRaises(MemoryError):
+                augment_array(self.img, self.points, AugmentParams(memory_budget=2**20), memory_report=report)
+
+    def test_report_without_budget(self):
+        report = MemoryReport(measure_peak=True)
+        result = augment_array(self.img, self.points, memory_report=report)
+        np.testing.assert_array_equal(result, augment_array(self.img, self.points))
+        self.assertEqual(report.mode, 'face roi')
+        self.assertGreater(report.peak_bytes, self.img.nbytes)
+        self.assertLessEqual(report.peak_bytes, report.estimated_bytes)
+        # Without measure_peak only the plan is reported, as under the threads of stream_augment
+        report = MemoryReport()
+        augment_array(self.img, self.points, memory_report=report)
+        self.assertEqual(report.mode, 'face roi')
+        self.assertIsNone(report.peak_bytes)
+        self.assertNotIn('peak', str(report))
+
+    def test_stage_cache_follows_budget(self):
+        budget = self.plan(None).estimated_bytes - 1
+        expected = augment_array(self.img, self.points, AugmentParams(memory_budget=budget))
+        report = MemoryReport()
+        result = augment_array(self.img, self.points, AugmentParams(memory_budget=budget), stage_cache=StageCache(), memory_report=report)
+        self.assertEqual(report.mode, 'tiled')
+        np.testing.assert_array_equal(result, expected)
+        with self.assertRaises(ValueError):
+            augment_array(self.img, self.points, AugmentParams(memory_budget=2**20), stage_cache=StageCache())
+        # A budget the full frame fits keeps the memoized stages
+        report = MemoryReport()
+        params = AugmentParams(use_face_roi=False, memory_budget=self.plan(None, use_face_roi=False).estimated_bytes)
+        result = augment_array(self.img, self.points, params, stage_cache=StageCache(), memory_report=report)
+        self.assertEqual(report.mode, 'full frame')
+        np.testing.assert_array_equal(result, augment_array(self.img, self.points, AugmentParams(use_face_roi=False)))
+
+    def test_peak_memory(self):
+        with PeakMemory() as peak:
+            block = np.ones(10**6, np.uint8)
+            del block
+        self.assertGreaterEqual(peak.peak, 10**6)
+        self.assertLess(peak.peak, 2 * 10**6)
+
+    def test_warp_maps_of_rows(self):
+        scale_factors = {'nose': 1.2, 'lips': 1.25}
+        shape = self.roi.shape
+        features = self.roi.crop_features(self.facial_features)
+        full_x, full_y = build_warp_maps(shape, features, 0, FEATURE_TO_INT, scale_factors)
+        for rows in [(0, 40), (150, 230), (shape[0] - 25, shape[0])]:
+            map_x, map_y = build_warp_maps(shape, features, 0, FEATURE_TO_INT, scale_factors, rows=rows)
+            np.testing.assert_array_equal(map_x, full_x[rows[0]:rows[1]])
+            np.testing.assert_array_equal(map_y, full_y[rows[0]:rows[1]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.multigrid import MultigridPreconditioner, conjugate_gradient, five_point_apply, coarsen
+
+def dense_operator(centre, east, south):
+    # The five point operator as a dense matrix over the flattened grid
+    h, w = centre.shape
+    matrix = np.diag(centre.ravel().astype(float))
+    for y in range(h):
+        for x in range(w):
+            if x + 1 < w:
+                matrix[y*w + x, y*w + x + 1] = matrix[y*w + x + 1, y*w + x] = -east[y, x]
+            if y + 1 < h:
+                matrix[y*w + x, (y + 1)*w + x] = matrix[(y + 1)*w + x, y*w + x] = -south[y, x]
+    return matrix
+
+class TestMultigrid(unittest.TestCase):
+    def setUp(self):
+        # The Poisson matrix of a disc: 4 on the diagonal, -1 between neighbouring pixels of the disc
+        self.mask = np.zeros((61, 75), dtype=np.uint8)
+        cv2.circle(self.mask, (37, 30), 27, 1, -1)
+        self.mask = self.mask.astype(bool)
+        self.centre = 4.0 * self.mask
+        self.b = np.random.default_rng(0).random(self.mask.shape) * self.mask
+
+    def test_coarse_operator_is_galerkin_product(self):
+        mask = self.mask[20:31, 10:23]
+        preconditioner = MultigridPreconditioner(mask, self.centre[20:31, 10:23], coarsest_unknowns=1)
+        fine = dense_operator(*preconditioner.levels[0])
+        h, w = mask.shape
+        prolongation = np.zeros((h*w, ((h + 1)//2) * ((w + 1)//2)))
+        for y in range(h):
+            for x in range(w):
+                prolongation[y*w + x, (y//2) * ((w + 1)//2) + x//2] = 1
+        coarse = dense_operator(*coarsen(*preconditioner.levels[0]))
+        np.testing.assert_allclose(coarse, prolongation.T @ fine @ prolongation)
+
+    def test_preconditioner_is_symmetric(self):
+        preconditioner = MultigridPreconditioner(self.mask, self.centre, coarsest_unknowns=100)
+        self.assertGreater(len(preconditioner.levels), 2)
+        u, v = np.random.default_rng(1).random((2,) + self.mask.shape) * self.mask
+        self.assertAlmostEqual(np.vdot(preconditioner(u), v), np.vdot(u, preconditioner(v)), places=3)
+        # Nothing leaks outside the mask
+        self.assertFalse(preconditioner(u)[~self.mask].any())
+
+    def test_conjugate_gradient_solves(self):
+        preconditioner = MultigridPreconditioner(self.mask, self.centre, coarsest_unknowns=100)
+        operator = preconditioner.levels[0]
+        apply_matrix = lambda u: five_point_apply(self.centre, *operator[1:], u)
+        x, iterations = conjugate_gradient(apply_matrix, self.b, np.zeros(self.mask.shape), preconditioner, 1e-8)
+        self.assertLessEqual(np.linalg.norm(apply_matrix(x) - self.b), 1e-8 * np.linalg.norm(self.b))
+        # The preconditioner does better than none
+        plain = conjugate_gradient(apply_matrix, self.b, np.zeros(self.mask.shape), lambda r: r.copy(), 1e-8)[1]
+        self.assertLess(iterations, plain)
+        # A converged warm start needs no iterations
+        self.assertEqual(conjugate_gradient(apply_matrix, self.b, x, preconditioner, 1e-6)[1], 0)
+
+if __name__ == '__main__':
+    unittest.main()
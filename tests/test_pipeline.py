@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import cv2
+import tempfile
+import shutil
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.pipeline import stream_augment
+from augmentation.augment import augment_image_file, landmark_rows
+from landmarking.store import LandmarkStore
+from landmarking.feature_stats import FeatureStatistics
+from tests.test_augment_array import face_points
+
+class TestStreamAugment(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.names = ['a.jpg', 'b.png', 'missing.jpg', 'd.jpg', 'e.png', 'f.jpg']
+        rng = np.random.default_rng(0)
+        rows = []
+        for image_id, name in enumerate(self.names):
+            rows.append(landmark_rows(face_points(size=90 + 5 * image_id), image_id))
+            if name != 'missing.jpg':
+                img = cv2.GaussianBlur(rng.integers(40, 220, (480, 400, 3), dtype=np.uint8), (0, 0), 3)
+                cv2.imwrite(os.path.join(self.directory, name), img)
+        self.store = LandmarkStore.from_features(np.vstack(rows), self.names)
+        self.stats = FeatureStatistics.from_store(self.store)
+        self.image_paths = [os.path.join(self.directory, name) for name in self.names]
+        self.stream_directory = os.path.join(self.directory, 'stream')
+        os.makedirs(self.stream_directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_results_in_order_and_match_augment_image_file(self):
+        results = list(stream_augment(self.image_paths, self.store, self.stats, self.stream_directory, max_queued=2))
+        self.assertEqual([result[0] for result in results], self.image_paths)
+        for img_num, (img_path, augmented_img_path, error) in enumerate(results):
+            if 'missing' in img_path:
+                self.assertIsNone(augmented_img_path)
+                self.assertIn("Could not read image", error)
+                continue
+            self.assertIsNone(error)
+            expected = cv2.imread(augment_image_file(img_path, img_num, self.store, self.stats, self.directory))
+            np.testing.assert_array_equal(cv2.imread(augmented_img_path), expected)
+
+    def test_consumer_can_stop_early(self):
+        results = stream_augment(self.image_paths, self.store, self.stats, self.stream_directory, max_queued=1)
+        img_path, augmented_img_path, error = next(results)
+        results.close()
+        self.assertIsNone(error)
+        self.assertTrue(os.path.exists(augmented_img_path))
+
+    def test_invalid_max_queued(self):
+        with self.assertRaises(ValueError):
+            list(stream_augment(self.image_paths, self.store, self.stats, self.stream_directory, max_queued=0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import io
+from contextlib import redirect_stdout
+import numpy as np
+import cv2
+import tempfile
+import shutil
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.augment import read_preview_image, scale_features, augment_preview, landmark_rows
+from landmarking.store import LandmarkStore
+from landmarking.feature_stats import FeatureStatistics
+from tests.test_augment_array import face_points
+
+class TestPreview(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_image(self, name, shape):
+        img_path = os.path.join(self.directory, name)
+        img = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8), (0, 0), 4)
+        cv2.imwrite(img_path, img)
+        return img_path, img
+
+    def test_large_image_is_reduced_to_max_side(self):
+        img_path, img = self.write_image('large.jpg', (1500, 2600, 3))
+        preview, scale = read_preview_image(img_path, max_side=512)
+        self.assertEqual(max(preview.shape[:2]), 512)
+        self.assertAlmostEqual(scale, 512 / 2600, places=3)
+        # The preview is the photo at a smaller size, not a crop of it
+        expected = cv2.resize(img, (preview.shape[1], preview.shape[0]), interpolation=cv2.INTER_AREA)
+        self.assertLess(np.abs(expected.astype(int) - preview).mean(), 4)
+
+    def test_small_image_is_kept(self):
+        img_path, img = self.write_image('small.png', (300, 200, 3))
+        preview, scale = read_preview_image(img_path, max_side=512)
+        self.assertEqual(scale, 1)
+        np.testing.assert_array_equal(preview, img)
+
+    def test_unreadable_image(self):
+        preview, scale = read_preview_image(os.path.join(self.directory, 'missing.jpg'))
+        self.assertIsNone(preview)
+
+    def test_preview_prints_nothing(self):
+        # Previews render while the user waits, so the render stays quiet
+        img_path, img = self.write_image('face.jpg', (480, 400, 3))
+        store = LandmarkStore.from_features(np.vstack([landmark_rows(face_points(), 0), landmark_rows(face_points(size=110), 1)]),
+                                            ['face.jpg', 'other.jpg'])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            preview = augment_preview(img_path, 0, store, FeatureStatistics.from_store(store))
+        self.assertEqual(preview.shape, img.shape)
+        self.assertEqual(output.getvalue(), '')
+
+    def test_scale_features_only_scales_coordinates(self):
+        facial_features = np.array([[3, 2, 5, 1001, 499], [3, 4, 6, 10, 20]])
+        scaled = scale_features(facial_features, 0.5)
+        np.testing.assert_array_equal(scaled[:, :3], facial_features[:, :3])
+        np.testing.assert_array_equal(scaled[:, 3:], [[500, 250], [5, 10]])
+
+if __name__ == '__main__':
+    unittest.main()
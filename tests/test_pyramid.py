@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from utils.pyramid import PyramidBlender, pyramid_levels, laplacian_pyramid, gaussian_pyramid, collapse, to_dtype
+from utils.img_utils import multi_res_blend
+
+def full_frame_blend(target, features, levels):
+    # Every feature blended over the last with pyramids of the whole frame
+    pyramid = laplacian_pyramid(target, levels)
+    for source, mask in features:
+        weights = gaussian_pyramid(mask.astype(np.float32) / 255, levels)
+        pyramid = [band + weight[:, :, None] * (source_band - band) for band, source_band, weight in zip(pyramid, laplacian_pyramid(source, levels), weights)]
+    return to_dtype(collapse(pyramid), target.dtype)
+
+class TestPyramid(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.target = cv2.GaussianBlur(rng.integers(0, 256, (600, 500, 3), dtype=np.uint8), (0, 0), 2)
+        self.sources = [cv2.GaussianBlur(rng.integers(0, 256, (600, 500, 3), dtype=np.uint8), (0, 0), 2) for _ in range(2)]
+        self.masks = [np.zeros((600, 500), dtype=np.uint8) for _ in range(2)]
+        cv2.ellipse(self.masks[0], (250, 300), (90, 60), 0, 0, 360, 255, -1)
+        cv2.ellipse(self.masks[1], (330, 420), (70, 40), 0, 0, 360, 255, -1)
+
+    def test_levels_adapt_to_size(self):
+        self.assertEqual(pyramid_levels((200, 300)), 4)
+        self.assertEqual(pyramid_levels((4000, 3000)), 6)
+        self.assertEqual(pyramid_levels((20, 300)), 1)
+        self.assertEqual(pyramid_levels((10, 10)), 0)
+
+    def test_collapse_inverts_pyramid(self):
+        pyramid = laplacian_pyramid(self.target, 5)
+        self.assertTrue(all(band.dtype == np.float32 for band in pyramid))
+        np.testing.assert_array_equal(to_dtype(collapse(pyramid), np.uint8), self.target)
+
+    def test_features_blend_in_one_pass(self):
+        features = list(zip(self.sources, self.masks))
+        expected = full_frame_blend(self.target, features, 5)
+        blender = PyramidBlender(self.target, levels=5)
+        for source, mask in features:
+            blender.add(source, mask)
+        np.testing.assert_array_equal(blender.reconstruct(), expected)
+        # Only the part of the target around the masks is decomposed, with the same result
+        roi_blender = PyramidBlender(self.target, (160, 240, 400, 460), levels=5)
+        for source, mask in features:
+            roi_blender.add(source, mask)
+        self.assertLess(roi_blender.pyramid[0].size, self.target.size)
+        np.testing.assert_array_equal(roi_blender.reconstruct(), expected)
+
+    def test_feature_patch_at_offset(self):
+        # A feature given as a patch and its offset, edges repeated past the patch
+        patch, patch_mask = self.sources[0][200:400, 120:380], self.masks[0][200:400, 120:380]
+        result = PyramidBlender(self.target, levels=4).add(patch, patch_mask, (200, 120)).reconstruct()
+        expected = full_frame_blend(self.target, [(self.sources[0], self.masks[0])], 4)
+        self.assertLessEqual(np.abs(result.astype(int) - expected)[self.masks[0] > 0].max(), 1)
+
+    def test_multi_res_blend(self):
+        blended = multi_res_blend(self.masks[0], self.sources[0], self.target)
+        self.assertEqual(blended.dtype, np.uint8)
+        self.assertLess(np.abs(blended.astype(int) - self.sources[0])[cv2.erode(self.masks[0], np.ones((41, 41))) > 0].mean(), 2)
+        np.testing.assert_array_equal(blended[:100], self.target[:100])
+        np.testing.assert_array_equal(multi_res_blend(np.zeros((600, 500), np.uint8), self.sources[0], self.target), self.target)
+
+if __name__ == '__main__':
+    unittest.main()
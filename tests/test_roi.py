@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.roi import FaceROI, face_roi
+from augmentation.make_image import make_img
+
+class TestFaceROI(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Smooth photo so the interpolation of the transforms is well defined
+        self.frame = cv2.GaussianBlur(rng.integers(30, 220, (400, 600, 3), dtype=np.uint8), (0, 0), 3)
+        self.feature_to_int = {'jawline': 0, 'eyebrows': 1}
+        jawline = [[0, 0, n, 250 + int(100 * np.cos(np.pi * n / 16)), 200 + int(80 * np.sin(np.pi * n / 16))] for n in range(17)]
+        eyebrows = [[0, 1, n, 170 + 16 * n, 170 - (n % 5)] for n in range(10)]
+        self.facial_features = np.array(jawline + eyebrows)
+        self.face_landmarks = self.facial_features[:17, 3:5]
+        self.eyebrow_landmarks = self.facial_features[17:, 3:5]
+
+    def test_roi_contains_face(self):
+        roi = face_roi(self.frame, self.facial_features, 0, self.feature_to_int)
+        self.assertLessEqual(roi.x0, self.facial_features[:, 3].min())
+        self.assertLessEqual(roi.y0, self.facial_features[:, 4].min())
+        self.assertGreater(roi.x1, self.facial_features[:, 3].max())
+        self.assertGreater(roi.y1, self.facial_features[:, 4].max())
+        self.assertEqual(roi.crop().shape, roi.shape)
+        cropped = roi.crop_features(self.facial_features)
+        np.testing.assert_array_equal(cropped[:, 3:5] + [roi.x0, roi.y0], self.facial_features[:, 3:5])
+
+    def test_no_roi_for_negative_reductions(self):
+        # A jawline below the photo width makes make_img's border negative, that case stays on the full photo
+        facial_features = self.facial_features.copy()
+        facial_features[:17, 4] += 700
+        self.assertIsNone(face_roi(np.zeros((1000, 600, 3), np.uint8), facial_features, 0, self.feature_to_int))
+
+    def test_make_img_on_crop_matches_full_photo(self):
+        roi = FaceROI(self.frame, 120, 90, 470, 330)
+        mask = np.zeros(self.frame.shape, np.uint8)
+        cv2.ellipse(mask, (300, 210), (90, 50), 0, 0, 360, (255, 255, 255), -1)
+        mask = cv2.GaussianBlur(mask, (0, 0), 10)
+        face_landmarks, eyebrow_landmarks = self.face_landmarks - [roi.x0, roi.y0], self.eyebrow_landmarks - [roi.x0, roi.y0]
+        face_img = cv2.GaussianBlur(self.frame, (0, 0), 5)
+        for type_mask in ['blurred_eyes_mask', 'reduced_eyes_mask']:
+            full = make_img(self.frame, mask, self.face_landmarks, self.eyebrow_landmarks, face_img, type_mask)
+            local = make_img(roi.crop(), roi.crop(mask), face_landmarks, eyebrow_landmarks, roi.crop(face_img), type_mask, roi)
+            self.assertLessEqual(np.abs(roi.crop(full).astype(int) - local).max(), 2)
+
+    def test_paste_normalized_matches_full_normalize(self):
+        frame = np.full((100, 120, 3), 40, np.uint8)
+        frame[:10] = 180
+        roi = FaceROI(frame, 30, 20, 90, 80)
+        result = np.random.default_rng(1).integers(70, 150, roi.shape, dtype=np.uint8)
+        full = frame.copy()
+        full[20:80, 30:90] = result
+        expected = cv2.normalize(full, dst=None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        np.testing.assert_array_equal(roi.paste_normalized(result), expected)
+
+if __name__ == '__main__':
+    unittest.main()
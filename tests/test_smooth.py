@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.smooth import smooth, smoothing_factor, reduced_kernel
+from augmentation.mask import TileMask
+
+class TestSmooth(unittest.TestCase):
+    def setUp(self):
+        self.shape = (400, 500)
+        # A box, a box against the frame corner and the closed polygons of an eye mask
+        self.masks = [TileMask.box(self.shape, 150, 120, 260, 190), TileMask.box(self.shape, 0, 0, 90, 60),
+                      TileMask.polygons(self.shape, [np.array([[60, 200], [120, 170], [190, 205], [120, 230]]),
+                                                     np.array([[260, 205], [330, 168], [400, 200], [330, 232]])]).close(40)]
+
+    def test_tolerance_zero_is_gaussian_blur(self):
+        mask = self.masks[0].to_array(single_channel=True)
+        self.assertEqual(smoothing_factor(0, 21, 0), 1)
+        np.testing.assert_array_equal(smooth(mask, 0, 21), cv2.GaussianBlur(mask, (0, 0), 21))
+
+    def test_factor_grows_with_tolerance(self):
+        factors = [smoothing_factor(0, 21, tolerance) for tolerance in (1, 2, 3, 4, 8)]
+        self.assertEqual(factors, sorted(factors))
+        self.assertGreater(factors[-1], 1)
+        # A kernel with few taps is not worth reducing
+        self.assertEqual(smoothing_factor(13, 99, 100), 1)
+
+    def test_reduced_kernel_sums_to_one(self):
+        kernel = cv2.getGaussianKernel(99, 32).ravel()
+        for factor in (2, 3, 4, 5):
+            small = reduced_kernel(kernel, factor)
+            self.assertEqual(len(small) % 2, 1)
+            self.assertAlmostEqual(small.sum(), 1)
+
+    def test_masks_within_tolerance(self):
+        for tolerance in (2, 3, 5):
+            for ksize, sigma in [(0, 21), (99, 32), (121, 99)]:
+                for mask in self.masks:
+                    expected = cv2.GaussianBlur(mask.to_array(single_channel=True), (ksize, ksize), sigma)
+                    result = mask.blur(ksize, sigma, tolerance).to_array(single_channel=True)
+                    self.assertLessEqual(np.abs(result.astype(int) - expected).max(), tolerance, (tolerance, ksize, sigma, mask.x0))
+
+if __name__ == '__main__':
+    unittest.main()
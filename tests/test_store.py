@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import tempfile
+import shutil
+import csv
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from landmarking.store import save_landmark_store, open_landmark_store, load_landmark_store, export_csv, LandmarkStore, LANDMARK_DTYPE
+
+class TestLandmarkStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'facial_features.lmk')
+        rng = np.random.default_rng(1)
+        rows = []
+        for image_id in [0, 2, 3]:
+            for n in range(68):
+                rows.append([image_id, np.searchsorted([17, 27, 36, 48], n, side='right'), n, rng.integers(-20, 4032), rng.integers(-20, 3024)])
+        self.features = np.array(rows, dtype=np.int64)
+        self.keys = ['a.jpg', 'no_face.jpg', 'c.jpeg', 'd.png']
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        save_landmark_store(self.path, self.features, self.keys)
+        store = open_landmark_store(self.path)
+        self.assertIsInstance(store.records, np.memmap)
+        self.assertEqual(store.records.dtype, LANDMARK_DTYPE)
+        self.assertEqual(store.image_keys, self.keys)
+        self.assertEqual(store.n_images, 4)
+        np.testing.assert_array_equal(store.to_features(), self.features)
+        np.testing.assert_array_equal(store.image_features(2), self.features[self.features[:, 0] == 2])
+        self.assertEqual(len(store.image_features(1)), 0)
+
+    def test_smaller_than_int64_array(self):
+        save_landmark_store(self.path, self.features, self.keys)
+        self.assertLess(os.path.getsize(self.path), self.features.nbytes / 4)
+
+    def test_image_id_by_key(self):
+        save_landmark_store(self.path, self.features, self.keys)
+        store = open_landmark_store(self.path)
+        self.assertEqual(store.image_id('c.jpeg'), 2)
+        with self.assertRaises(KeyError):
+            store.image_id('missing.jpg')
+
+    def test_legacy_array_without_keys(self):
+        np.save(os.path.join(self.directory, 'facial_features.npy'), self.features)
+        store = load_landmark_store(self.directory)
+        self.assertEqual(store.image_id('anything.jpg', 3), 3)
+        np.testing.assert_array_equal(store.to_features(), self.features)
+
+    def test_missing_store(self):
+        with self.assertRaises(FileNotFoundError):
+            load_landmark_store(self.directory)
+
+    def test_export_csv(self):
+        save_landmark_store(self.path, self.features, self.keys)
+        csv_path = os.path.join(self.directory, 'facial_features.csv')
+        export_csv(self.path, csv_path)
+        with open(csv_path, newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], ['Image ID', 'Feature', 'Landmark Index', 'X', 'Y'])
+        np.testing.assert_array_equal(np.array(rows[1:], dtype=np.int64), self.features)
+
+    def test_invalid_features(self):
+        with self.assertRaises(ValueError):
+            LandmarkStore.from_features(np.zeros((3, 4)))
+        with self.assertRaises(ValueError):
+            save_landmark_store(self.path, np.array([[0, 0, 0, 40000, 0]]), ['a.jpg'])
+        with self.assertRaises(ValueError):
+            save_landmark_store(self.path, self.features, ['a.jpg'])
+
+if __name__ == '__main__':
+    unittest.main()
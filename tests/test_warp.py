@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+from augmentation.warp import build_warp_maps, warp_image, blurred_box_profiles, feature_displacement, FEATURE_WARPS
+
+class TestWarp(unittest.TestCase):
+    def setUp(self):
+        self.shape = (400, 360)
+        self.feature_to_int = {'nose': 2, 'lips': 4}
+        nose = [[0, 2, n, 170 + 5 * (n % 4), 150 + 10 * n] for n in range(9)]
+        lips = [[0, 4, n, 140 + 8 * (n % 10), 270 + 3 * (n % 5)] for n in range(20)]
+        self.facial_features = np.array(nose + lips)
+        self.img = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 256, self.shape + (3,), dtype=np.uint8), (0, 0), 2)
+
+    def full_displacement(self, name, scale_factor):
+        points = self.facial_features[self.facial_features[:, 1] == self.feature_to_int[name]][:, 3:5]
+        settings = FEATURE_WARPS[name]
+        x0, y0, dx, dy = feature_displacement(self.shape, points, scale_factor, settings['region'], settings['mask'], settings['double_blend'])
+        full_dx, full_dy = np.zeros(self.shape, np.float32), np.zeros(self.shape, np.float32)
+        full_dx[y0:y0 + dx.shape[0], x0:x0 + dx.shape[1]] = dx
+        full_dy[y0:y0 + dy.shape[0], x0:x0 + dy.shape[1]] = dy
+        return full_dx, full_dy
+
+    def test_unit_scale_is_identity(self):
+        maps = build_warp_maps(self.shape, self.facial_features, 0, self.feature_to_int, {'nose': 1, 'lips': 1})
+        np.testing.assert_array_equal(warp_image(self.img, maps), self.img)
+
+    def test_profiles_match_blurred_mask(self):
+        mask = np.zeros(self.shape, np.float32)
+        mask[120:200, 100:180] = 1
+        profile_y, profile_x = blurred_box_profiles((100, 120, 180, 200), self.shape)
+        np.testing.assert_allclose(np.outer(profile_y, profile_x), cv2.GaussianBlur(mask, (127, 127), 21), atol=1e-5)
+
+    def test_nose_is_scaled_about_its_centre(self):
+        # p is read from p + w(p) * (c + (p - c) / s - p); the nose box is x 164-191, y 142-238 and
+        # the scaled region (margins halved to the landmark size) is centred on (177, 189.5)
+        map_x, map_y = build_warp_maps(self.shape, self.facial_features, 0, self.feature_to_int, {'nose': 1.25})
+        profile_y, profile_x = blurred_box_profiles((164, 142, 191, 238), self.shape)
+        for y, x in [(190, 181), (160, 170), (230, 200)]:
+            weight = 1 - (1 - profile_y[y] * profile_x[x])**2
+            self.assertAlmostEqual(map_x[y, x], x + weight * (177 + (x - 177) / 1.25 - x), places=3)
+            self.assertAlmostEqual(map_y[y, x], y + weight * (189.5 + (y - 189.5) / 1.25 - y), places=3)
+
+    def test_maps_are_composed_in_order(self):
+        maps = build_warp_maps(self.shape, self.facial_features, 0, self.feature_to_int, {'nose': 1.2, 'lips': 1.25})
+        nose_dx, nose_dy = self.full_displacement('nose', 1.2)
+        lips_dx, lips_dy = self.full_displacement('lips', 1.25)
+        grid_y, grid_x = np.indices(self.shape, dtype=np.float32)
+        inner_x, inner_y = grid_x + lips_dx, grid_y + lips_dy
+        expected_x = inner_x + cv2.remap(nose_dx, inner_x, inner_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        expected_y = inner_y + cv2.remap(nose_dy, inner_x, inner_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        np.testing.assert_allclose(maps[0], expected_x, atol=1e-2)
+        np.testing.assert_allclose(maps[1], expected_y, atol=1e-2)
+
+    def test_far_pixels_untouched(self):
+        warped = warp_image(self.img, build_warp_maps(self.shape, self.facial_features, 0, self.feature_to_int, {'nose': 1.2, 'lips': 1.25}))
+        np.testing.assert_array_equal(warped[:, :20], self.img[:, :20])
+        self.assertFalse(np.array_equal(warped[180:220, 160:200], self.img[180:220, 160:200]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 # __init.py__ for utils package
 
 from utils.file_utils import get_dir
-from utils.img_utils import rgb_to_ycbcr, ycbcr_to_rgb, equalize_grayscale, equalize_color, match_histograms, histogram_matching_luminance, alpha_blend
\ No newline at end of file
+from utils.img_utils import rgb_to_ycbcr, ycbcr_to_rgb, equalize_grayscale, equalize_color, match_histograms, match_histograms_batch, HistogramMatcher, histogram_matching_luminance, alpha_blend
+from utils.pyramid import PyramidBlender
\ No newline at end of file
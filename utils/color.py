@@ -0,0 +1,88 @@
+# color.py
+
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# YCbCr transform of img_utils: Y, Cb and Cr from the three channels, plus 128 on the chroma
+RGB_TO_YCBCR = np.array([[.299, .587, .114], [-.1687, -.3313, .5], [.5, -.4187, -.0813]])
+YCBCR_OFFSET = np.array([0, 128, 128])
+# and back, applied to Y, Cb - 128 and Cr - 128
+YCBCR_TO_RGB = np.array([[1, 0, 1.402], [1, -0.344136, -0.714136], [1, 1.772, 0]])
+# Largest difference, in levels, from the float64 conversions these replace. Both round down to uint8 like
+# them; the float32 and fixed point sums can land on the other side of a whole level than the float64 one
+TOLERANCE = 1
+# Fraction bits of the fixed point coefficients
+FIXED_POINT_BITS = 16
+# Rows the fixed point path converts at a time, so its int32 temporaries stay small
+BAND_ROWS = 256
+# cv2.transform rounds to nearest; shifting by just under half a level makes that rounding down
+FLOOR_BIAS = -0.5 + 1 / 512
+
+def affine(matrix, offset, bias=FLOOR_BIAS):
+    # (rows, 4) matrix of the transform x -> matrix x + offset for cv2.transform, by default biased to round down
+    return np.hstack([matrix, (offset + bias)[:, None]]).astype(np.float32)
+
+def convert(image, matrix, input_offset, output_offset, out, fixed_point):
+    """
+    Applies x -> matrix (x - input_offset) + output_offset to every pixel of a three channel image, rounded
+    down and saturated to uint8.
+    """
+    channels = matrix.shape[0]
+    shape = image.shape[:2] + ((channels,) if channels > 1 else ())
+    if out is None:
+        out = np.empty(shape, dtype=np.uint8)
+    elif out.shape != shape or out.dtype != np.uint8:
+        raise ValueError(f"Output buffer must be a uint8 array of shape {shape}.")
+    offset = output_offset - matrix @ input_offset
+    if image.dtype != np.uint8:
+        # Float images may hold any value, convert in float32 and saturate afterwards
+        converted = cv2.transform(image.astype(np.float32, copy=False), affine(matrix, offset, 0))
+        np.clip(converted, 0, 255, out=converted)
+        out[...] = converted.reshape(shape)
+    elif not fixed_point:
+        cv2.transform(image, affine(matrix, offset), dst=out)
+    else:
+        scale = 1 << FIXED_POINT_BITS
+        coefficients = np.rint(matrix * scale).astype(np.int32)
+        # Offsets from the rounded coefficients, so inputs the transform maps to whole levels stay whole
+        offsets = np.rint(output_offset * scale).astype(np.int32) - coefficients @ np.asarray(input_offset, dtype=np.int32)
+        result = out.reshape(image.shape[:2] + (channels,))
+        band_shape = (min(BAND_ROWS, image.shape[0]), image.shape[1])
+        total, term = np.empty(band_shape, dtype=np.int32), np.empty(band_shape, dtype=np.int32)
+        for start in range(0, image.shape[0], BAND_ROWS):
+            band = image[start:start + BAND_ROWS]
+            if np.may_share_memory(band, out):
+                # Converting in place, keep the inputs of the band until all its channels are done
+                band = band.copy()
+            rows = band.shape[0]
+            for channel in range(channels):
+                acc, tmp = total[:rows], term[:rows]
+                acc.fill(offsets[channel])
+                for source in range(3):
+                    np.multiply(band[:, :, source], coefficients[channel, source], out=tmp)
+                    acc += tmp
+                # An arithmetic shift rounds down, negative sums clip to 0
+                np.right_shift(acc, FIXED_POINT_BITS, out=acc)
+                np.clip(acc, 0, 255, out=acc)
+                result[start:start + rows, :, channel] = acc
+    return out
+
+def ycbcr_from_rgb(image, out=None, y_only=False, fixed_point=False):
+    """
+    YCbCr uint8 image of a three channel image, or only its Y channel (a single channel image) when y_only.
+    uint8 images are converted by cv2.transform in float32, or in 16 bit fixed point integer arithmetic when
+    fixed_point; other types in float32. out is an optional uint8 buffer for the result. Results are within
+    TOLERANCE levels of the float64 img_utils conversion (and, without fixed_point, the Y of y_only within
+    TOLERANCE of the Y of the full conversion: cv2.transform rounds three output channels less precisely than one).
+    """
+    matrix, offset = (RGB_TO_YCBCR[:1], YCBCR_OFFSET[:1]) if y_only else (RGB_TO_YCBCR, YCBCR_OFFSET)
+    return convert(image, matrix, np.zeros(3), offset, out, fixed_point)
+
+def rgb_from_ycbcr(image, out=None, fixed_point=False):
+    """Three channel uint8 image of a YCbCr image, the inverse of ycbcr_from_rgb, with the same options and tolerance."""
+    return convert(image, YCBCR_TO_RGB, YCBCR_OFFSET, np.zeros(3), out, fixed_point)
@@ -2,50 +2,42 @@
 
 import numpy as np
 import cv2
-from scipy.sparse import lil_matrix
+from scipy.sparse import coo_matrix
 from skimage import img_as_float
-from scipy.sparse.linalg import spsolve
+from scipy.sparse.linalg import splu
 import sys
 import os
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 sys.path.append(parent_directory)
+from utils.multigrid import MultigridPreconditioner, conjugate_gradient, five_point_apply
+from utils.pyramid import PyramidBlender
+from utils.color import ycbcr_from_rgb, rgb_from_ycbcr
 
-def rgb_to_ycbcr(image):
-    """Converts an RGB image to YCbCr color space."""
+def rgb_to_ycbcr(image, out=None, y_only=False, fixed_point=False):
+    """Converts an RGB image to YCbCr color space (see utils.color.ycbcr_from_rgb for the options)."""
     if image.size == 0:
         raise ValueError("Input image cannot be empty.")
     if image.ndim != 3 or image.shape[2] != 3:
         raise ValueError("Input must be a three-dimensional array with three channels.")
-    xform = np.array([[.299, .587, .114], [-.1687, -.3313, .5], [.5, -.4187, -.0813]])
-    ycbcr = image.dot(xform.T)
-    ycbcr[:,:,[1,2]] += 128
-    
-    return np.clip(ycbcr, 0, 255).astype(np.uint8)
+    return ycbcr_from_rgb(image, out, y_only, fixed_point)
 
-def ycbcr_to_rgb(image):
-    """Converts a YCbCr image back to RGB color space."""
+def ycbcr_to_rgb(image, out=None, fixed_point=False):
+    """Converts a YCbCr image back to RGB color space (see utils.color.rgb_from_ycbcr for the options)."""
     if not (image.ndim == 3 and image.shape[2] == 3):
         raise ValueError("Input must be a YCbCr image.")
-    
-    image = image.astype(np.float32) if image.dtype != np.float32 else image
-    Y, Cb, Cr = image[:, :, 0], image[:, :, 1] - 128, image[:, :, 2] - 128
-    R = Y + 1.402 * Cr
-    G = Y - 0.344136 * Cb - 0.714136 * Cr
-    B = Y + 1.772 * Cb
-    RGB = np.stack((R, G, B), axis=-1)
-
-    return np.clip(RGB, 0, 255).astype(np.uint8)
+    return rgb_from_ycbcr(image, out, fixed_point)
 
 def dynamic_range_compression(image, clip_limit=2.0, tile_grid_size=(8, 8)):
-    image = image.astype(np.float32) if image.dtype != np.float32 else image
     if len(image.shape) == 3 and image.shape[2] == 3:
+        # uint8 images are converted without a float copy, and the way back reuses the YCbCr buffer
         ycbcr_image = rgb_to_ycbcr(image)
         y_channel = ycbcr_image[:, :, 0]
         clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
         ycbcr_image[:, :, 0] = clahe.apply(y_channel)
-        return ycbcr_to_rgb(ycbcr_image)
+        return ycbcr_to_rgb(ycbcr_image, out=ycbcr_image)
     elif len(image.shape) == 2:
+        image = image.astype(np.float32) if image.dtype != np.float32 else image
         clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
         return clahe.apply(image)
     else:
@@ -66,7 +58,59 @@ def equalize_color(image):
     ycbcr_image = rgb_to_ycbcr(image)
     ycbcr_image[:, :, 0] = equalize_grayscale(ycbcr_image[:, :, 0])
     
-    return ycbcr_to_rgb(ycbcr_image)
+    return ycbcr_to_rgb(ycbcr_image, out=ycbcr_image)
+
+def level_cdf(channel):
+    """Normalized cumulative histogram of the 256 levels of a uint8 channel, counted with np.bincount."""
+    cdf = np.cumsum(np.bincount(channel.ravel(), minlength=256)).astype(float)
+    return cdf / cdf[-1]
+
+class HistogramMatcher:
+    """
+    Matches the histograms of source images to one template. Both sides are equalized, converted to Lab and
+    range compressed (as match_histograms always did), then every Lab channel of a source is remapped so its
+    cumulative histogram follows that of the template.
+    The template side of that work and its three CDFs are computed once, when the matcher is made; each
+    source then costs its own preprocessing, np.bincount histograms and one cv2.LUT over its three channels.
+    """
+
+    def __init__(self, template):
+        if template is None:
+            raise ValueError("Template image cannot be None.")
+        if template.size == 0:
+            raise ValueError("Template image cannot be empty.")
+        self.template_shape = template.shape
+        template_lab = self.preprocess(template)
+        self.template_cdfs = [level_cdf(template_lab[:, :, i]) for i in range(3)]
+
+    @staticmethod
+    def preprocess(image):
+        # Equalized, Lab converted and range compressed image the histograms are matched on
+        if image.ndim == 3:
+            processed = equalize_color(image)
+        else:
+            processed = cv2.cvtColor(equalize_grayscale(image), cv2.COLOR_GRAY2BGR)
+        return dynamic_range_compression(cv2.cvtColor(processed, cv2.COLOR_BGR2Lab))
+
+    def lut(self, source_lab):
+        """(256, 1, 3) table mapping every level of each Lab channel of source_lab to the template level at the same CDF, truncated."""
+        levels = np.arange(256)
+        mappings = [np.interp(level_cdf(source_lab[:, :, i]), template_cdf, levels) for i, template_cdf in enumerate(self.template_cdfs)]
+        return np.clip(np.stack(mappings, axis=-1), 0, 255).astype(np.uint8).reshape(256, 1, 3)
+
+    def match(self, source):
+        """source with its histograms matched to the template, in its own colour space (BGR or grayscale)."""
+        if source is None:
+            raise ValueError("Source image cannot be None.")
+        if source.size == 0:
+            raise ValueError("Source image cannot be empty.")
+        source_lab = self.preprocess(source)
+        matched_bgr = cv2.cvtColor(cv2.LUT(source_lab, self.lut(source_lab)), cv2.COLOR_Lab2BGR)
+        return matched_bgr if source.ndim == 3 else cv2.cvtColor(matched_bgr, cv2.COLOR_BGR2GRAY)
+
+    def match_batch(self, sources):
+        """Matches every image of sources to the template, returning the list of results."""
+        return [self.match(source) for source in sources]
 
 def match_histograms(source, template):
     """Adjusts the pixel values of a source image to match the histogram of a template image."""
@@ -76,39 +120,26 @@ def match_histograms(source, template):
         raise ValueError("Source and template images cannot be empty.")
     if source.shape[:2] != template.shape[:2]:
         raise ValueError("Source and template images must have the same dimensions.")
+    # To match many images to one template make one HistogramMatcher and reuse it
+    return HistogramMatcher(template).match(source)
 
-    source_processed = equalize_color(source) if source.ndim == 3 else equalize_grayscale(source)
-    template_processed = equalize_color(template) if template.ndim == 3 else equalize_grayscale(template)
-    source_lab = cv2.cvtColor(source_processed, cv2.COLOR_BGR2Lab)
-    template_lab = cv2.cvtColor(template_processed, cv2.COLOR_BGR2Lab)
-    source_lab = dynamic_range_compression(source_lab)
-    template_lab = dynamic_range_compression(template_lab)
-
-    for i in range(3):
-        source_hist = np.histogram(source_lab[:, :, i], bins=256)[0]
-        template_hist = np.histogram(template_lab[:, :, i], bins=256)[0]
-        source_cdf = np.cumsum(source_hist).astype(float)
-        template_cdf = np.cumsum(template_hist).astype(float)
-        source_cdf_normalized = source_cdf / source_cdf[-1]
-        template_cdf_normalized = template_cdf / template_cdf[-1]
-        mapping = np.interp(source_cdf_normalized, template_cdf_normalized, np.arange(256))
-        source_lab[:, :, i] = np.interp(source_lab[:, :, i].flatten(), np.arange(256), mapping).reshape(source_lab[:, :, i].shape)
-
-    matched_bgr = cv2.cvtColor(source_lab, cv2.COLOR_Lab2BGR)
-    return matched_bgr if source.ndim == 3 else cv2.cvtColor(matched_bgr, cv2.COLOR_BGR2GRAY)
+def match_histograms_batch(sources, template):
+    """Matches every image of sources to one template, whose histograms are only computed once."""
+    return HistogramMatcher(template).match_batch(sources)
 
 def histogram_matching_luminance(source, template):
     """
     Match the histogram of the source image to that of the template image using only the luminance channel.
     """
     source_ycbcr = rgb_to_ycbcr(source)
-    template_ycbcr = rgb_to_ycbcr(template)
+    # Only the luminance of the template is used
+    template_y = rgb_to_ycbcr(template, y_only=True)
 
     # Apply histogram equalization to the Y channel of the source image
     source_y_equalized = cv2.equalizeHist(source_ycbcr[:, :, 0])
     
     # Apply histogram equalization to the Y channel of the template image
-    template_y_equalized = cv2.equalizeHist(template_ycbcr[:, :, 0])
+    template_y_equalized = cv2.equalizeHist(template_y)
     
     # Perform histogram matching
     matched_y = cv2.matchTemplate(source_y_equalized, template_y_equalized, method=cv2.TM_CCOEFF_NORMED)
@@ -158,97 +189,117 @@ def alpha_blend(img1, img2, mask):
     return blended_clipped.astype(np.uint8)
 
 
-def multi_res_blend(mask, source, target):
-    # Generate Gaussian pyramid for source
-    gp_source = [source]
-    for i in range(6):
-        source = cv2.pyrDown(source)
-        gp_source.append(source)
-
-    # Generate Gaussian pyramid for target
-    gp_target = [target]
-    for i in range(6):
-        target = cv2.pyrDown(target)
-        gp_target.append(target)
-
-    # Generate Gaussian pyramid for mask
-    gp_mask = [mask]
-    for src, tgt in zip(gp_source, gp_target):
-        # mask = cv2.resize(mask, (src.shape[1], src.shape[0]))
-        mask = cv2.pyrDown(mask)
-        gp_mask.append(mask)
-
-    # Generate Laplacian Pyramid for source
-    lp_source = [gp_source[5]]
-    for i in range(5, 0, -1):
-        size = (gp_source[i - 1].shape[1], gp_source[i - 1].shape[0])
-        ge = cv2.pyrUp(gp_source[i], dstsize=size)
-        ge = cv2.resize(ge, size)
-        lp = cv2.subtract(gp_source[i - 1], ge)
-        lp = cv2.resize(lp, size)
-        lp_source.append(lp)
-
-    # Generate Laplacian Pyramid for target
-    lp_target = [gp_target[5]]
-    for i in range(5, 0, -1):
-        size = (gp_target[i - 1].shape[1], gp_target[i - 1].shape[0])
-        ge = cv2.pyrUp(gp_target[i], dstsize=size)
-        ge = cv2.resize(ge, size)
-        lp = cv2.subtract(gp_target[i - 1], ge)
-        lp = cv2.resize(lp, size)
-        lp_target.append(lp)
-
-    # Add left and right halves of images in each level
-    LS = [] 
-    for lsrc, ltar, gmask in zip(lp_source, lp_target, gp_mask):
-        print(lsrc.shape)
-        print(gmask.shape)
-        print(ltar.shape)
-        ls = lsrc * gmask + ltar * (1.0 - gmask)
-        LS.append(ls)
-
-    # now reconstruct
-    ls_ = LS[0]
-    for i in range(1, 6):
-        size = (LS[i].shape[1], LS[i].shape[0])
-        ls_ = cv2.pyrUp(ls_, dstsize=size)
-        ls_ = cv2.add(ls_, LS[i])
-
-    return ls_
-
-def poisson_blend(mask, source, target, offset):
+def multi_res_blend(mask, source, target, levels=None):
+    """
+    Laplacian pyramid blend of source into target under mask (uint8 0-255 or float 0-1), all of the same size.
+    Only the part of target around the mask is decomposed (see utils.pyramid.PyramidBlender); to blend several
+    features into one image, add them to one PyramidBlender so the target is decomposed and rebuilt once.
+    """
+    weights = mask.max(axis=2) if mask.ndim == 3 else mask
+    rows, columns = np.nonzero(weights)
+    if len(rows) == 0:
+        return target.copy()
+    roi = (columns.min(), rows.min(), columns.max() + 1, rows.max() + 1)
+    return PyramidBlender(target, roi, levels).add(source, mask).reconstruct()
+
+# Backends of poisson_blend
+POISSON_SOLVERS = ('direct', 'multigrid')
+# Neighbours of a pixel in the Poisson equation: left, right, up, down
+POISSON_NEIGHBOURS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+def poisson_system(mask, region_target, target_shape):
+    """
+    Sparse matrix of the Poisson equation of poisson_blend for the unknown pixels of mask (a boolean array over
+    the blended region, whose corner is at region_target in a target of target_shape), with the gathers needed
+    for its right hand side. Each unknown p gets |N(p)| f_p - sum of f_q over its unknown neighbours q; the
+    neighbours outside the target are left out, those outside the mask are fixed to the target.
+    Returns (A in CSC form, (ys, xs) of the unknowns, [(dy, dx, in_region, known) per neighbour]).
+    """
+    ys, xs = np.nonzero(mask)
+    size = len(ys)
+    index = np.full(mask.shape, -1, dtype=np.int64)
+    index[ys, xs] = np.arange(size)
+    diagonal = np.zeros(size)
+    rows, cols = [], []
+    neighbours = []
+    for dy, dx in POISSON_NEIGHBOURS:
+        ny, nx = ys + dy, xs + dx
+        in_target = ((ny + region_target[0] >= 0) & (ny + region_target[0] < target_shape[0]) &
+                     (nx + region_target[1] >= 0) & (nx + region_target[1] < target_shape[1]))
+        in_region = (ny >= 0) & (ny < mask.shape[0]) & (nx >= 0) & (nx < mask.shape[1])
+        neighbour = np.where(in_region, index[np.clip(ny, 0, mask.shape[0] - 1), np.clip(nx, 0, mask.shape[1] - 1)], -1)
+        unknown = neighbour >= 0
+        diagonal += in_target
+        rows.append(np.flatnonzero(unknown))
+        cols.append(neighbour[unknown])
+        neighbours.append((dy, dx, in_region, in_target & ~unknown))
+    rows = np.concatenate([np.arange(size)] + rows)
+    cols = np.concatenate([np.arange(size)] + cols)
+    data = np.concatenate([diagonal, -np.ones(len(rows) - size)])
+    A = coo_matrix((data, (rows, cols)), shape=(size, size)).tocsc()
+    return A, (ys, xs), neighbours
+
+def poisson_rhs(source, target, region_target, unknowns, neighbours):
+    """Right hand side of poisson_system for every channel at once: the guidance gradients of source and the fixed target neighbours."""
+    ys, xs = unknowns
+    b = np.zeros((len(ys), source.shape[2]))
+    for dy, dx, in_region, known in neighbours:
+        # Gradient s_p - s_q to the neighbours the source covers
+        inside = np.flatnonzero(in_region)
+        b[inside] += source[ys[inside], xs[inside]] - source[ys[inside] + dy, xs[inside] + dx]
+        # Boundary value of the neighbours outside the mask
+        fixed = np.flatnonzero(known)
+        b[fixed] += target[ys[fixed] + dy + region_target[0], xs[fixed] + dx + region_target[1]]
+    return b
+
+def solve_multigrid(A, unknowns, b, initial, tolerance, max_iterations):
+    """
+    Solves the system of poisson_system for every column of b with conjugate gradient preconditioned by multigrid
+    (utils.multigrid), on the grid of the bounding box of the unknowns and warm started from initial.
+    """
+    ys, xs = unknowns
+    y0, x0 = ys.min(), xs.min()
+    grid_ys, grid_xs = ys - y0, xs - x0
+    shape = (grid_ys.max() + 1, grid_xs.max() + 1)
+    mask = np.zeros(shape, dtype=bool)
+    mask[grid_ys, grid_xs] = True
+    centre = np.zeros(shape)
+    centre[grid_ys, grid_xs] = A.diagonal()
+    preconditioner = MultigridPreconditioner(mask, centre)
+    east, south = preconditioner.levels[0][1:]
+    x = np.empty_like(b)
+    for channel in range(b.shape[1]):
+        grid_b, grid_x = np.zeros(shape), np.zeros(shape)
+        grid_b[grid_ys, grid_xs] = b[:, channel]
+        grid_x[grid_ys, grid_xs] = initial[:, channel]
+        grid_x, _ = conjugate_gradient(lambda u: five_point_apply(centre, east, south, u), grid_b, grid_x, preconditioner,
+                                       tolerance, max_iterations)
+        x[:, channel] = grid_x[grid_ys, grid_xs]
+    return x
+
+def poisson_blend(mask, source, target, offset, solver='direct', initial=None, tolerance=1e-6, max_iterations=200):
+    """
+    Seamless cloning: pastes the pixels of source under mask into target at offset (rows, columns) of source in
+    target, solving the Poisson equation so the result keeps the gradients of source inside the mask and meets
+    target on its boundary. Returns the float target in [0, 1], written in place when target is already float.
+    The sparse system is assembled with array operations and solved for all channels with one of POISSON_SOLVERS:
+    'direct' factorizes it once (exact, but the factor grows quickly with the region) and 'multigrid' iterates
+    on the bounding box of the mask until the residual is within tolerance of the right hand side or for
+    max_iterations. The iterations start from initial, an image the size of target such as an alpha blend of
+    source into it, and from source when it is None.
+    Every connected part of the mask must touch a target pixel outside it, else the system is singular.
+    """
+    if solver not in POISSON_SOLVERS:
+        raise ValueError(f"Unknown Poisson solver {solver}, expected one of {', '.join(POISSON_SOLVERS)}.")
     # Ensure images are float type
     mask = img_as_float(mask)
     source = img_as_float(source)
     target = img_as_float(target)
-
-    # Define build_matrix function
-    def build_matrix(indices):
-        kernel = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]])
-        size = len(indices)
-        A = lil_matrix((size, size))
-        for i in range(size):
-            A[i, i] = 4
-            if i % mask.shape[1] > 0: A[i, i - 1] = -1  # left
-            if (i + 1) % mask.shape[1] > 0 and i + 1 < size: A[i, i + 1] = -1  # right
-            if i // mask.shape[1] > 0: A[i, i - mask.shape[1]] = -1  # up
-            if i // mask.shape[1] < mask.shape[0] - 1 and i + mask.shape[1] < size: A[i, i + mask.shape[1]] = -1  # down
-        return A
-
-    # Define build_b function
-    def build_b(source, target, mask, indices):
-        size = len(indices)
-        b = np.zeros(size)
-        num_layers = source.shape[2] if source.ndim > 2 else 1
-        for color in range(num_layers):
-            for i, index in enumerate(indices):
-                y, x = np.unravel_index(index[0], mask.shape[:2])
-                b[i] = 4 * source[y, x, color] if source.ndim > 2 else 4 * source[y, x]
-                if x > 0: b[i] -= source[y[0], x[0] - 1, color[0]] + target[y[0], x[0] - 1, color[0]] * (1 - mask[y[0], x[0] - 1]) if source.ndim > 2 else source[y[0], x[0] - 1] + target[y[0], x[0] - 1] * (1 - mask[y[0], x[0] - 1])
-                if x < mask.shape[1] - 1: b[i] -= source[y, x + 1, color] + target[y, x + 1, color] * (1 - mask[y, x + 1]) if source.ndim > 2 else source[y, x + 1] + target[y, x + 1] * (1 - mask[y, x + 1])
-                if y > 0: b[i] -= source[y - 1, x, color] + target[y - 1, x, color] * (1 - mask[y - 1, x]) if source.ndim > 2 else source[y - 1, x] + target[y - 1, x] * (1 - mask[y - 1, x])
-                if y < mask.shape[0] - 1: b[i] -= source[y + 1, x, color] + target[y + 1, x, color] * (1 - mask[y + 1, x]) if source.ndim > 2 else source[y + 1, x] + target[y + 1, x] * (1 - mask[y + 1, x])
-        return b
+    if mask.ndim == 3:
+        mask = mask.max(axis=2)
+    grayscale = source.ndim == 2
+    if grayscale:
+        source, target = source[:, :, None], target[:, :, None]
 
     # Compute regions to be blended
     region_source = (
@@ -262,31 +313,28 @@ def poisson_blend(mask, source, target, offset):
             min(target.shape[0], source.shape[0]+offset[0]),
             min(target.shape[1], source.shape[1]+offset[1]))
 
-    # Clip and normalize mask image
-    mask = mask[region_source[0]:region_source[2], region_source[1]:region_source[3]]
-    mask[mask!=0] = 1
-
-    # Create coefficient matrix
-    indices = np.argwhere(mask)
-    A = build_matrix(indices)
-
-    # for each layer (ex. RGB)
-    for num_layer in range(source.shape[2]):
-        # get subimages
-        t = target[region_target[0]:region_target[2], region_target[1]:region_target[3], num_layer]
-        s = source[region_source[0]:region_source[2], region_source[1]:region_source[3], num_layer]
+    # Clip and binarize the mask
+    mask = mask[region_source[0]:region_source[2], region_source[1]:region_source[3]] != 0
+    if not mask.any():
+        return target[:, :, 0] if grayscale else target
+    s = source[region_source[0]:region_source[2], region_source[1]:region_source[3]]
 
-        # create b
-        b = build_b(s, t, mask, indices)
-
-        # solve Ax = b
-        x = spsolve(A, b)
-
-        # assign x to target image
-        x = np.clip(x, 0, 1)
-        x = np.reshape(x, (len(indices), 1))
-        indices_x = np.concatenate((indices, x), axis=1)
-        for index in indices_x:
-            target[int(index[0] + offset[0]), int(index[1] + offset[1]), num_layer] = index[2]
-
-    return target
\ No newline at end of file
+    A, (ys, xs), neighbours = poisson_system(mask, region_target, target.shape)
+    b = poisson_rhs(s, target, region_target, (ys, xs), neighbours)
+    try:
+        if solver == 'direct':
+            # Factorize the coefficient matrix once and solve every channel with it
+            x = splu(A).solve(b)
+        else:
+            if initial is None:
+                start = s[ys, xs]
+            else:
+                initial = img_as_float(initial)
+                start = (initial[:, :, None] if initial.ndim == 2 else initial)[ys + region_target[0], xs + region_target[1]]
+            x = solve_multigrid(A, (ys, xs), b, start, tolerance, max_iterations)
+    except RuntimeError as e:
+        raise ValueError("Every part of the mask must touch the target outside it.") from e
+
+    # Write the solution back to the target image
+    target[ys + region_target[0], xs + region_target[1]] = np.clip(x, 0, 1)
+    return target[:, :, 0] if grayscale else target
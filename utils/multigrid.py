@@ -0,0 +1,136 @@
+# multigrid.py
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import splu
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Weight of the Jacobi sweeps, below 1 so they damp the high frequencies of every level
+JACOBI_WEIGHT = 2 / 3
+# Unknowns at or below which the coarsest level is factored instead of coarsened further
+COARSEST_UNKNOWNS = 1024
+
+def five_point_apply(centre, east, south, u):
+    """Applies the symmetric five point operator centre u_p - sum of the couplings times the neighbours of p to a grid."""
+    result = centre * u
+    result[:, :-1] -= east[:, :-1] * u[:, 1:]
+    result[:, 1:] -= east[:, :-1] * u[:, :-1]
+    result[:-1] -= south[:-1] * u[1:]
+    result[1:] -= south[:-1] * u[:-1]
+    return result
+
+def block_sum(grid):
+    """Sums the 2x2 blocks of a grid, padded with zeros to even sides: the restriction of piecewise constant prolongation."""
+    h, w = grid.shape[:2]
+    grid = np.pad(grid, ((0, h % 2), (0, w % 2)) + ((0, 0),) * (grid.ndim - 2))
+    return grid[0::2, 0::2] + grid[1::2, 0::2] + grid[0::2, 1::2] + grid[1::2, 1::2]
+
+def coarsen(centre, east, south):
+    """
+    Galerkin coarse operator P^T A P of a five point operator, with P the piecewise constant prolongation from
+    2x2 cells. It is again five point: a cell keeps the couplings that leave it, its neighbours the sum of the
+    couplings between the two cells.
+    """
+    h, w = centre.shape
+    pad = ((0, h % 2), (0, w % 2))
+    centre, east, south = np.pad(centre, pad), np.pad(east, pad), np.pad(south, pad)
+    inner = east[0::2, 0::2] + east[1::2, 0::2] + south[0::2, 0::2] + south[0::2, 1::2]
+    coarse_centre = block_sum(centre) - 2 * inner
+    return coarse_centre, east[0::2, 1::2] + east[1::2, 1::2], south[1::2, 0::2] + south[1::2, 1::2]
+
+class MultigridPreconditioner:
+    """
+    One symmetric V-cycle of aggregation multigrid on the grid of a mask's bounding box, the preconditioner of
+    conjugate_gradient for the Poisson matrix of img_utils.poisson_system.
+    The finest level is that matrix as a five point operator: centre the diagonal over the mask (0 elsewhere),
+    east and south 1 between neighbouring mask pixels. Each coarser level merges 2x2 cells (see coarsen), so
+    every level stays symmetric positive definite and the cycle is a valid preconditioner. Weighted Jacobi
+    smooths before and after the coarse correction and the coarsest level is factored with splu.
+    The cycle runs in float32, which halves the memory traffic of the sweeps; conjugate_gradient itself stays
+    in the precision of its system, so only the quality of the preconditioner, not the solution, is affected.
+    """
+
+    def __init__(self, mask, centre, smoothing=2, coarsest_unknowns=COARSEST_UNKNOWNS):
+        self.smoothing = smoothing
+        centre = centre.astype(np.float32)
+        east = np.zeros(mask.shape, dtype=np.float32)
+        east[:, :-1] = mask[:, :-1] & mask[:, 1:]
+        south = np.zeros(mask.shape, dtype=np.float32)
+        south[:-1] = mask[:-1] & mask[1:]
+        self.levels = [(centre, east, south)]
+        while np.count_nonzero(centre) > coarsest_unknowns and min(centre.shape) > 2:
+            centre, east, south = coarsen(centre, east, south)
+            self.levels.append((centre, east, south))
+        # Inverse diagonals for the smoothing, 0 outside the cells of every level
+        self.inverse = [np.divide(1, level[0], out=np.zeros_like(level[0]), where=level[0] > 0) for level in self.levels]
+        self.coarsest = self.factor(*self.levels[-1])
+
+    @staticmethod
+    def factor(centre, east, south):
+        # Sparse factor of the coarsest operator over its cells, returned with the cell positions
+        cells = np.flatnonzero(centre > 0)
+        index = np.full(centre.size, -1)
+        index[cells] = np.arange(len(cells))
+        w = centre.shape[1]
+        rows, cols, data = [np.arange(len(cells))], [np.arange(len(cells))], [centre.ravel()[cells]]
+        for weights, step in [(east.ravel(), 1), (south.ravel(), w)]:
+            linked = cells[(weights[cells] > 0) & (cells + step < centre.size)]
+            linked = linked[index[linked + step] >= 0]
+            for a, b in [(linked, linked + step), (linked + step, linked)]:
+                rows.append(index[a])
+                cols.append(index[b])
+                data.append(-weights[linked])
+        matrix = coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(len(cells),) * 2)
+        return splu(matrix.tocsc()), cells
+
+    def cycle(self, level, b):
+        if level == len(self.levels) - 1:
+            factor, cells = self.coarsest
+            u = np.zeros(b.size, dtype=np.float32)
+            u[cells] = factor.solve(b.ravel()[cells])
+            return u.reshape(b.shape)
+        operator, inverse = self.levels[level], self.inverse[level]
+        # Pre-smoothing from zero, the first sweep is just the scaled right hand side
+        u = JACOBI_WEIGHT * inverse * b
+        for _ in range(self.smoothing - 1):
+            u += JACOBI_WEIGHT * inverse * (b - five_point_apply(*operator, u))
+        # Coarse correction, prolonged by repeating every coarse value over the pixels of its 2x2 cell on this level
+        correction = self.cycle(level + 1, block_sum(b - five_point_apply(*operator, u)))
+        u += np.repeat(np.repeat(correction, 2, axis=0), 2, axis=1)[:b.shape[0], :b.shape[1]] * (operator[0] > 0)
+        # Post-smoothing with the same sweeps keeps the cycle symmetric
+        for _ in range(self.smoothing):
+            u += JACOBI_WEIGHT * inverse * (b - five_point_apply(*operator, u))
+        return u
+
+    def __call__(self, b):
+        return self.cycle(0, b.astype(np.float32)).astype(b.dtype)
+
+def conjugate_gradient(apply_matrix, b, x, preconditioner, tolerance=1e-6, max_iterations=200):
+    """
+    Preconditioned conjugate gradient for a symmetric positive definite system, started from x (the warm start).
+    Stops once the residual is within tolerance of the norm of b or after max_iterations.
+    Returns the solution and the number of iterations run.
+    """
+    r = b - apply_matrix(x)
+    limit = tolerance * np.linalg.norm(b)
+    iteration = 0
+    if np.linalg.norm(r) <= limit or max_iterations == 0:
+        return x, iteration
+    z = preconditioner(r)
+    p = z.copy()
+    rz = np.vdot(r, z)
+    for iteration in range(1, max_iterations + 1):
+        q = apply_matrix(p)
+        alpha = rz / np.vdot(p, q)
+        x = x + alpha * p
+        r -= alpha * q
+        if np.linalg.norm(r) <= limit:
+            break
+        z = preconditioner(r)
+        rz, previous = np.vdot(r, z), rz
+        p = z + (rz / previous) * p
+    return x, iteration
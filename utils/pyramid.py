@@ -0,0 +1,128 @@
+# pyramid.py
+
+import numpy as np
+import cv2
+import sys
+import os
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+
+# Most levels a pyramid gets, and the smallest side its coarsest level may have
+MAX_LEVELS = 6
+MIN_LEVEL_SIDE = 8
+# Pixels of the coarsest level kept around a feature, past them its mask pyramid is negligible
+FEATURE_MARGIN_LEVEL_PIXELS = 3
+
+def pyramid_levels(shape, max_levels=MAX_LEVELS, min_side=MIN_LEVEL_SIDE):
+    """Number of times an image of shape can be halved, at most max_levels, before its smaller side falls under min_side."""
+    side = min(shape[:2])
+    levels = 0
+    while levels < max_levels and side // 2 >= min_side:
+        side = (side + 1) // 2
+        levels += 1
+    return levels
+
+def gaussian_pyramid(img, levels):
+    """img as float32 followed by levels pyrDown halvings of it."""
+    pyramid = [img.astype(np.float32)]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+def laplacian_pyramid(img, levels):
+    """Float32 Laplacian pyramid of img, finest band first; the last entry is the coarsest Gaussian level."""
+    gaussian = gaussian_pyramid(img, levels)
+    pyramid = []
+    for fine, coarse in zip(gaussian, gaussian[1:]):
+        pyramid.append(fine - cv2.pyrUp(coarse, dstsize=(fine.shape[1], fine.shape[0])))
+    pyramid.append(gaussian[-1])
+    return pyramid
+
+def collapse(pyramid):
+    """Reconstructs the float32 image of a Laplacian pyramid (the inverse of laplacian_pyramid, up to rounding)."""
+    img = pyramid[-1]
+    for band in reversed(pyramid[:-1]):
+        img = cv2.pyrUp(img, dstsize=(band.shape[1], band.shape[0]))
+        img += band
+    return img
+
+def to_dtype(img, dtype):
+    # Float32 pyramid result in the type of the image it replaces, rounded and clipped for uint8
+    if dtype == np.uint8:
+        return np.clip(np.rint(img), 0, 255).astype(np.uint8)
+    return img.astype(dtype, copy=False)
+
+class PyramidBlender:
+    """
+    Multi-resolution (Laplacian pyramid) blending of any number of features into one target image.
+    The Laplacian pyramid of the target, or of the box roi (x0, y0, x1, y1) grown by the feature margin when
+    features are only blended into that part, is built once in float32; add() blends the pyramid of each
+    feature into it band by band, and reconstruct() collapses it once and returns the blended target.
+    Every feature only touches the bounding box of its mask grown by the reach of its coarsest mask level
+    (FEATURE_MARGIN_LEVEL_PIXELS), and boxes are aligned to the coarsest level so their bands line up with
+    those of the target. The level count adapts to the size of the roi (pyramid_levels) unless given.
+    """
+
+    def __init__(self, target, roi=None, levels=None):
+        height, width = target.shape[:2]
+        x0, y0, x1, y1 = roi if roi is not None else (0, 0, width, height)
+        self.levels = levels if levels is not None else pyramid_levels((y1 - y0, x1 - x0))
+        self.target = target
+        self.margin = FEATURE_MARGIN_LEVEL_PIXELS * 2**self.levels
+        self.box = self.aligned((x0 - self.margin, y0 - self.margin, x1 + self.margin, y1 + self.margin))
+        x0, y0, x1, y1 = self.box
+        self.pyramid = laplacian_pyramid(target[y0:y1, x0:x1], self.levels)
+
+    def aligned(self, box):
+        # Box grown to multiples of the coarsest level, clipped to the target
+        step = 2**self.levels
+        x0, y0, x1, y1 = box
+        height, width = self.target.shape[:2]
+        return (max(x0 // step * step, 0), max(y0 // step * step, 0),
+                min(-(-x1 // step) * step, width), min(-(-y1 // step) * step, height))
+
+    def add(self, source, mask, offset=(0, 0)):
+        """
+        Blends source into the target where mask is set: mask (uint8 0-255 or float 0-1, one channel or as many
+        as source) weights source over what has been blended so far at every level. source and mask sit at
+        offset (rows, columns) in the target; around them the margin of the feature repeats their edges.
+        """
+        mask = mask.astype(np.float32) / (255 if mask.dtype == np.uint8 else 1)
+        if mask.ndim == 3:
+            mask = mask.max(axis=2)
+        rows, columns = np.nonzero(mask)
+        if len(rows) == 0:
+            return self
+        margin = self.margin
+        top, left = offset
+        box = (left + columns.min() - margin, top + rows.min() - margin, left + columns.max() + 1 + margin, top + rows.max() + 1 + margin)
+        x0, y0, x1, y1 = self.aligned(box)
+        # Clip the feature to the box blended into
+        bx0, by0, bx1, by1 = self.box
+        x0, y0, x1, y1 = max(x0, bx0), max(y0, by0), min(x1, bx1), min(y1, by1)
+        if x0 >= x1 or y0 >= y1:
+            return self
+        # The part of the feature in the box, its edges repeated where the box reaches past it
+        pad = [(max(top - y0, 0), max(y1 - top - source.shape[0], 0)), (max(left - x0, 0), max(x1 - left - source.shape[1], 0))]
+        rows = slice(max(y0 - top, 0), max(min(y1 - top, source.shape[0]), 0))
+        columns = slice(max(x0 - left, 0), max(min(x1 - left, source.shape[1]), 0))
+        part = np.pad(source[rows, columns].astype(np.float32), pad + [(0, 0)] * (source.ndim - 2), mode='edge')
+        weights = np.pad(mask[rows, columns], pad)
+        bands = laplacian_pyramid(part, self.levels)
+        weights = gaussian_pyramid(weights, self.levels)
+        for level, (target_band, band, weight) in enumerate(zip(self.pyramid, bands, weights)):
+            # The feature box at this level, in the coordinates of the target box
+            ty0, tx0 = (y0 - by0) >> level, (x0 - bx0) >> level
+            region = target_band[ty0:ty0 + band.shape[0], tx0:tx0 + band.shape[1]]
+            if band.ndim == 3:
+                weight = weight[:, :, None]
+            region += weight * (band - region)
+        return self
+
+    def reconstruct(self):
+        """The target with every added feature blended in, in the type of the target."""
+        x0, y0, x1, y1 = self.box
+        result = self.target.copy()
+        result[y0:y1, x0:x1] = to_dtype(collapse(self.pyramid), self.target.dtype)
+        return result